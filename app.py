@@ -1,11 +1,12 @@
 import tkinter as tk
 from tkinter import messagebox, ttk
 import json
-import os
 import time
 import hashlib
 from src.payments_worker import PaymentsWorkers
 from src.account import Account
+from src.transaction import Transaction
+from service import load_config
 
 def hash_password(password: str) -> str:
     """
@@ -25,23 +26,10 @@ class App:
         self.user_account_id = None
         self.is_admin = False
 
-        with open("config.json", "r") as f:
-            self.config = json.load(f)
-        os.makedirs(self.config["data_folder"], exist_ok=True)
-        os.makedirs(os.path.dirname(self.config["transactions_log_file"]), exist_ok=True)
-        os.makedirs(os.path.dirname(self.config["error_log_file"]), exist_ok=True)
+        self.config = load_config()
 
         self.load_users()
         self.p = PaymentsWorkers(self.config, self.user_credentials)
-        with self.p.accounts_lock:
-            for username, data in self.user_credentials.items():
-                acc_id = data["id"]
-                balance = data.get("balance", 0)
-                verified = data.get("verified", False)
-                self.p.accounts[acc_id] = Account(owner=username, balance=balance, verified=verified)
-
-        self.p.load_transactions()
-        self.p.tx_counter = len(self.p.transactions_log)
         self.p.start()
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self.show_login()
@@ -59,8 +47,7 @@ class App:
 
     def save_users(self):
         try:
-            with open(self.config["users_file"], "w") as f:
-                json.dump(self.user_credentials, f, indent=4)
+            self.p.checkpoint()
         except Exception as e:
             self.log_error(f"Cannot save users.json: {e}")
 
@@ -190,13 +177,23 @@ class App:
         frame_log = tk.LabelFrame(self.root, text="Transaction Log", padx=10, pady=10)
         frame_log.pack(fill="both", padx=10, pady=10, expand=True)
 
+        frame_pages = tk.Frame(frame_log)
+        frame_pages.pack(fill="x")
+        tk.Button(frame_pages, text="Older", command=self.show_older_log).pack(side="left")
+        tk.Button(frame_pages, text="Live", command=self.show_live_log).pack(side="left")
+
         self.log_box = tk.Text(frame_log, height=15)
         self.log_box.pack(fill="both", expand=True)
 
+        self.log_cursor = None
+        self.log_lines = 0
+        self.log_page = 0
+        self.log_page_end = None
+        self.account_rows = {}
+        self.accounts_cursor = 0
+
     def get_user_balance(self):
-        with self.p.accounts_lock:
-            acc = self.p.accounts.get(self.user_account_id)
-            return acc.balance if acc else 0
+        return self.p.balance_snapshot().get(self.user_account_id, 0)
 
     def logout(self):
         """
@@ -212,7 +209,7 @@ class App:
         try:
             t = int(self.e_to.get())
             amt = int(self.e_amount.get())
-            self.p.submit(self.user_account_id, t, amt)
+            self.p.submit(self.user_account_id, t, amt, priority=Transaction.PRIORITY_INTERACTIVE)
             messagebox.showinfo("OK", "Transaction submitted")
         except Exception as e:
             self.log_error(str(e))
@@ -258,7 +255,7 @@ class App:
             self.save_users()
 
             messagebox.showinfo("OK", f"Account created with ID={new_id}")
-            self.update_accounts()
+            self.refresh_accounts()
 
         except Exception as e:
             self.log_error(str(e))
@@ -266,55 +263,137 @@ class App:
 
     def update_accounts(self):
         """
-        Update the admin accounts table
-        - Refreshes balances and verification
+        Update the admin accounts table every second
         - Does nothing if user is not admin
         """
         if not self.is_admin:
             return
 
-        self.accounts_table.delete(*self.accounts_table.get_children())
-        with self.p.accounts_lock:
-            for acc_id, acc in self.p.accounts.items():
-                self.accounts_table.insert("", "end", values=(acc_id, acc.owner, acc.balance, acc.verified))
+        self.refresh_accounts()
         self.root.after(1000, self.update_accounts)
 
+    def refresh_accounts(self):
+        """
+        Update only the rows of accounts whose balance changed
+        - Uses the account change feed of the payment engine
+        - Inserts rows for new accounts
+        - Balances come from one balance snapshot, so the table never shows
+          half of a transfer; the engine is not blocked (no locks)
+        """
+        changed, self.accounts_cursor = self.p.account_changes(self.accounts_cursor)
+        balances = self.p.balance_snapshot()
+        if changed is None:
+            changed = set(self.account_rows)
+        if len(self.account_rows) != len(balances):
+            changed.update(acc_id for acc_id in balances.keys() if acc_id not in self.account_rows)
+
+        for acc_id in sorted(changed):
+            acc = self.p.accounts.get(acc_id)
+            if acc is None or acc_id not in balances:
+                continue
+            values = (acc_id, acc.owner, balances[acc_id], acc.verified)
+            row = self.account_rows.get(acc_id)
+            if row is None:
+                self.account_rows[acc_id] = self.accounts_table.insert("", "end", values=values)
+            else:
+                self.accounts_table.item(row, values=values)
+
     def update_log(self):
         """
         Refresh transaction log displayed in the GUI
         - Admin sees all logs
         - Users see only logs involving their account
+        - Only new entries are appended (log change feed), the box keeps
+          at most log_view_lines lines; older entries are shown page by page
         - Updates balance label in user mode
         """
         if not hasattr(self, 'log_box') or not self.log_box.winfo_exists():
             return
 
-        self.log_box.delete(1.0, tk.END)
-
-        if self.is_admin:
-            entries = self.p.transactions_log
-        elif self.user_account_id:
-            entries = [e for e in self.p.transactions_log
-                       if e["from"] == self.user_account_id or e["to"] == self.user_account_id]
-        else:
-            entries = []
-
-        for entry in entries:
-            self.log_box.insert(tk.END, json.dumps(entry) + "\n")
+        if not self.log_page:
+            self.append_new_log_entries()
 
         if self.user_account_id and hasattr(self, 'balance_label') and self.balance_label.winfo_exists():
             self.balance_label.config(text=f"Balance: {self.get_user_balance()}")
 
         self.root.after(500, self.update_log)
 
+    def append_new_log_entries(self):
+        """
+        Append log entries added since the last refresh to the log box
+        """
+        max_lines = self.config.get("log_view_lines", 1000)
+        entries, cursor, complete = self.p.log_changes(self.log_cursor or 0)
+
+        if self.log_cursor is None or not complete:
+            if self.is_admin:
+                entries = entries[-max_lines:]
+            elif self.user_account_id:
+                entries = self.p.history(self.user_account_id, limit=max_lines)
+            self.set_log_lines(entries)
+        else:
+            if not self.is_admin:
+                entries = [e for e in entries
+                           if e["from"] == self.user_account_id or e["to"] == self.user_account_id]
+            if entries:
+                at_end = self.log_box.yview()[1] >= 1.0
+                self.log_box.insert(tk.END, "".join(json.dumps(entry) + "\n" for entry in entries))
+                self.log_lines += len(entries)
+                if self.log_lines > max_lines:
+                    self.log_box.delete("1.0", f"{self.log_lines - max_lines + 1}.0")
+                    self.log_lines = max_lines
+                if at_end:
+                    self.log_box.see(tk.END)
+        self.log_cursor = cursor
+
+    def set_log_lines(self, entries):
+        """
+        Replace the content of the log box
+        """
+        self.log_box.delete("1.0", tk.END)
+        self.log_box.insert(tk.END, "".join(json.dumps(entry) + "\n" for entry in entries))
+        self.log_lines = len(entries)
+
+    def show_older_log(self):
+        """
+        Show the previous page of the log (live updates pause)
+        - Admin pages through the log file
+        - Users page through their own history
+        """
+        page_size = self.config.get("log_view_lines", 1000)
+        if self.is_admin:
+            if self.log_page_end is None:
+                self.log_page_end = self.p.transactions_log.indexed_count()
+            entries, self.log_page_end = self.p.transactions_log.page(self.log_page_end, page_size)
+        else:
+            page = self.log_page + 1
+            history = self.p.history(self.user_account_id, limit=(page + 1) * page_size)
+            entries = history[:max(0, len(history) - page * page_size)]
+        self.log_page += 1
+        self.set_log_lines(entries)
+
+    def show_live_log(self):
+        """
+        Return from older pages to the live log
+        """
+        self.log_page = 0
+        self.log_page_end = None
+        self.log_cursor = None
+        self.append_new_log_entries()
+
     def on_close(self):
         """
-        Safely shut down the worker threads and close the application
+        Finish the submitted transactions, shut down the worker threads and close the application
         """
-        self.p.stop()
+        self.p.drain(timeout=5)
         self.root.destroy()
 
 
-root = tk.Tk()
-App(root)
-root.mainloop()
+def main():
+    root = tk.Tk()
+    App(root)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
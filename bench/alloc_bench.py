@@ -0,0 +1,188 @@
+"""
+Memory and allocation benchmark of the per-transaction data model.
+
+    python -m bench.alloc_bench --transactions 20000 --output alloc_output.json
+
+Two measurements:
+- model: the objects one transfer allocates on its way through the pipeline
+  (Transaction, log entries, timestamp strings, queue and scheduler
+  wrappers) are built for N transfers and kept alive, once for the legacy
+  representation (Transaction with a __dict__, separate pending and final
+  entry dicts, strftime per entry, a tuple per queue hop) and once for the
+  current one. As nothing is freed, the growth of sys.getallocatedblocks()
+  is the number of allocations per transfer.
+- pipeline: a full PaymentsWorkers run under tracemalloc, reporting the
+  bytes still held per settled transaction (in-memory log window) and the
+  peak traced bytes per transaction.
+"""
+import argparse
+import copy
+import gc
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.pipeline_bench import Workload
+from src.payments_worker import PaymentsWorkers
+from src.transaction import Transaction
+from src.transaction_handle import wait_all
+
+
+class LegacyTransaction:
+    """
+    The Transaction of earlier versions: same fields, no __slots__.
+    """
+
+    def __init__(self, tx_id, from_acc, to_acc, amount, priority=3):
+        self.tx_id = tx_id
+        self.from_acc = from_acc
+        self.to_acc = to_acc
+        self.amount = amount
+        self.priority = priority
+        self.ok = True
+        self.reason = "Completed"
+        self.timestamp = time.time()
+        self.handle = None
+
+
+def legacy_transfer(tx_id, from_acc, to_acc, amount, seq):
+    """
+    Objects of one transfer in the legacy representation.
+    """
+    tx = LegacyTransaction(tx_id, from_acc, to_acc, amount)
+    pending = {"timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), "tx_id": tx.tx_id, "from": tx.from_acc,
+               "to": tx.to_acc, "amount": tx.amount, "status": "pending", "reason": "processing"}
+    held = (time.monotonic(), next(seq), tx)
+    queued = (tx.timestamp, tx.tx_id, tx)
+    final = {"timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), "tx_id": tx.tx_id, "from": tx.from_acc,
+             "to": tx.to_acc, "amount": tx.amount, "status": "approved", "reason": "completed"}
+    return tx, pending, held, queued, final
+
+
+def current_transfer(tx_id, from_acc, to_acc, amount, seq):
+    """
+    Objects of one transfer in the current representation.
+    """
+    tx = Transaction(tx_id, from_acc, to_acc, amount)
+    tx.log_entry()
+    due = time.monotonic()
+    tx.settle("approved", "completed")
+    return tx, due
+
+
+def measure_model(build, transfers):
+    """
+    :param build: legacy_transfer or current_transfer
+    :param transfers: List of (from_acc, to_acc, amount)
+    :return: {"allocations", "bytes"} per transfer
+    """
+    n = len(transfers)
+    kept = [None] * n
+    gc.collect()
+    gc.disable()
+    try:
+        seq = itertools.count()
+        blocks = sys.getallocatedblocks()
+        for i, (from_acc, to_acc, amount) in enumerate(transfers):
+            kept[i] = build(i + 1, from_acc, to_acc, amount, seq)
+        allocations = (sys.getallocatedblocks() - blocks) / n
+
+        kept = [None] * n
+        seq = itertools.count()
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        for i, (from_acc, to_acc, amount) in enumerate(transfers):
+            kept[i] = build(i + 1, from_acc, to_acc, amount, seq)
+        size = (tracemalloc.get_traced_memory()[0] - start) / n
+        tracemalloc.stop()
+    finally:
+        gc.enable()
+    return {"allocations": round(allocations, 2), "bytes": round(size, 1)}
+
+
+def measure_pipeline(workload, t_payment=2):
+    """
+    Run all transfers of a workload through PaymentsWorkers under tracemalloc.
+    The log window holds every settled transaction.
+
+    :return: {"retained_bytes", "peak_bytes", "seconds"} per settled transaction
+    """
+    n = len(workload.transfers)
+    with tempfile.TemporaryDirectory() as folder:
+        config = {
+            "transactions_log_file": os.path.join(folder, "transactions.log"),
+            "users_file": os.path.join(folder, "users.json"),
+            "data_folder": folder,
+            "hold_time": 0,
+            "log_window": 2 * n,
+            "history_window": 2 * n,
+        }
+        p = PaymentsWorkers(config, copy.deepcopy(workload.credentials), t_payment=t_payment)
+        p.start()
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        handles = [p.submit(from_acc, to_acc, amount) for from_acc, to_acc, amount in workload.transfers]
+        wait_all(handles, timeout=300)
+        seconds = time.perf_counter() - start
+        del handles
+        p.log_writer.flush()
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        p.stop()
+    return {
+        "retained_bytes": round((retained - baseline) / n, 1),
+        "peak_bytes": round((peak - baseline) / n, 1),
+        "seconds": seconds / n,
+    }
+
+
+def run_benchmark(transactions=20000, accounts=1000, t_payment=2):
+    """
+    :return: Dictionary with environment, parameters and the results
+    """
+    workload = Workload(accounts=accounts, transactions=transactions, reject_ratio=0, decline_ratio=0)
+    legacy = measure_model(legacy_transfer, workload.transfers)
+    current = measure_model(current_transfer, workload.transfers)
+    pipeline = measure_pipeline(workload, t_payment)
+    print(f"model legacy   {legacy['allocations']:6.1f} allocations  {legacy['bytes']:7.1f} B per transfer")
+    print(f"model current  {current['allocations']:6.1f} allocations  {current['bytes']:7.1f} B per transfer")
+    print(f"pipeline       {pipeline['retained_bytes']:7.1f} B retained  {pipeline['peak_bytes']:7.1f} B peak  "
+          f"{pipeline['seconds'] * 1e6:6.1f} us per settled transaction")
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "parameters": {"transactions": transactions, "accounts": accounts, "t_payment": t_payment},
+        "model": {"legacy": legacy, "current": current},
+        "pipeline": pipeline,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure bytes and allocations per settled transaction.")
+    parser.add_argument("--transactions", type=int, default=20000)
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=2, help="Number of payment worker threads")
+    parser.add_argument("--output", default="alloc_output.json")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.transactions, args.accounts, args.threads)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
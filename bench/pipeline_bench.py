@@ -0,0 +1,288 @@
+"""
+Throughput / latency benchmark for the PaymentsWorkers pipeline.
+
+Runs headless (no Tk) with temporary config paths and writes the results
+as JSON for regression comparison:
+
+    python -m bench.pipeline_bench --transactions 20000 --threads 1,4,16,64 --output bench_output.json
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.payments_worker import PaymentsWorkers
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+INITIAL_BALANCE = 10 ** 9
+
+
+class Workload:
+    """
+    Synthetic workload: accounts and a list of (from, to, amount) transfers.
+
+    Attributes:
+    - credentials: user_credentials dictionary for PaymentsWorkers
+    - transfers: List of (from_acc, to_acc, amount) tuples
+    - parameters: Dictionary describing how the workload was generated
+    """
+
+    def __init__(self, accounts=1000, transactions=10000, distribution="uniform", zipf_s=1.1,
+                 unverified_ratio=0.1, reject_ratio=0.05, decline_ratio=0.05, seed=1):
+        """
+        Generate a workload.
+
+        :param accounts: Number of accounts
+        :param transactions: Number of transfers
+        :param distribution: "uniform" or "zipf" choice of sender and receiver
+        :param zipf_s: Exponent of the Zipf distribution (higher = more skewed)
+        :param unverified_ratio: Share of unverified accounts
+        :param reject_ratio: Share of transfers over 10000 from unverified senders (rejected)
+        :param decline_ratio: Share of transfers larger than the sender's balance (declined)
+        :param seed: Random seed, the same parameters always give the same workload
+        """
+        rng = random.Random(seed)
+        ids = list(range(1, accounts + 1))
+        unverified = set(rng.sample(ids, int(accounts * unverified_ratio)))
+        verified = [i for i in ids if i not in unverified]
+        unverified = sorted(unverified)
+
+        self.credentials = {
+            f"User{i}": {"id": i, "balance": INITIAL_BALANCE, "verified": i not in unverified}
+            for i in ids
+        }
+
+        cum_weights = None
+        if distribution == "zipf":
+            cum_weights = list(accumulate(1 / rank ** zipf_s for rank in range(1, accounts + 1)))
+        elif distribution != "uniform":
+            raise ValueError(f"Unknown distribution: {distribution}")
+
+        senders = rng.choices(ids, cum_weights=cum_weights, k=transactions)
+        receivers = rng.choices(ids, cum_weights=cum_weights, k=transactions)
+
+        self.transfers = []
+        for from_acc, to_acc in zip(senders, receivers):
+            kind = rng.random()
+            if kind < reject_ratio and unverified:
+                from_acc = rng.choice(unverified)
+                amount = rng.randint(10001, 20000)
+            elif kind < reject_ratio + decline_ratio and verified:
+                from_acc = rng.choice(verified)
+                amount = INITIAL_BALANCE * 10
+            else:
+                amount = rng.randint(1, 100)
+            if to_acc == from_acc:
+                to_acc = from_acc % accounts + 1
+            self.transfers.append((from_acc, to_acc, amount))
+
+        self.parameters = {
+            "accounts": accounts, "transactions": transactions, "distribution": distribution,
+            "zipf_s": zipf_s, "unverified_ratio": unverified_ratio, "reject_ratio": reject_ratio,
+            "decline_ratio": decline_ratio, "seed": seed,
+        }
+
+
+def percentile(sorted_values, q):
+    """
+    :param sorted_values: Sorted list of numbers
+    :param q: Percentile between 0 and 1
+    :return: Value at the percentile (None for an empty list)
+    """
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def peak_rss_mb():
+    """
+    :return: Peak resident set size of this process in MB (None if unknown)
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_once(workload, t_payment, t_antifraud=2, hold_time=0, shards=0, timeout=300, sample_interval=0.01):
+    """
+    Drive one PaymentsWorkers instance with a workload and measure it.
+
+    Latency is measured from the submit() call to the final log entry
+    (approved, declined or rejected), reported through a log listener.
+
+    :param workload: Workload to submit
+    :param t_payment: Number of payment worker threads
+    :param t_antifraud: Number of antifraud worker threads
+    :param hold_time: Scheduler hold time in seconds
+    :param shards: Number of shards for sharded settlement (0 = off)
+    :param timeout: Maximum seconds to wait for all transactions
+    :param sample_interval: Seconds between queue depth samples
+    :return: Dictionary with the results of the run
+    """
+    total = len(workload.transfers)
+    submitted = {}
+    latencies = []
+    statuses = Counter()
+    done = threading.Event()
+    # Listeners run on every payment (or shard) thread; Counter updates are not atomic
+    counting = threading.Lock()
+
+    def listener(entry):
+        end = time.perf_counter()
+        start = submitted.pop(entry["tx_id"], None)
+        with counting:
+            if start is not None:
+                latencies.append(end - start)
+            statuses[entry["status"]] += 1
+            if len(latencies) >= total:
+                done.set()
+
+    with tempfile.TemporaryDirectory() as folder:
+        config = {
+            "transactions_log_file": os.path.join(folder, "transactions.log"),
+            "users_file": os.path.join(folder, "users.json"),
+            "error_log_file": os.path.join(folder, "error.log"),
+            "data_folder": folder,
+        }
+        p = PaymentsWorkers(config, copy.deepcopy(workload.credentials), t_payment=t_payment,
+                            t_antifraud=t_antifraud, hold_time=hold_time, shards=shards)
+        p.add_listener(listener)
+
+        depths = {"queue_payment": [], "queue_antifraud": [], "delayed": []}
+        sampling = threading.Event()
+
+        def sample():
+            while not sampling.wait(sample_interval):
+                depths["queue_payment"].append(p.queue_payment.qsize())
+                depths["queue_antifraud"].append(p.queue_antifraud.qsize())
+                depths["delayed"].append(len(p.scheduler))
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        p.start()
+        sampler.start()
+
+        start = time.perf_counter()
+        for from_acc, to_acc, amount in workload.transfers:
+            submitted[p.tx_counter + 1] = time.perf_counter()
+            p.submit(from_acc, to_acc, amount)
+        submit_seconds = time.perf_counter() - start
+
+        completed = done.wait(timeout)
+        seconds = time.perf_counter() - start
+
+        sampling.set()
+        sampler.join()
+        p.stop()
+
+    latencies.sort()
+    return {
+        "t_payment": t_payment,
+        "t_antifraud": t_antifraud,
+        "shards": shards,
+        "completed": completed,
+        "settled": len(latencies),
+        "seconds": seconds,
+        "submit_seconds": submit_seconds,
+        "tps": len(latencies) / seconds if seconds else None,
+        "latency_ms": {
+            name: (value * 1000 if value is not None else None)
+            for name, value in (("p50", percentile(latencies, 0.5)), ("p99", percentile(latencies, 0.99)),
+                                ("p999", percentile(latencies, 0.999)), ("max", percentile(latencies, 1.0)))
+        },
+        "statuses": dict(statuses),
+        "queue_depth": {
+            name: {"max": max(values, default=0), "mean": sum(values) / len(values) if values else 0}
+            for name, values in depths.items()
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_benchmark(threads=(1, 2, 4, 8, 16, 32, 64), distributions=("uniform", "zipf"), t_antifraud=2,
+                  hold_time=0, shards=0, **workload_args):
+    """
+    Run the pipeline for every combination of distribution and thread count.
+
+    :param threads: Payment worker thread counts to measure
+    :param distributions: Workload distributions to measure
+    :param t_antifraud: Number of antifraud worker threads
+    :param hold_time: Scheduler hold time in seconds
+    :param shards: Number of shards for sharded settlement (0 = off)
+    :param workload_args: Arguments passed to Workload
+    :return: Dictionary with environment, parameters and one result per run
+    """
+    runs = []
+    for distribution in distributions:
+        workload = Workload(distribution=distribution, **workload_args)
+        for t_payment in threads:
+            result = run_once(workload, t_payment, t_antifraud=t_antifraud, hold_time=hold_time, shards=shards)
+            result["distribution"] = distribution
+            runs.append(result)
+            print(f"{distribution:8} t_payment={t_payment:3}  {result['tps']:10.0f} tx/s  "
+                  f"p50={result['latency_ms']['p50']:.2f}ms  p99={result['latency_ms']['p99']:.2f}ms")
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "parameters": dict(workload_args, t_antifraud=t_antifraud, hold_time=hold_time, shards=shards),
+        "runs": runs,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the PaymentsWorkers pipeline.")
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--transactions", type=int, default=10000)
+    parser.add_argument("--threads", default="1,2,4,8,16,32,64", help="Comma separated payment thread counts")
+    parser.add_argument("--antifraud-threads", type=int, default=2)
+    parser.add_argument("--distributions", default="uniform,zipf")
+    parser.add_argument("--zipf-s", type=float, default=1.1)
+    parser.add_argument("--unverified-ratio", type=float, default=0.1)
+    parser.add_argument("--reject-ratio", type=float, default=0.05)
+    parser.add_argument("--decline-ratio", type=float, default=0.05)
+    parser.add_argument("--hold-time", type=float, default=0)
+    parser.add_argument("--shards", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_output.json")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(
+        threads=[int(t) for t in args.threads.split(",")],
+        distributions=args.distributions.split(","),
+        t_antifraud=args.antifraud_threads,
+        hold_time=args.hold_time,
+        shards=args.shards,
+        accounts=args.accounts,
+        transactions=args.transactions,
+        zipf_s=args.zipf_s,
+        unverified_ratio=args.unverified_ratio,
+        reject_ratio=args.reject_ratio,
+        decline_ratio=args.decline_ratio,
+        seed=args.seed,
+    )
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Headless payments engine.
+
+Boots PaymentsWorkers from config.json without the GUI (no tkinter) and
+runs until SIGINT/SIGTERM, then drains the submitted transactions:
+
+    python service.py --t-payment 8 --t-antifraud 2 --queue-size 1000 --port 9000
+
+With --port or --unix-socket the engine is served as a JSON-lines socket
+(see AsyncPayments.serve); the GUI (app.py) remains an optional client.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+from src.payments_worker import PaymentsWorkers
+
+
+def load_config(path="config.json"):
+    """
+    Read the configuration and create the data and log folders.
+
+    :param path: Path of config.json
+    :return: Configuration dictionary
+    """
+    with open(path, "r") as f:
+        config = json.load(f)
+    os.makedirs(config["data_folder"], exist_ok=True)
+    for key in ("transactions_log_file", "error_log_file"):
+        folder = os.path.dirname(config.get(key, ""))
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+    return config
+
+
+def load_users(config):
+    """
+    Read the user credentials (accounts) from users_file.
+
+    :param config: Configuration dictionary
+    :return: Dictionary {username: {"id", "balance", "verified", "password"}}, empty if missing
+    """
+    try:
+        with open(config["users_file"], "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print("Error loading users:", e)
+        return {}
+
+
+def build_engine(config, args):
+    """
+    Create the engine with the thread and queue settings of the command line.
+
+    :param config: Configuration dictionary
+    :param args: Parsed command line (see parse_args)
+    :return: PaymentsWorkers, not started
+    """
+    return PaymentsWorkers(
+        config,
+        load_users(config),
+        t_payment=args.t_payment,
+        t_antifraud=args.t_antifraud,
+        max_delayed=args.max_delayed,
+        batch_size=args.batch_size,
+        queue_size=args.queue_size,
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the payments engine without the GUI.")
+    parser.add_argument("--config", default="config.json", help="Path of config.json")
+    parser.add_argument("--t-payment", type=int, default=4, help="Number of payment worker threads")
+    parser.add_argument("--t-antifraud", type=int, default=2, help="Number of antifraud worker threads")
+    parser.add_argument("--queue-size", type=int, default=None,
+                        help="Maximum transactions waiting for antifraud (default: config queue_size)")
+    parser.add_argument("--max-delayed", type=int, default=None,
+                        help="Maximum held transactions before submit blocks (default: config max_delayed)")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="Maximum transactions per micro-batch (default: config batch_size)")
+    parser.add_argument("--host", default="127.0.0.1", help="Address of the JSON-lines server")
+    parser.add_argument("--port", type=int, default=None, help="Serve JSON lines on this TCP port")
+    parser.add_argument("--unix-socket", default=None, help="Serve JSON lines on this Unix socket")
+    parser.add_argument("--drain-timeout", type=float, default=30,
+                        help="Seconds to finish submitted transactions on shutdown")
+    return parser.parse_args(argv)
+
+
+def run_server(p, args, stop):
+    """
+    Serve the engine as JSON lines until stop is set.
+    """
+    import asyncio
+    from src.async_payments import AsyncPayments
+
+    async def serve():
+        facade = AsyncPayments(p)
+        server = await facade.serve(args.host, args.port or 0, args.unix_socket)
+        address = args.unix_socket or "%s:%d" % server.sockets[0].getsockname()[:2]
+        print(f"Serving JSON lines on {address}", flush=True)
+        await asyncio.get_running_loop().run_in_executor(None, stop.wait)
+        server.close()
+        await server.wait_closed()
+        facade.close()
+
+    asyncio.run(serve())
+
+
+def main(argv=None):
+    start = time.perf_counter()
+    args = parse_args(argv)
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: stop.set())
+
+    config = load_config(args.config)
+    p = build_engine(config, args)
+    p.start()
+    print(f"Payments engine ready in {(time.perf_counter() - start) * 1000:.0f} ms "
+          f"({len(p.accounts)} accounts, {p.t_payment} payment / {p.t_antifraud} antifraud threads)", flush=True)
+
+    try:
+        if args.port is not None or args.unix_socket:
+            run_server(p, args, stop)
+        else:
+            stop.wait()
+    finally:
+        drained = p.drain(timeout=args.drain_timeout)
+        print("Payments engine stopped" + ("" if drained else " (some transactions were still in flight)"),
+              flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -21,6 +21,8 @@ class Account:
     - lock: Threading lock to ensure thread-safe operations on the account
     """
 
+    __slots__ = ("owner", "balance", "verified", "lock")
+
     def __init__(self, owner: str, balance: int, verified: bool = False):
         """
         Initialize a new Account instance.
@@ -0,0 +1,314 @@
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from src.account import Account, AccountException
+
+
+class AccountView(Account):
+    """
+    Lightweight view of one account stored in an AccountStore.
+
+    Behaves like Account (owner, balance, verified, lock), but reads and
+    writes go directly to the arrays of the store. Views are created on
+    demand and hold no state besides the store and the row index.
+    """
+
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        """
+        Initialize a new AccountView instance.
+
+        :param store: AccountStore holding the account
+        :param index: Row index of the account in the store
+        """
+        self.store = store
+        self.index = index
+
+    @property
+    def owner(self):
+        return self.store.owners[self.index]
+
+    @property
+    def balance(self):
+        return self.store.balances[self.index]
+
+    @balance.setter
+    def balance(self, value):
+        self.store.balances[self.index] = value
+
+    @property
+    def verified(self):
+        return bool(self.store.verified[self.index])
+
+    @verified.setter
+    def verified(self, value):
+        self.store.verified[self.index] = bool(value)
+
+    @property
+    def lock(self):
+        return self.store.stripes[self.index % len(self.store.stripes)]
+
+
+class AccountStore:
+    """
+    Compact, array-backed storage for accounts.
+
+    Balances and verified flags live in contiguous arrays, owners in a list,
+    and account IDs are mapped to row indexes. While IDs are consecutive
+    (first_id, first_id + 1, ...) no ID map is kept at all. Instead of one
+    lock per account, accounts share a fixed number of striped locks.
+
+    The store can be used like the previous dictionary of accounts:
+    store[acc_id] returns an AccountView, store[acc_id] = Account(...) adds
+    or overwrites an account, and get/keys/values/items/len/in work.
+
+    Attributes:
+    - balances: array of balances (signed 64-bit)
+    - verified: array of verified flags (0/1)
+    - owners: list of owner names
+    - ids: List of account IDs by row (only kept once IDs are not consecutive)
+    - stripes: List of striped locks
+    - lock_wait: Optional histogram (observe(seconds)) of contended stripe lock waits in locked()
+    - on_change: Optional callable receiving {acc_id: balance} of accounts added or
+      overwritten through the store (balance updates through views are not reported)
+    """
+
+    def __init__(self, stripes=64):
+        """
+        Initialize a new AccountStore instance.
+
+        :param stripes: Number of striped locks shared by all accounts
+        """
+        self.balances = array("q")
+        self.verified = array("b")
+        self.owners = []
+        self.ids = None
+        self.stripes = [threading.Lock() for _ in range(stripes)]
+        self.lock_wait = None
+        self.on_change = None
+
+        self._first_id = None
+        self._index = None
+        self._add_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.balances)
+
+    def __contains__(self, acc_id):
+        return self._find(acc_id) is not None
+
+    def __getitem__(self, acc_id):
+        index = self._find(acc_id)
+        if index is None:
+            raise KeyError(acc_id)
+        return AccountView(self, index)
+
+    def __setitem__(self, acc_id, account: Account):
+        """
+        Add an account or overwrite the values of an existing one.
+
+        :param acc_id: Account ID
+        :param account: Account (or view) whose owner, balance and verified are copied
+        """
+        with self._add_lock:
+            index = self._find(acc_id)
+            if index is None:
+                self._append(acc_id, account.owner, account.balance, account.verified)
+            else:
+                self.owners[index] = account.owner
+                self.balances[index] = account.balance
+                self.verified[index] = bool(account.verified)
+            if self.on_change is not None:
+                self.on_change({acc_id: account.balance})
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, acc_id, default=None):
+        index = self._find(acc_id)
+        return default if index is None else AccountView(self, index)
+
+    def keys(self):
+        """
+        :return: List of all account IDs
+        """
+        if self.ids is None:
+            if self._first_id is None:
+                return []
+            return list(range(self._first_id, self._first_id + len(self.balances)))
+        return list(self.ids)
+
+    def values(self):
+        return [AccountView(self, index) for index in range(len(self.balances))]
+
+    def items(self):
+        return list(zip(self.keys(), self.values()))
+
+    def bulk_load(self, rows):
+        """
+        Add many accounts at once.
+
+        :param rows: Iterable of (acc_id, owner, balance, verified) tuples
+        :raises AccountException: If a balance is negative or an ID already exists
+        """
+        added = {}
+        with self._add_lock:
+            try:
+                for acc_id, owner, balance, verified in rows:
+                    if balance < 0:
+                        raise AccountException("Initial balance cannot be negative.")
+                    if self._find(acc_id) is not None:
+                        raise AccountException(f"Account {acc_id} already exists.")
+                    self._append(acc_id, owner, balance, verified)
+                    added[acc_id] = balance
+            finally:
+                if added and self.on_change is not None:
+                    self.on_change(added)
+
+    def load_arrays(self, ids, owners, balances, verified):
+        """
+        Fill an empty store from column arrays (e.g. an account snapshot)
+        without going through one Account per row.
+
+        :param ids: array("q") of account IDs
+        :param owners: List of owner names
+        :param balances: array("q") of balances
+        :param verified: array("b") of verified flags
+        :raises AccountException: If the store is not empty or the columns differ in length
+        """
+        with self._add_lock:
+            if len(self.balances):
+                raise AccountException("Accounts can only be loaded into an empty store.")
+            if not len(ids) == len(owners) == len(balances) == len(verified):
+                raise AccountException("Account columns have different lengths.")
+            if not len(ids):
+                return
+
+            first = ids[0]
+            if ids == array("q", range(first, first + len(ids))):
+                self._first_id = first
+            else:
+                self._index = {acc_id: index for index, acc_id in enumerate(ids)}
+                if len(self._index) != len(ids):
+                    self._index = None
+                    raise AccountException("Duplicate account IDs.")
+                self.ids = list(ids)
+            self.owners = list(owners)
+            self.verified = array("b", verified)
+            self.balances = array("q", balances)
+            if self.on_change is not None:
+                self.on_change(dict(zip(ids, balances)))
+
+    def export(self):
+        """
+        Copy all columns of the store. The caller must hold locked_all() for a
+        consistent copy.
+
+        :return: (ids, owners, balances, verified) with ids/balances as array("q")
+            and verified as array("b")
+        """
+        return array("q", self.keys()), list(self.owners), array("q", self.balances), array("b", self.verified)
+
+    def dump(self):
+        """
+        Iterate over all accounts as plain tuples.
+
+        :return: Generator of (acc_id, owner, balance, verified) tuples
+        """
+        for acc_id, index in zip(self.keys(), range(len(self.balances))):
+            yield acc_id, self.owners[index], self.balances[index], bool(self.verified[index])
+
+    def verified_of(self, acc_ids):
+        """
+        Read the verified flags of many accounts at once (used by batch antifraud).
+
+        :param acc_ids: Iterable of account IDs
+        :return: List of verified flags (0/1) in the same order
+        :raises KeyError: If an account does not exist
+        """
+        verified = self.verified
+        return [verified[self._find_or_raise(acc_id)] for acc_id in acc_ids]
+
+    def lock_for(self, acc_id):
+        """
+        :param acc_id: Account ID
+        :return: Striped lock guarding the account
+        """
+        return self[acc_id].lock
+
+    @contextmanager
+    def locked(self, *acc_ids):
+        """
+        Hold the striped locks of several accounts.
+        Each stripe is taken once and stripes are always taken in the same
+        order, so two threads locking overlapping accounts cannot deadlock.
+
+        :param acc_ids: Account IDs to lock
+        """
+        order = sorted({self._find_or_raise(acc_id) % len(self.stripes) for acc_id in acc_ids})
+        for stripe in order:
+            lock = self.stripes[stripe]
+            if not lock.acquire(False):
+                start = time.perf_counter()
+                lock.acquire()
+                if self.lock_wait is not None:
+                    self.lock_wait.observe(time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            for stripe in reversed(order):
+                self.stripes[stripe].release()
+
+    @contextmanager
+    def locked_all(self):
+        """
+        Hold every striped lock, which stops all balance updates made under
+        account locks (used for consistent snapshots).
+        """
+        for stripe in self.stripes:
+            stripe.acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(self.stripes):
+                stripe.release()
+
+    def _find(self, acc_id):
+        if self.ids is None:
+            if self._first_id is None or type(acc_id) is not int:
+                return None
+            index = acc_id - self._first_id
+            return index if 0 <= index < len(self.balances) else None
+        return self._index.get(acc_id)
+
+    def _find_or_raise(self, acc_id):
+        index = self._find(acc_id)
+        if index is None:
+            raise KeyError(acc_id)
+        return index
+
+    def _append(self, acc_id, owner, balance, verified):
+        index = len(self.balances)
+        if self.ids is None:
+            if self._first_id is None and type(acc_id) is int:
+                self._first_id = acc_id
+            elif self._first_id is None or acc_id != self._first_id + index:
+                self._build_index()
+
+        if self.ids is not None:
+            self.ids.append(acc_id)
+        self.owners.append(owner)
+        self.verified.append(bool(verified))
+        self.balances.append(balance)
+        if self._index is not None:
+            self._index[acc_id] = index
+
+    def _build_index(self):
+        """
+        Switch from consecutive IDs to an explicit ID map.
+        """
+        ids = [] if self._first_id is None else list(range(self._first_id, self._first_id + len(self.balances)))
+        self._index = {acc_id: index for index, acc_id in enumerate(ids)}
+        self.ids = ids
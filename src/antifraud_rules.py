@@ -0,0 +1,415 @@
+import threading
+from array import array
+from collections import Counter, OrderedDict, deque
+
+
+class AntifraudException(Exception):
+    """
+    General exception for antifraud rule configuration errors.
+    """
+    pass
+
+
+class TxBatch:
+    """
+    Column view of a micro-batch of transactions.
+
+    Rules read whole columns instead of Transaction objects, so simple
+    rules become one comprehension over the batch.
+
+    Attributes:
+    - txs: List of transactions in queue order
+    - senders: Sender account IDs
+    - receivers: Receiver account IDs
+    - amounts: Amounts
+    - times: Submit timestamps (Transaction.timestamp)
+    """
+
+    def __init__(self, txs):
+        """
+        :param txs: List of Transaction objects
+        """
+        self.txs = txs
+        self.senders = [tx.from_acc for tx in txs]
+        self.receivers = [tx.to_acc for tx in txs]
+        self.amounts = [tx.amount for tx in txs]
+        self.times = [tx.timestamp for tx in txs]
+
+    def __len__(self):
+        return len(self.txs)
+
+
+class Rule:
+    """
+    Base class of antifraud rules.
+
+    evaluate() gets a whole TxBatch and returns one reason per transaction:
+    None when the rule passes, otherwise the rejection reason. Rules with
+    state must record every transaction of the batch in order, so later
+    transactions of the same batch see the earlier ones. Rejected attempts
+    are recorded too: velocity and fan-out limits count attempts.
+    State that must only learn from accepted transactions is recorded in
+    commit(), which gets the outcome of all rules.
+
+    Rule state is kept per sender. The RuleEngine holds the locks of all
+    senders of a batch during evaluate() and commit(), and all locks during
+    prune(), which drops state that no longer matters so it stays bounded.
+    """
+
+    name = "rule"
+
+    def evaluate(self, batch, accounts):
+        """
+        :param batch: TxBatch to check
+        :param accounts: AccountStore of the payment system
+        :return: List with None or a rejection reason for each transaction
+        """
+        raise NotImplementedError
+
+    def commit(self, batch, passed):
+        """
+        :param batch: TxBatch that was checked
+        :param passed: List of flags, True for transactions accepted by all rules
+        """
+        pass
+
+    def prune(self, now):
+        """
+        :param now: Timestamp of the newest transaction seen
+        """
+        pass
+
+
+class UnverifiedLimitRule(Rule):
+    """
+    Unverified accounts cannot send more than `limit`.
+    """
+
+    name = "unverified_limit"
+
+    def __init__(self, limit=10000):
+        self.limit = limit
+
+    def evaluate(self, batch, accounts):
+        verified = accounts.verified_of(batch.senders)
+        limit = self.limit
+        return [None if v or amount <= limit else self.name
+                for v, amount in zip(verified, batch.amounts)]
+
+
+class RollingCounters:
+    """
+    Per-account amount and count totals over a sliding time window.
+
+    The window is split into `buckets` time buckets. Each account has one
+    array of (bucket epoch, count, amount) triples, reused as a ring, so the
+    state per account is fixed-size no matter how many transactions it sends.
+    """
+
+    def __init__(self, window, buckets=12):
+        """
+        :param window: Window length in seconds
+        :param buckets: Number of buckets the window is split into
+        """
+        self.width = window / buckets
+        self.buckets = buckets
+        self._rings = {}
+
+    def add(self, acc_id, now, amount):
+        """
+        Count one transaction of acc_id at time now.
+        """
+        ring = self._rings.get(acc_id)
+        if ring is None:
+            ring = self._rings[acc_id] = array("q", [-1, 0, 0] * self.buckets)
+        epoch = int(now // self.width)
+        i = 3 * (epoch % self.buckets)
+        if ring[i] != epoch:
+            ring[i] = epoch
+            ring[i + 1] = 0
+            ring[i + 2] = 0
+        ring[i + 1] += 1
+        ring[i + 2] += amount
+
+    def prune(self, now):
+        """
+        Drop the rings of accounts without transactions inside the window ending at now.
+        """
+        oldest = int(now // self.width) - self.buckets + 1
+        for acc_id, ring in list(self._rings.items()):
+            if max(ring[0::3]) < oldest:
+                del self._rings[acc_id]
+
+    def __len__(self):
+        return len(self._rings)
+
+    def totals(self, acc_id, now):
+        """
+        :return: (count, amount) of acc_id inside the window ending at now
+        """
+        ring = self._rings.get(acc_id)
+        if ring is None:
+            return 0, 0
+        oldest = int(now // self.width) - self.buckets + 1
+        count = amount = 0
+        for i in range(0, len(ring), 3):
+            if ring[i] >= oldest:
+                count += ring[i + 1]
+                amount += ring[i + 2]
+        return count, amount
+
+
+class VelocityRule(Rule):
+    """
+    Limits the number and/or the total amount a sender may send per sliding window.
+    """
+
+    name = "velocity_limit"
+
+    def __init__(self, window=60, max_count=None, max_amount=None, buckets=12):
+        """
+        :param window: Window length in seconds
+        :param max_count: Maximum number of transactions per window (None = no limit)
+        :param max_amount: Maximum total amount per window (None = no limit)
+        :param buckets: Time resolution of the window
+        """
+        self.max_count = max_count
+        self.max_amount = max_amount
+        self.counters = RollingCounters(window, buckets)
+
+    def evaluate(self, batch, accounts):
+        reasons = []
+        for sender, amount, now in zip(batch.senders, batch.amounts, batch.times):
+            count, total = self.counters.totals(sender, now)
+            if self.max_count is not None and count + 1 > self.max_count:
+                reasons.append(self.name)
+            elif self.max_amount is not None and total + amount > self.max_amount:
+                reasons.append(self.name)
+            else:
+                reasons.append(None)
+            self.counters.add(sender, now, amount)
+        return reasons
+
+    def prune(self, now):
+        self.counters.prune(now)
+
+
+class NewPayeeRule(Rule):
+    """
+    The first transfer from a sender to a receiver cannot exceed `max_amount`.
+
+    A receiver becomes a known payee once a transfer to it was accepted by
+    all rules (see commit()), so retrying a rejected transfer does not pass.
+    Each sender remembers at most `max_payees` receivers and at most
+    `max_senders` senders are remembered; the least recently used ones are
+    forgotten first (their next transfer counts as new again).
+    """
+
+    name = "new_payee_limit"
+
+    def __init__(self, max_amount=5000, max_payees=1000, max_senders=100000):
+        """
+        :param max_amount: Maximum amount of a first transfer to a receiver
+        :param max_payees: Maximum number of payees remembered per sender
+        :param max_senders: Maximum number of senders remembered
+        """
+        self.max_amount = max_amount
+        self.max_payees = max_payees
+        self.max_senders = max_senders
+        # sender -> {receiver: None}, both in least recently used order
+        self.payees = OrderedDict()
+
+    def evaluate(self, batch, accounts):
+        payees = self.payees
+        limit = self.max_amount
+        return [None if amount <= limit or receiver in payees.get(sender, ()) else self.name
+                for sender, receiver, amount in zip(batch.senders, batch.receivers, batch.amounts)]
+
+    def commit(self, batch, passed):
+        for sender, receiver, ok in zip(batch.senders, batch.receivers, passed):
+            if not ok:
+                continue
+            known = self.payees.get(sender)
+            if known is None:
+                known = self.payees[sender] = OrderedDict()
+            else:
+                self.payees.move_to_end(sender)
+            known[receiver] = None
+            known.move_to_end(receiver)
+            if len(known) > self.max_payees:
+                known.popitem(last=False)
+
+    def prune(self, now):
+        while len(self.payees) > self.max_senders:
+            self.payees.popitem(last=False)
+
+
+class FanOutRule(Rule):
+    """
+    A sender cannot pay more than `max_payees` different receivers per sliding window.
+    """
+
+    name = "fan_out"
+
+    def __init__(self, window=60, max_payees=20):
+        """
+        :param window: Window length in seconds
+        :param max_payees: Maximum number of distinct receivers per window
+        """
+        self.window = window
+        self.max_payees = max_payees
+        self._recent = {}
+
+    def evaluate(self, batch, accounts):
+        reasons = []
+        for sender, receiver, now in zip(batch.senders, batch.receivers, batch.times):
+            state = self._recent.get(sender)
+            if state is None:
+                state = self._recent[sender] = (deque(), Counter())
+            recent, payees = state
+
+            while recent and recent[0][0] <= now - self.window:
+                old = recent.popleft()[1]
+                payees[old] -= 1
+                if not payees[old]:
+                    del payees[old]
+
+            recent.append((now, receiver))
+            payees[receiver] += 1
+            reasons.append(self.name if len(payees) > self.max_payees else None)
+        return reasons
+
+    def prune(self, now):
+        """
+        Drop senders without transfers inside the window ending at now.
+        """
+        for sender, (recent, payees) in list(self._recent.items()):
+            if not recent or recent[-1][0] <= now - self.window:
+                del self._recent[sender]
+
+
+RULES = {
+    "unverified_limit": UnverifiedLimitRule,
+    "velocity": VelocityRule,
+    "new_payee": NewPayeeRule,
+    "fan_out": FanOutRule,
+}
+
+DEFAULT_RULES = [{"rule": "unverified_limit", "limit": 10000}]
+
+
+def build_rules(specs):
+    """
+    Create rules from their configuration.
+
+    :param specs: List of dictionaries {"rule": name, **parameters}
+    :return: List of Rule objects
+    :raises AntifraudException: If a rule name or parameter is unknown
+    """
+    rules = []
+    for spec in specs:
+        params = dict(spec)
+        name = params.pop("rule", None)
+        if name not in RULES:
+            raise AntifraudException(f"Unknown antifraud rule: {name}")
+        try:
+            rules.append(RULES[name](**params))
+        except TypeError as e:
+            raise AntifraudException(f"Invalid parameters for antifraud rule {name}: {e}")
+    return rules
+
+
+class RuleEngine:
+    """
+    Runs a list of antifraud rules over micro-batches of transactions.
+
+    Every rule sees the whole batch; a transaction is rejected with the
+    reason of the first rule that fails it. Rule state is kept per sender
+    and shared by all antifraud workers, so a batch is evaluated holding the
+    striped locks of its senders; batches of different senders run at the
+    same time. Every `prune_every` batches the rules drop stale state while
+    all stripes are held.
+
+    Attributes:
+    - accounts: AccountStore used by the rules
+    - rules: List of Rule objects, in evaluation order
+    - stripes: List of striped locks guarding the rule state of the senders
+    - prune_every: Number of evaluated batches between two prune() calls
+    """
+
+    def __init__(self, accounts, rules=None, stripes=64, prune_every=1024):
+        """
+        Initialize a new RuleEngine instance.
+
+        :param accounts: AccountStore of the payment system
+        :param rules: List of Rule objects (default: build_rules(DEFAULT_RULES))
+        :param stripes: Number of striped locks shared by all senders
+        :param prune_every: Number of evaluated batches between two prune() calls
+        """
+        self.accounts = accounts
+        self.rules = rules if rules is not None else build_rules(DEFAULT_RULES)
+        self.stripes = [threading.Lock() for _ in range(stripes)]
+        self.prune_every = prune_every
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._now = 0
+
+    def add_rule(self, rule):
+        """
+        Add a rule evaluated after the existing ones.
+
+        :param rule: Rule object
+        """
+        with self._lock:
+            self.rules = self.rules + [rule]
+
+    def evaluate(self, txs):
+        """
+        Check a batch of transactions.
+
+        :param txs: List of Transaction objects
+        :return: List of (True/False, reason) tuples, one per transaction
+        """
+        batch = TxBatch(txs)
+        if not batch.txs:
+            return []
+        failed = [None] * len(batch)
+        rules = self.rules
+        order = sorted({hash(sender) % len(self.stripes) for sender in batch.senders})
+        for stripe in order:
+            self.stripes[stripe].acquire()
+        try:
+            for rule in rules:
+                for i, reason in enumerate(rule.evaluate(batch, self.accounts)):
+                    if reason is not None and failed[i] is None:
+                        failed[i] = reason
+            passed = [reason is None for reason in failed]
+            for rule in rules:
+                rule.commit(batch, passed)
+        finally:
+            for stripe in reversed(order):
+                self.stripes[stripe].release()
+
+        with self._lock:
+            self._now = max(self._now, max(batch.times))
+            self._batches += 1
+            due = self._batches % self.prune_every == 0
+        if due:
+            self.prune()
+        return [(False, reason) if reason else (True, "Completed") for reason in failed]
+
+    def prune(self, now=None):
+        """
+        Let every rule drop state that no longer matters, holding all stripes.
+
+        :param now: Reference time (default: timestamp of the newest transaction seen)
+        """
+        now = self._now if now is None else now
+        for stripe in self.stripes:
+            stripe.acquire()
+        try:
+            for rule in self.rules:
+                rule.prune(now)
+        finally:
+            for stripe in reversed(self.stripes):
+                stripe.release()
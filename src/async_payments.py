@@ -0,0 +1,184 @@
+import asyncio
+import json
+from src.transaction import Transaction
+
+
+class AsyncPayments:
+    """
+    asyncio front-end for PaymentsWorkers.
+
+    Results reach the event loop through the TransactionHandle of each
+    transaction and events through a PaymentsWorkers listener, both via
+    loop.call_soon_threadsafe, so waiting costs nothing until the payment
+    worker settles a transaction:
+
+        facade = AsyncPayments(payments)
+        result = await facade.submit(1, 2, 100)   # asyncio.Future
+        entry = await result                      # {"tx_id", "status", "reason", ...}
+
+        async for entry in facade.events():       # every settled transaction
+            ...
+
+    serve() exposes the same over a local JSON-lines socket.
+
+    Attributes:
+    - payments: PaymentsWorkers instance (started by the caller)
+    - loop: Event loop the futures and events belong to
+    - dropped: Number of events not delivered to a subscriber whose queue was full
+    """
+
+    def __init__(self, payments, loop=None):
+        """
+        Initialize a new AsyncPayments instance and register its listener.
+
+        :param payments: PaymentsWorkers instance
+        :param loop: Event loop (default: the running loop)
+        """
+        self.payments = payments
+        self.loop = loop or asyncio.get_running_loop()
+        self.dropped = 0
+
+        self._subscribers = set()
+        self._closed = False
+        payments.add_listener(self._on_settled)
+
+    async def submit(self, from_acc, to_acc, amount, priority=Transaction.PRIORITY_DEFAULT):
+        """
+        Submit a transaction.
+
+        PaymentsWorkers.submit may block while the scheduler is full, so it
+        runs in the default executor and the event loop keeps serving.
+
+        :param from_acc: Sender account ID
+        :param to_acc: Receiver account ID
+        :param amount: Amount to transfer
+        :param priority: Priority class, 1 (interactive) to 5 (bulk)
+        :return: asyncio.Future resolving to the final log entry
+            (status approved, declined or rejected); its tx_id attribute is the transaction ID
+        :raises PaymentCoreException: If the transaction is invalid or the system is draining
+        """
+        if self._closed:
+            raise RuntimeError("AsyncPayments is closed.")
+
+        handle = await self.loop.run_in_executor(None, self.payments.submit, from_acc, to_acc, amount, priority)
+        future = asyncio.wrap_future(handle, loop=self.loop)
+        future.tx_id = handle.tx_id
+        return future
+
+    async def events(self, maxsize=10000):
+        """
+        Iterate over the final log entries of all transactions settled
+        while the iterator is open.
+
+        :param maxsize: Events buffered for a slow consumer; newer events are
+            dropped (and counted in dropped) while the buffer is full
+        """
+        queue = asyncio.Queue(maxsize)
+        self._subscribers.add(queue)
+        try:
+            while True:
+                entry = await queue.get()
+                if entry is None:
+                    return
+                yield entry
+        finally:
+            self._subscribers.discard(queue)
+
+    def close(self):
+        """
+        Unregister the listener and end all event iterators. Futures returned
+        by submit still resolve when their transactions settle.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self.payments.remove_listener(self._on_settled)
+        for queue in self._subscribers:
+            while queue.full():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    async def serve(self, host="127.0.0.1", port=0, path=None):
+        """
+        Serve the facade as a JSON-lines socket, one JSON object per line.
+
+        Requests:
+        - {"op": "submit", "from": id, "to": id, "amount": n, "priority": p, "id": any}
+          answers {"id", "status": "accepted", "tx_id"} and later
+          {"id", "tx_id", "status": "approved"/"declined"/"rejected", "reason"},
+          or {"id", "status": "error", "reason"}
+        - {"op": "subscribe"} streams {"event": "settled", ...entry} for every settled transaction
+
+        :param host: Address to bind, local only by default
+        :param port: TCP port (0 = any free port)
+        :param path: Path of a Unix socket to serve instead of TCP
+        :return: asyncio.Server
+        """
+        if path:
+            return await asyncio.start_unix_server(self._handle_client, path)
+        return await asyncio.start_server(self._handle_client, host, port)
+
+    def _on_settled(self, entry):
+        # Called on a payment worker thread
+        try:
+            self.loop.call_soon_threadsafe(self._settle, entry)
+        except RuntimeError:
+            pass
+
+    def _settle(self, entry):
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(entry)
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+    async def _handle_client(self, reader, writer):
+        tasks = set()
+
+        async def send(message):
+            writer.write((json.dumps(message) + "\n").encode())
+            await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    op = request.get("op")
+                except (ValueError, AttributeError):
+                    await send({"status": "error", "reason": "Invalid JSON request."})
+                    continue
+
+                if op == "submit":
+                    task = asyncio.ensure_future(self._client_submit(request, send))
+                elif op == "subscribe":
+                    task = asyncio.ensure_future(self._client_subscribe(send))
+                else:
+                    await send({"id": request.get("id"), "status": "error", "reason": f"Unknown op: {op}"})
+                    continue
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _client_submit(self, request, send):
+        request_id = request.get("id")
+        try:
+            result = await self.submit(request.get("from"), request.get("to"), request.get("amount"),
+                                       request.get("priority", Transaction.PRIORITY_DEFAULT))
+        except Exception as e:
+            await send({"id": request_id, "status": "error", "reason": str(e)})
+            return
+        await send({"id": request_id, "status": "accepted", "tx_id": result.tx_id})
+        entry = await result
+        await send({"id": request_id, "tx_id": entry["tx_id"], "status": entry["status"], "reason": entry["reason"]})
+
+    async def _client_subscribe(self, send):
+        async for entry in self.events():
+            await send({"event": "settled", **entry})
@@ -0,0 +1,474 @@
+import itertools
+import json
+import os
+import threading
+import time
+
+
+class JournalException(Exception):
+    """
+    General exception for balance journal errors.
+    """
+    pass
+
+
+class BalanceJournal:
+    """
+    Append-only, durable journal of account balances with group commit.
+
+    Every approved transaction appends one record holding the new absolute
+    balances of both accounts. Concurrent callers of append() are collected
+    into a single batch by a writer thread, which writes the batch with one
+    write and one fsync and then releases every waiting caller.
+
+    The two halves of a cross-shard transfer are separate records: the
+    debit carries the amount in "transit", the credit (or the refund of a
+    failed credit) a negative "transit". Replay gives a debit whose credit
+    never reached the journal back to the sender and journals that refund.
+
+    A failed write is retried WRITE_RETRIES times on a reopened file, cut back
+    to the last durable record; if it still fails, only the callers of that
+    batch get the error and the writer goes on with the next batch.
+
+    users.json becomes a periodic checkpoint: after checkpoint_every records
+    the journal is moved to "<path>.prev" and the checkpoint callback runs on
+    its own thread, so group commits continue meanwhile. "<path>.prev" is
+    removed once the checkpoint is written; replay reads it before the journal.
+
+    Attributes:
+    - path: Path of the journal file
+    - prev_path: Path of the journal moved aside for a running checkpoint
+    - commit_ms: Maximum time (ms) the writer waits for a batch to fill up
+    - commit_max: Maximum number of records written in one batch
+    - checkpoint_every: Number of records between two checkpoints (0 = never)
+    - last_seq: Dictionary mapping account IDs to the seq of their newest record
+    - write_latency: Optional histogram (observe(seconds)) of batch write + fsync times
+    - base_seq: Seq included by the account snapshot; accounts without a newer
+      record are at least this recent (see seq_of)
+    - max_tx_id: Highest tx_id of the records read by replay or replay_into
+    - settled: Dictionary mapping the tx_ids of the records read by replay or
+      replay_into to the final status they prove ("approved", or "rejected"
+      for a refunded cross-shard transfer or a debit refunded by replay)
+    """
+
+    WRITE_RETRIES = 3
+    RETRY_DELAY = 0.05
+
+    def __init__(self, path, commit_ms=2, commit_max=512, checkpoint_every=10000, checkpoint=None):
+        """
+        Initialize a new BalanceJournal instance.
+
+        :param path: Path of the journal file
+        :param commit_ms: Group commit time window in milliseconds
+        :param commit_max: Group commit size window in records
+        :param checkpoint_every: Number of records between checkpoints (0 = never)
+        :param checkpoint: Callable writing the checkpoint (users.json)
+        """
+        self.path = path
+        self.prev_path = path + ".prev"
+        self.commit_ms = commit_ms
+        self.commit_max = commit_max
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint = checkpoint
+
+        self.last_seq = {}
+        self.base_seq = 0
+        self.max_tx_id = 0
+        self.settled = {}
+        self.write_latency = None
+        self._seq = itertools.count(1)
+
+        self._cond = threading.Condition()
+        self._pending = _Batch()
+        self._closed = False
+        self._since_checkpoint = 0
+
+        self._file = None
+        self._file_lock = threading.Lock()
+        self._writer = None
+        self._checkpointer = None
+
+    def replay(self, user_credentials):
+        """
+        Apply journal records written after the last checkpoint to user_credentials.
+
+        Each credentials entry remembers the seq of the journal record its
+        balance comes from ("journal_seq"), so records already included in the
+        checkpoint are skipped. The seq counter continues after the highest seq seen.
+
+        :param user_credentials: Dictionary loaded from users.json, updated in place
+        :return: Number of records replayed
+        """
+        by_id = {data["id"]: data for data in user_credentials.values()}
+        high = max((data.get("journal_seq", 0) for data in by_id.values()), default=0)
+        replayed = 0
+        in_transit = {}
+
+        for record in self._records():
+            seq = record["seq"]
+            high = max(high, seq)
+            self._settle(record, in_transit)
+            for acc_id, balance in record["balances"].items():
+                data = by_id.get(int(acc_id))
+                if data is not None and seq > data.get("journal_seq", 0):
+                    data["balance"] = balance
+                    data["journal_seq"] = seq
+            replayed += 1
+
+        for data in by_id.values():
+            self.last_seq[data["id"]] = data.get("journal_seq", 0)
+        self._seq = itertools.count(high + 1)
+        balances = {acc_id: data["balance"] for acc_id, data in by_id.items()}
+        for acc_id, balance, seq in self._refund_in_transit(in_transit, balances):
+            by_id[acc_id].update(balance=balance, journal_seq=seq)
+        return replayed
+
+    def replay_into(self, accounts, after_seq):
+        """
+        Apply journal records newer than an account snapshot to an AccountStore.
+
+        Records are applied with the newest seq per account winning, so the
+        order of records in the file does not matter. The seq counter continues
+        after the highest seq seen.
+
+        :param accounts: AccountStore loaded from a snapshot taken at seq after_seq
+        :param after_seq: Seq cut of the snapshot (records <= after_seq are included in it)
+        :return: Number of records replayed
+        """
+        self.base_seq = after_seq
+        high = after_seq
+        replayed = 0
+        in_transit = {}
+
+        for record in self._records():
+            seq = record["seq"]
+            self._settle(record, in_transit)
+            if seq <= after_seq:
+                continue
+            high = max(high, seq)
+            for acc_id, balance in record["balances"].items():
+                acc_id = int(acc_id)
+                acc = accounts.get(acc_id)
+                if acc is not None and seq > self.last_seq.get(acc_id, after_seq):
+                    acc.balance = balance
+                    self.last_seq[acc_id] = seq
+            replayed += 1
+
+        self._seq = itertools.count(high + 1)
+        balances = {acc_id: accounts[acc_id].balance for acc_id, amount in in_transit.values() if acc_id in accounts}
+        for acc_id, balance, seq in self._refund_in_transit(in_transit, balances):
+            accounts[acc_id].balance = balance
+        return replayed
+
+    def _settle(self, record, in_transit):
+        tx_id = record.get("tx_id")
+        if tx_id:
+            self.max_tx_id = max(self.max_tx_id, tx_id)
+            self.settled[tx_id] = "rejected" if record.get("refund") else "approved"
+            transit = record.get("transit", 0)
+            if transit > 0:
+                in_transit[tx_id] = (int(next(iter(record["balances"]))), transit)
+            elif transit < 0:
+                in_transit.pop(tx_id, None)
+
+    def _refund_in_transit(self, in_transit, balances):
+        """
+        Give debits of cross-shard transfers without a credit or refund record
+        back to their senders and make the refund records durable.
+
+        :param in_transit: Dictionary mapping tx_ids to (sender ID, amount)
+        :param balances: Dictionary mapping account IDs to their replayed balance
+        :return: List of (account ID, refunded balance, seq of the refund record)
+        :raises JournalException: If the refund records cannot be written
+        """
+        records = []
+        for tx_id, (acc_id, amount) in in_transit.items():
+            if acc_id in balances:
+                balances[acc_id] += amount
+                records.append(self.record(tx_id, {acc_id: balances[acc_id]}, refund=True, transit=-amount))
+                self.settled[tx_id] = "rejected"
+        if records:
+            self.append_many(records)
+        return [(acc_id, balance, record["seq"]) for record in records for acc_id, balance in record["balances"].items()]
+
+    def _records(self):
+        """
+        :return: Generator of the records of the moved-aside and the current journal
+        """
+        for path in (self.prev_path, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+
+    def seq_of(self, acc_id):
+        """
+        :param acc_id: Account ID
+        :return: Seq of the newest record already reflected in the account balance
+        """
+        return self.last_seq.get(acc_id, self.base_seq)
+
+    def cut(self):
+        """
+        Take a seq cut: every record created before this call has a smaller
+        seq, every record created after it a larger one.
+
+        :return: Seq cut
+        """
+        return next(self._seq)
+
+    def record(self, tx_id, balances, refund=False, transit=0):
+        """
+        Create a journal record for new account balances.
+        Must be called while holding the locks of all accounts in balances,
+        so that the seq order matches the order of the balance updates.
+
+        :param tx_id: ID of the transaction that changed the balances
+        :param balances: Dictionary mapping account IDs to their new balance
+        :param refund: The record gives back the debit of a transaction that is rejected
+        :param transit: Amount debited (positive) or credited (negative) on its
+            own by one half of a cross-shard transfer
+        :return: Record ready to be passed to append()
+        """
+        seq = next(self._seq)
+        for acc_id in balances:
+            self.last_seq[acc_id] = seq
+        record = {"seq": seq, "tx_id": tx_id, "balances": balances}
+        if refund:
+            record["refund"] = True
+        if transit:
+            record["transit"] = transit
+        return record
+
+    def append(self, record):
+        """
+        Append a record and block until it is durable on disk.
+
+        :param record: Record created by record()
+        :raises JournalException: If the journal is closed or the write failed
+        """
+        self.append_many([record])
+
+    def append_many(self, records):
+        """
+        Append records and block until all of them are durable on disk.
+        All records are written in the same batch.
+
+        :param records: List of records created by record()
+        :raises JournalException: If the journal is closed or the write of the batch failed
+        """
+        with self._cond:
+            if self._closed:
+                raise JournalException("Balance journal is closed.")
+            self._start_writer()
+
+            batch = self._pending
+            batch.records.extend(records)
+            self._cond.notify_all()
+
+            while not batch.done:
+                self._cond.wait()
+            if batch.error is not None:
+                raise JournalException(f"Balance journal write failed: {batch.error}")
+
+    def append_async(self, records, callback=None):
+        """
+        Append records without waiting for the disk.
+        All records are written in the same batch.
+
+        :param records: List of records created by record()
+        :param callback: Called on the writer thread as callback(error) once the
+            batch is durable (error is None) or failed
+        :raises JournalException: If the journal is closed
+        """
+        with self._cond:
+            if self._closed:
+                raise JournalException("Balance journal is closed.")
+            self._start_writer()
+
+            self._pending.records.extend(records)
+            if callback:
+                self._pending.callbacks.append(callback)
+            self._cond.notify_all()
+
+    def close(self, checkpoint=False):
+        """
+        Write all pending records and stop the writer thread.
+        The journal can be used again afterwards; the writer restarts on demand.
+
+        :param checkpoint: Write a final checkpoint and truncate the journal
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            writer = self._writer
+
+        if writer:
+            writer.join()
+        checkpointer = self._checkpointer
+        if checkpointer:
+            checkpointer.join()
+        if checkpoint and self.checkpoint:
+            self._checkpoint()
+            self._since_checkpoint = 0
+        with self._file_lock:
+            self._close_file()
+
+        with self._cond:
+            self._writer = None
+            self._checkpointer = None
+            self._closed = False
+
+    def _start_writer(self):
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name="balance-journal", daemon=True)
+            self._writer.start()
+
+    def _write_loop(self):
+        """
+        Writer thread: collect a batch within the time/size window, write it
+        with one fsync and wake all callers waiting for that batch.
+        """
+        while True:
+            with self._cond:
+                while not self._pending.records and not self._closed:
+                    self._cond.wait()
+                if not self._pending.records:
+                    return
+
+                deadline = time.monotonic() + self.commit_ms / 1000
+                while len(self._pending.records) < self.commit_max and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch, self._pending = self._pending, _Batch()
+
+            error = None
+            for attempt in range(self.WRITE_RETRIES + 1):
+                if attempt:
+                    time.sleep(self.RETRY_DELAY * 2 ** (attempt - 1))
+                try:
+                    start = time.perf_counter()
+                    self._write(batch.records)
+                    if self.write_latency is not None:
+                        self.write_latency.observe(time.perf_counter() - start)
+                    error = None
+                    break
+                except Exception as e:
+                    print("Error writing balance journal:", e)
+                    error = e
+
+            with self._cond:
+                batch.done = True
+                batch.error = error
+                self._cond.notify_all()
+            self._run_callbacks(batch.callbacks, error)
+
+            if error is None:
+                self._since_checkpoint += len(batch.records)
+                if self.checkpoint and self.checkpoint_every and self._since_checkpoint >= self.checkpoint_every:
+                    self._start_checkpoint()
+
+    @staticmethod
+    def _run_callbacks(callbacks, error):
+        for callback in callbacks:
+            try:
+                callback(error)
+            except Exception as e:
+                print("Error in balance journal callback:", e)
+
+    def _write(self, batch):
+        with self._file_lock:
+            if self._file is None:
+                folder = os.path.dirname(self.path)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                _cut_torn_tail(self.path)
+                self._file = open(self.path, "a")
+
+            try:
+                self._file.write("".join(json.dumps(record) + "\n" for record in batch))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except Exception:
+                # Reopen on the next attempt, which cuts a partly written record
+                self._close_file()
+                raise
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError as e:
+                print("Error closing balance journal:", e)
+            self._file = None
+
+    def _start_checkpoint(self):
+        """
+        Run a checkpoint on its own thread unless one is still running.
+        """
+        if self._checkpointer is not None and self._checkpointer.is_alive():
+            return
+        self._since_checkpoint = 0
+        self._checkpointer = threading.Thread(target=self._checkpoint, name="balance-checkpoint", daemon=True)
+        self._checkpointer.start()
+
+    def _checkpoint(self):
+        """
+        Move the journal aside, write a checkpoint and remove the moved journal.
+        Every record in the moved journal describes a balance update made before
+        the checkpoint was taken, so the checkpoint includes all of them. Records
+        written meanwhile go to a new journal file. After a failed checkpoint the
+        moved journal is kept (and read by replay) until a checkpoint succeeds.
+        """
+        with self._file_lock:
+            if not os.path.exists(self.prev_path) and os.path.exists(self.path):
+                self._close_file()
+                os.replace(self.path, self.prev_path)
+
+        try:
+            self.checkpoint()
+        except Exception as e:
+            print("Error writing checkpoint:", e)
+            return
+
+        if os.path.exists(self.prev_path):
+            os.remove(self.prev_path)
+
+
+def _cut_torn_tail(path):
+    """
+    Cut a last record without its newline (failed write or crash), so the
+    next record starts on its own line.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if not size:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        f.seek(0)
+        f.truncate(f.read().rfind(b"\n") + 1)
+
+
+class _Batch:
+    """
+    Records of one group commit and its outcome.
+    """
+
+    __slots__ = ("records", "callbacks", "done", "error")
+
+    def __init__(self):
+        self.records = []
+        self.callbacks = []
+        self.done = False
+        self.error = None
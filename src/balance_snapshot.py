@@ -0,0 +1,173 @@
+import threading
+from array import array
+
+
+class BalanceSnapshot:
+    """
+    Immutable view of all account balances at one sequence number.
+
+    Balances are kept in pages of array("q") shared with older and newer
+    snapshots; a page is never changed once a snapshot refers to it. Rows
+    of accounts added after the snapshot are ignored (row >= count), so
+    the row map can be shared as well.
+
+    Attributes:
+    - seq: Number of balance updates included in the snapshot
+    - in_transit: Amount debited but not yet credited by cross-shard transfers
+    """
+
+    __slots__ = ("seq", "in_transit", "_rows", "_ids", "_count", "_pages", "_page_size")
+
+    def __init__(self, seq, rows, ids, count, pages, page_size, in_transit=0):
+        """
+        Initialize a new BalanceSnapshot instance.
+
+        :param seq: Number of balance updates included in the snapshot
+        :param rows: Dictionary mapping account IDs to rows (shared, append-only)
+        :param ids: List of account IDs by row (shared, append-only)
+        :param count: Number of accounts in the snapshot
+        :param pages: Tuple of balance pages
+        :param page_size: Number of balances per page
+        :param in_transit: Amount debited but not yet credited
+        """
+        self.seq = seq
+        self.in_transit = in_transit
+        self._rows = rows
+        self._ids = ids
+        self._count = count
+        self._pages = pages
+        self._page_size = page_size
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, acc_id):
+        return self._row(acc_id) is not None
+
+    def __getitem__(self, acc_id):
+        row = self._row(acc_id)
+        if row is None:
+            raise KeyError(acc_id)
+        return self._pages[row // self._page_size][row % self._page_size]
+
+    def get(self, acc_id, default=None):
+        row = self._row(acc_id)
+        if row is None:
+            return default
+        return self._pages[row // self._page_size][row % self._page_size]
+
+    def keys(self):
+        """
+        :return: List of the account IDs of the snapshot
+        """
+        return self._ids[:self._count]
+
+    def items(self):
+        """
+        :return: Generator of (acc_id, balance) tuples
+        """
+        size = self._page_size
+        for row, acc_id in enumerate(self.keys()):
+            yield acc_id, self._pages[row // size][row % size]
+
+    def total(self):
+        """
+        :return: Sum of all balances plus the amount in transit, which only
+            changes when accounts are added or overwritten
+        """
+        return sum(sum(page) for page in self._pages) + self.in_transit
+
+    def _row(self, acc_id):
+        row = self._rows.get(acc_id)
+        return row if row is not None and row < self._count else None
+
+
+class BalanceVersions:
+    """
+    Copy-on-write publication of consistent balance snapshots.
+
+    Writers call update() with the new balances of one transfer while its
+    account locks are held (see PaymentsCore.record_balances), so updates of
+    the same account arrive in the order they were made and every prefix of
+    the updates is a consistent state. update() only merges the balances
+    into a pending dictionary.
+
+    snapshot() returns the current BalanceSnapshot without any lock when
+    nothing changed since it was published. Otherwise the pending updates
+    are taken in one step and a new version is built that copies only the
+    pages they touch; all other pages are shared with the previous version.
+    Writers never wait for a snapshot to be built.
+
+    Attributes:
+    - page_size: Number of balances per copy-on-write page
+    """
+
+    def __init__(self, page_size=1024):
+        """
+        Initialize a new BalanceVersions instance.
+
+        :param page_size: Number of balances per copy-on-write page
+        """
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._pending = {}
+        self._seq = 0
+        self._in_transit = 0
+        self._rows = {}
+        self._ids = []
+        self._current = BalanceSnapshot(0, self._rows, self._ids, 0, (), page_size)
+
+    def update(self, balances, in_transit=0):
+        """
+        Record new balances of existing or new accounts.
+
+        :param balances: Dictionary mapping account IDs to their new balance
+        :param in_transit: Change of the amount debited but not yet credited
+        """
+        with self._lock:
+            self._pending.update(balances)
+            self._in_transit += in_transit
+            self._seq += 1
+
+    def snapshot(self):
+        """
+        :return: BalanceSnapshot including every update made before the call
+        """
+        current = self._current
+        if current.seq == self._seq:
+            return current
+        with self._publish_lock:
+            current = self._current
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                seq, in_transit = self._seq, self._in_transit
+            if seq != current.seq:
+                current = self._current = self._publish(current, pending, seq, in_transit)
+            return current
+
+    def _publish(self, current, pending, seq, in_transit):
+        size = self.page_size
+        pages = list(current._pages)
+        copied = set()
+        count = current._count
+        for acc_id, balance in pending.items():
+            row = self._rows.get(acc_id)
+            if row is None:
+                row = count
+                count += 1
+                self._ids.append(acc_id)
+                self._rows[acc_id] = row
+            page_no, slot = divmod(row, size)
+            if page_no == len(pages):
+                pages.append(array("q"))
+                copied.add(page_no)
+            elif page_no not in copied:
+                pages[page_no] = array("q", pages[page_no])
+                copied.add(page_no)
+            page = pages[page_no]
+            if slot == len(page):
+                page.append(balance)
+            else:
+                page[slot] = balance
+        return BalanceSnapshot(seq, self._rows, self._ids, count, tuple(pages), size, in_transit)
@@ -0,0 +1,31 @@
+import json
+
+
+class BatchRowException(Exception):
+    """
+    Error of a single row of a batch file (e.g. invalid JSON).
+    The row is reported as invalid, the rest of the batch continues.
+    """
+    pass
+
+
+def read_jsonl(path):
+    """
+    Stream payment rows from a JSON-lines file.
+
+    Each line must be an object {"from": id, "to": id, "amount": amount}.
+    Empty lines are skipped, lines that are not valid JSON are yielded as
+    BatchRowException so that submit_many() reports them per row.
+
+    :param path: Path of the JSONL file
+    :return: Generator of row dictionaries or BatchRowException instances
+    """
+    with open(path, "r") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                yield BatchRowException(f"Line {line_no}: invalid JSON ({e.msg})")
@@ -0,0 +1,194 @@
+import threading
+import time
+from collections import deque
+
+
+class DelayScheduler:
+    """
+    Single-thread scheduler that holds items for a fixed time.
+
+    Every item is held for the same hold_time, so due times grow in
+    scheduling order: items and their due times are kept in two FIFO deques
+    (no heap entry tuple per item). One scheduler thread sleeps until the
+    oldest item is due and then releases all due items (up to batch_size at
+    a time) through the release callback.
+
+    Backpressure: at most max_pending items are held; schedule() blocks while
+    the scheduler is full. Because release() may itself block (e.g. on a
+    bounded queue), a slow consumer keeps items held and callers wait.
+
+    After stop() new items are refused until the next start().
+
+    Attributes:
+    - hold_time: Seconds an item is held before release (0 = release immediately)
+    - release: Callable receiving a list of due items
+    - on_error: Callable receiving (items, exception) when release() raised
+    - max_pending: Maximum number of held items
+    - batch_size: Maximum number of items passed to one release() call
+    """
+
+    def __init__(self, hold_time, release, max_pending=100000, batch_size=256, on_error=None):
+        """
+        Initialize a new DelayScheduler instance.
+
+        :param hold_time: Seconds an item is held before release
+        :param release: Callable receiving a list of due items
+        :param max_pending: Maximum number of held items before schedule() blocks
+        :param batch_size: Maximum number of items per release() call
+        :param on_error: Callable receiving (items, exception) when release() raised
+            (default: the error is printed and the items are dropped)
+        """
+        self.hold_time = hold_time
+        self.release = release
+        self.on_error = on_error
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+
+        self._due = deque()
+        self._items = deque()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._thread = None
+        self._flushing = False
+        self._stopped = False
+
+    def __len__(self):
+        """
+        :return: Number of items currently held (including a batch being released)
+        """
+        return len(self._items) + self._in_flight
+
+    def schedule(self, item, timeout=None):
+        """
+        Hold an item for hold_time and then release it.
+
+        :param item: Item to release later
+        :param timeout: Maximum seconds to wait for space (None = wait forever)
+        :return: True if scheduled, False if the scheduler stayed full until timeout
+            or is stopped
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._stopped or len(self) < self.max_pending, timeout):
+                return False
+            if self._stopped:
+                return False
+            self._due.append(max(time.monotonic() + self.hold_time, self._due[-1] if self._due else 0.0))
+            self._items.append(item)
+            if len(self._items) == 1:
+                self._cond.notify_all()
+            self._start()
+        return True
+
+    def schedule_many(self, items):
+        """
+        Hold a batch of items with one lock acquisition per free block.
+        Blocks until all items fit into the scheduler.
+
+        :param items: List of items to release later
+        :return: Number of items scheduled; fewer than len(items) if the
+            scheduler is stopped, the rest was not scheduled
+        """
+        i = 0
+        with self._cond:
+            while i < len(items):
+                self._cond.wait_for(lambda: self._stopped or len(self) < self.max_pending)
+                if self._stopped:
+                    return i
+                free = self.max_pending - len(self)
+                block = items[i:i + free]
+                due = max(time.monotonic() + self.hold_time, self._due[-1] if self._due else 0.0)
+                self._due.extend([due] * len(block))
+                self._items.extend(block)
+                i += free
+                self._cond.notify_all()
+                self._start()
+        return len(items)
+
+    def flush(self, timeout=None):
+        """
+        Release all held items now, without waiting for their hold time,
+        and block until they were passed to release().
+
+        :param timeout: Maximum seconds to wait (None = wait forever)
+        :return: True if the scheduler is empty, False on timeout or if it is stopped
+        """
+        with self._cond:
+            if self._stopped:
+                return len(self) == 0
+            self._flushing = True
+            self._cond.notify_all()
+            self._start()
+            try:
+                return self._cond.wait_for(lambda: len(self) == 0, timeout)
+            finally:
+                self._flushing = False
+
+    def start(self):
+        """
+        Start the scheduler thread (also started on the first schedule())
+        and accept new items again after stop().
+        """
+        with self._cond:
+            self._stopped = False
+            self._start()
+
+    def stop(self):
+        """
+        Stop the scheduler thread and refuse new items. Items that are not
+        due yet stay held and are released after the next start().
+        """
+        with self._cond:
+            self._stopped = True
+            self._generation += 1
+            self._cond.notify_all()
+            thread, self._thread = self._thread, None
+        if thread:
+            thread.join()
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(self._generation,),
+                                            name="delay-scheduler", daemon=True)
+            self._thread.start()
+
+    def _run(self, generation):
+        """
+        Scheduler thread: wait for the oldest item and release due items in batches.
+        Items of the batch being released still count towards max_pending,
+        so callers wait while the consumer is full.
+        """
+        while True:
+            with self._cond:
+                while self._generation == generation:
+                    if self._items:
+                        wait = self._due[0] - time.monotonic()
+                        if wait <= 0 or self._flushing:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if self._generation != generation:
+                    return
+
+                now = time.monotonic()
+                batch = []
+                while self._items and (self._due[0] <= now or self._flushing) and len(batch) < self.batch_size:
+                    self._due.popleft()
+                    batch.append(self._items.popleft())
+                self._in_flight = len(batch)
+
+            try:
+                self.release(batch)
+            except Exception as e:
+                if self.on_error is None:
+                    print("Error releasing delayed items:", e)
+                else:
+                    try:
+                        self.on_error(batch, e)
+                    except Exception as e:
+                        print("Error handling delayed items that failed to release:", e)
+
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
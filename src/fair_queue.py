@@ -0,0 +1,182 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from queue import Empty, Full
+
+
+class FairQueue:
+    """
+    Thread-safe priority queue with weighted fair queuing and aging.
+
+    Drop-in replacement for queue.Queue (put, get, get_nowait, qsize, ...).
+    Every item belongs to a priority class (1 = highest, 5 = lowest) and a
+    flow, e.g. the sender account. Items get a virtual finish time:
+
+        finish = max(virtual time, previous finish of the flow) + 1 / weight
+
+    and are served in finish time order. A class with twice the weight gets
+    twice the share, and inside a class every flow gets the same share, so
+    one bulk sender cannot starve the others.
+
+    Aging: an item that waited max_wait seconds is served next regardless
+    of its finish time, so low-priority items keep moving under load.
+
+    Attributes:
+    - maxsize: Maximum number of items (0 = unbounded), put() blocks when full
+    - weights: Dictionary mapping priority class to its weight
+    - max_wait: Seconds after which an item is served first (None = no aging)
+    """
+
+    DEFAULT_WEIGHTS = {1: 16, 2: 8, 3: 4, 4: 2, 5: 1}
+
+    def __init__(self, maxsize=0, weights=None, max_wait=1.0):
+        """
+        Initialize a new FairQueue instance.
+
+        :param maxsize: Maximum number of items (0 = unbounded)
+        :param weights: Dictionary mapping priority class to weight (default: DEFAULT_WEIGHTS)
+        :param max_wait: Seconds after which an item is served first (None = no aging)
+        """
+        self.maxsize = maxsize
+        self.weights = {int(p): w for p, w in (weights or self.DEFAULT_WEIGHTS).items()}
+        self.max_wait = max_wait
+
+        self._heap = []
+        self._arrivals = deque()
+        self._finish = {}
+        self._vtime = 0.0
+        self._size = 0
+        self._seq = itertools.count()
+
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._stats = {p: self._new_stats() for p in self.weights}
+
+    def qsize(self):
+        return self._size
+
+    def empty(self):
+        return self._size == 0
+
+    def full(self):
+        return 0 < self.maxsize <= self._size
+
+    def put(self, item, block=True, timeout=None, priority=3, flow=None):
+        """
+        Add an item.
+
+        :param item: Item to add
+        :param block: Wait for space when the queue is full
+        :param timeout: Maximum seconds to wait for space (None = wait forever)
+        :param priority: Priority class (a key of weights)
+        :param flow: Flow the item belongs to inside its class (e.g. sender ID)
+        :raises Full: If there was no space
+        :raises ValueError: If the priority class is unknown
+        """
+        weight = self.weights.get(priority)
+        if weight is None:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        with self._not_full:
+            if self.maxsize > 0:
+                if not block:
+                    if self._size >= self.maxsize:
+                        raise Full
+                elif not self._not_full.wait_for(lambda: self._size < self.maxsize, timeout):
+                    raise Full
+
+            key = (priority, flow)
+            finish = max(self._vtime, self._finish.get(key, 0.0)) + 1.0 / weight
+            self._finish[key] = finish
+            if len(self._finish) > 2 * self._size + 1024:
+                self._finish = {k: f for k, f in self._finish.items() if f > self._vtime}
+
+            # [finish, seq, item, priority, enqueue time, taken]
+            entry = [finish, next(self._seq), item, priority, time.monotonic(), False]
+            heapq.heappush(self._heap, entry)
+            self._arrivals.append(entry)
+            self._size += 1
+            self._stats[priority]["enqueued"] += 1
+            self._not_empty.notify()
+
+    def put_nowait(self, item, priority=3, flow=None):
+        return self.put(item, block=False, priority=priority, flow=flow)
+
+    def get(self, block=True, timeout=None):
+        """
+        Remove and return the next item.
+
+        :param block: Wait for an item when the queue is empty
+        :param timeout: Maximum seconds to wait (None = wait forever)
+        :return: Item
+        :raises Empty: If no item became available
+        """
+        with self._not_empty:
+            if not block:
+                if not self._size:
+                    raise Empty
+            elif not self._not_empty.wait_for(lambda: self._size, timeout):
+                raise Empty
+
+            while self._arrivals[0][5]:
+                self._arrivals.popleft()
+
+            now = time.monotonic()
+            aged = self.max_wait is not None and now - self._arrivals[0][4] >= self.max_wait
+            if aged:
+                entry = self._arrivals.popleft()
+            else:
+                entry = heapq.heappop(self._heap)
+                while entry[5]:
+                    entry = heapq.heappop(self._heap)
+                self._vtime = max(self._vtime, entry[0])
+
+            item = entry[2]
+            # Taken entries stay in the other container until popped lazily;
+            # they must not keep the item alive
+            entry[2] = None
+            entry[5] = True
+            self._size -= 1
+            if not self._size:
+                self._heap.clear()
+                self._arrivals.clear()
+
+            stats = self._stats[entry[3]]
+            wait = now - entry[4]
+            stats["dequeued"] += 1
+            stats["aged"] += aged
+            stats["wait_total"] += wait
+            stats["wait_max"] = max(stats["wait_max"], wait)
+
+            self._not_full.notify()
+            return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def stats(self):
+        """
+        Statistics per priority class.
+
+        :return: Dictionary mapping priority class to {"enqueued", "dequeued",
+            "waiting", "aged", "wait_avg", "wait_max"} (waits in seconds)
+        """
+        with self._lock:
+            result = {}
+            for priority, s in self._stats.items():
+                result[priority] = {
+                    "enqueued": s["enqueued"],
+                    "dequeued": s["dequeued"],
+                    "waiting": s["enqueued"] - s["dequeued"],
+                    "aged": s["aged"],
+                    "wait_avg": s["wait_total"] / s["dequeued"] if s["dequeued"] else 0.0,
+                    "wait_max": s["wait_max"],
+                }
+            return result
+
+    @staticmethod
+    def _new_stats():
+        return {"enqueued": 0, "dequeued": 0, "aged": 0, "wait_total": 0.0, "wait_max": 0.0}
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class IdempotencyCache:
+    """
+    Bounded, time-evicting map of client idempotency keys to transactions.
+
+    Keys are kept in insertion (= time) order, so expired and surplus keys
+    are always evicted from the front and lookups, inserts and evictions are
+    O(1). Every new key is appended to a JSON-lines file next to the
+    transactions log ({"key", "tx_id", "ts"}); load() rebuilds the cache
+    from it at startup and rewrites the file with the surviving keys only.
+    The file is also compacted while running once it holds twice max_keys lines.
+
+    Attributes:
+    - path: Path of the key file
+    - ttl: Seconds a key is remembered
+    - max_keys: Maximum number of keys remembered
+    - max_tx_id: Highest tx_id in the key file or put since, expired keys included
+    """
+
+    def __init__(self, path, ttl=86400, max_keys=100000):
+        """
+        Initialize a new IdempotencyCache instance.
+
+        :param path: Path of the key file
+        :param ttl: Seconds a key is remembered
+        :param max_keys: Maximum number of keys remembered
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.max_tx_id = 0
+
+        # key -> [tx_id, ts, TransactionHandle or None]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._file = None
+        self._lines = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        """
+        Read the key file, drop expired keys and compact the file.
+
+        :return: Number of keys loaded
+        """
+        entries = OrderedDict()
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    entries[record["key"]] = [record["tx_id"], record["ts"], None]
+                    entries.move_to_end(record["key"])
+                    self.max_tx_id = max(self.max_tx_id, record["tx_id"])
+                except (ValueError, KeyError, TypeError):
+                    # Torn last line after a crash
+                    continue
+
+        with self._lock:
+            self._entries = entries
+            self._evict(time.time())
+            self._compact()
+            return len(self._entries)
+
+    def get(self, key):
+        """
+        :param key: Idempotency key
+        :return: [tx_id, ts, handle] of the key, or None if unknown or expired;
+            the handle is None for keys loaded from the file
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.time() - self.ttl:
+                del self._entries[key]
+                return None
+            return entry
+
+    def put(self, key, tx_id, handle=None):
+        """
+        Remember a key. The record is buffered; call flush() to write it.
+        The key is only remembered once its record was written to the buffer.
+
+        :param key: Idempotency key
+        :param tx_id: ID of the transaction submitted with the key
+        :param handle: TransactionHandle of the transaction
+        :raises OSError: If the key file cannot be opened or written
+        """
+        now = time.time()
+        with self._lock:
+            if self._file is None:
+                self._make_folder()
+                self._file = open(self.path, "a")
+            self._file.write(json.dumps({"key": key, "tx_id": tx_id, "ts": now}) + "\n")
+            self._lines += 1
+            self._entries[key] = [tx_id, now, handle]
+            self._entries.move_to_end(key)
+            self.max_tx_id = max(self.max_tx_id, tx_id)
+            self._evict(now)
+            if self._lines > 2 * self.max_keys:
+                self._compact()
+
+    def forget(self, key):
+        """
+        Remove a key, e.g. one whose transaction was lost before it settled.
+
+        :param key: Idempotency key
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def flush(self):
+        """
+        Write buffered key records to the file.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        """
+        Flush and close the key file (it is reopened by the next put).
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _evict(self, now):
+        entries = self._entries
+        oldest = now - self.ttl
+        while entries and (len(entries) > self.max_keys or next(iter(entries.values()))[1] < oldest):
+            entries.popitem(last=False)
+
+    def _compact(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._make_folder()
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, "w") as f:
+            for key, (tx_id, ts, handle) in self._entries.items():
+                f.write(json.dumps({"key": key, "tx_id": tx_id, "ts": ts}) + "\n")
+        os.replace(tmp_file, self.path)
+        self._lines = len(self._entries)
+
+    def _make_folder(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
@@ -0,0 +1,379 @@
+"""
+Record formats of the transactions log file.
+
+    python -m src.log_format to-binary logs/transactions.log
+    python -m src.log_format to-jsonl logs/transactions.log logs/export.jsonl
+
+Convert the active log file only while the engine is stopped; it gets a new
+sidecar index on the next TransactionLog.load(). Sealed segments keep the
+format recorded in the segment manifest.
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+INDEX_RECORD = struct.Struct("<qqqq")
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# (epoch second, formatted timestamp) of the last log_timestamp() call
+_last_timestamp = (None, "")
+
+
+def log_timestamp(now=None):
+    """
+    Format a log entry timestamp ("%Y-%m-%d %H:%M:%S", local time).
+    The string of the current second is cached, so entries logged in the
+    same second share one string and strftime runs once per second.
+
+    :param now: Epoch seconds (default: time.time())
+    :return: Formatted timestamp
+    """
+    global _last_timestamp
+    second = int(time.time() if now is None else now)
+    last = _last_timestamp
+    if last[0] != second:
+        last = _last_timestamp = (second, time.strftime(TIMESTAMP_FORMAT, time.localtime(second)))
+    return last[1]
+
+
+class LogFormatException(Exception):
+    """
+    General exception for transaction log format errors.
+    """
+    pass
+
+
+class JsonLinesFormat:
+    """
+    One JSON object per line, the original transactions log format.
+    """
+
+    name = "jsonl"
+
+    def encode(self, entry):
+        """
+        :param entry: Log entry dictionary
+        :return: Encoded record (bytes)
+        """
+        return (json.dumps(entry) + "\n").encode()
+
+    def record_end(self, buf, offset):
+        """
+        :param buf: Bytes, mmap or memoryview of a log file
+        :param offset: Offset of a record
+        :return: Offset after the record, -1 if the record is incomplete
+        """
+        end = buf.find(b"\n", offset)
+        return -1 if end < 0 else end + 1
+
+    def decode(self, buf, offset):
+        """
+        :param buf: Bytes, mmap or memoryview of a log file
+        :param offset: Offset of a record
+        :return: Entry dictionary, or None if there is no complete entry at offset
+        """
+        end = buf.find(b"\n", offset)
+        if end < 0:
+            return None
+        try:
+            return json.loads(buf[offset:end])
+        except json.JSONDecodeError:
+            return None
+
+    def is_pending(self, record):
+        """
+        :param record: Encoded record (bytes)
+        :return: True for the record of a "pending" entry
+        """
+        return b'"status": "pending"' in record
+
+    def index(self, path, offset=0):
+        """
+        Build sidecar index records for the complete records of a log file.
+
+        :param path: Path of the log file
+        :param offset: File offset to start at
+        :return: Packed index records (bytes)
+        """
+        data = []
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    e = json.loads(line)
+                    data.append(INDEX_RECORD.pack(e["tx_id"], e["from"], e["to"], offset))
+                except (json.JSONDecodeError, KeyError, TypeError, struct.error):
+                    pass
+                offset += len(line)
+        return b"".join(data)
+
+    def entries(self, path):
+        """
+        :param path: Path of the log file
+        :return: Generator of the entry dictionaries of the file
+        """
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def repair(self, path):
+        """
+        Prepare a log file for appending. Torn JSON lines are skipped by readers.
+        """
+        pass
+
+
+class BinaryFormat:
+    """
+    Fixed-width binary records of RECORD.size (48) bytes:
+    magic b"TX", status code, reason code, tx_id, from, to, amount and the
+    timestamp in epoch seconds.
+
+    Statuses are a fixed enum. Reasons are interned: the built-in REASONS
+    have fixed codes, any other reason gets the next free code, appended to
+    a JSON-lines sidecar (reasons_path) before the first record using it.
+    Entries decode to the same dictionaries as the JSON-lines format; the
+    epoch is formatted as the usual "%Y-%m-%d %H:%M:%S" local time.
+
+    records() iterates over raw record tuples straight from a memoryview or
+    mmap, without copying or building dictionaries.
+
+    Attributes:
+    - reasons_path: Path of the reason sidecar (None = built-in reasons only)
+    """
+
+    name = "binary"
+    MAGIC = b"TX"
+    RECORD = struct.Struct("<2sBH3xqqqqq")
+    STATUSES = ("pending", "approved", "declined", "rejected")
+    REASONS = ("", "completed", "insufficient_funds", "internal_error", "processing", "Completed",
+               "unverified_limit", "velocity_limit", "new_payee_limit", "fan_out")
+    NO_REASON = 0xFFFF
+
+    def __init__(self, reasons_path=None):
+        """
+        Initialize a new BinaryFormat instance.
+
+        :param reasons_path: Path of the reason sidecar
+        """
+        self.reasons_path = reasons_path
+        self._status_codes = {status: code for code, status in enumerate(self.STATUSES)}
+        self._reasons = list(self.REASONS)
+        self._reason_codes = {reason: code for code, reason in enumerate(self._reasons)}
+        self._lock = threading.Lock()
+        self._parsed = (None, 0)
+        self._load_reasons()
+
+    def encode(self, entry):
+        reason = entry["reason"]
+        code = self.NO_REASON if reason is None else self._reason_codes.get(reason)
+        if code is None:
+            code = self._intern(reason)
+        try:
+            status = self._status_codes[entry["status"]]
+        except KeyError:
+            raise LogFormatException(f"Unknown status: {entry['status']}")
+        return self.RECORD.pack(self.MAGIC, status, code, entry["tx_id"], entry["from"], entry["to"],
+                                entry["amount"], self._epoch(entry["timestamp"]))
+
+    def record_end(self, buf, offset):
+        end = offset + self.RECORD.size
+        return -1 if end > len(buf) else end
+
+    def decode(self, buf, offset):
+        if offset + self.RECORD.size > len(buf):
+            return None
+        magic, status, reason, tx_id, from_acc, to_acc, amount, ts = self.RECORD.unpack_from(buf, offset)
+        if magic != self.MAGIC or status >= len(self.STATUSES):
+            return None
+        return {
+            "timestamp": self._timestamp(ts),
+            "tx_id": tx_id,
+            "from": from_acc,
+            "to": to_acc,
+            "amount": amount,
+            "status": self.STATUSES[status],
+            "reason": self._reason(reason),
+        }
+
+    def is_pending(self, record):
+        return record[2] == 0
+
+    def records(self, buf, offset=0):
+        """
+        Iterate over the complete records of a buffer without copying it.
+
+        :param buf: Bytes, mmap or memoryview of a log file
+        :param offset: Offset of the first record
+        :return: Iterator of (magic, status code, reason code, tx_id, from, to, amount, epoch)
+        """
+        end = offset + (len(buf) - offset) // self.RECORD.size * self.RECORD.size
+        return self.RECORD.iter_unpack(memoryview(buf)[offset:end])
+
+    def index(self, path, offset=0):
+        size = os.path.getsize(path)
+        if size - offset < self.RECORD.size:
+            return b""
+        data = []
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for record in self.records(m, offset):
+                if record[0] == self.MAGIC:
+                    data.append(INDEX_RECORD.pack(record[3], record[4], record[5], offset))
+                offset += self.RECORD.size
+        return b"".join(data)
+
+    def entries(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        for offset in range(0, len(data) - self.RECORD.size + 1, self.RECORD.size):
+            entry = self.decode(data, offset)
+            if entry is not None:
+                yield entry
+
+    def repair(self, path):
+        """
+        Cut a torn last record (crash during a write), so appended records
+        stay aligned to RECORD.size.
+        """
+        if os.path.exists(path):
+            torn = os.path.getsize(path) % self.RECORD.size
+            if torn:
+                with open(path, "r+b") as f:
+                    f.truncate(os.path.getsize(path) - torn)
+
+    def _epoch(self, timestamp):
+        """
+        Epoch seconds of a timestamp string; consecutive entries mostly share
+        the same second, so the last conversion is cached.
+        """
+        if not isinstance(timestamp, str):
+            return int(timestamp)
+        parsed = self._parsed
+        if parsed[0] != timestamp:
+            parsed = self._parsed = (timestamp, int(time.mktime(time.strptime(timestamp, TIMESTAMP_FORMAT))))
+        return parsed[1]
+
+    def _timestamp(self, ts):
+        return log_timestamp(ts)
+
+    def _reason(self, code):
+        if code == self.NO_REASON:
+            return None
+        if code >= len(self._reasons):
+            self._load_reasons()
+        return self._reasons[code] if code < len(self._reasons) else f"reason_{code}"
+
+    def _intern(self, reason):
+        with self._lock:
+            code = self._reason_codes.get(reason)
+            if code is None:
+                if self.reasons_path is None:
+                    raise LogFormatException(f"Unknown reason without a reason file: {reason}")
+                code = len(self._reasons)
+                if code >= self.NO_REASON:
+                    raise LogFormatException("Too many distinct reasons.")
+                with open(self.reasons_path, "a") as f:
+                    f.write(json.dumps(reason) + "\n")
+                self._reasons.append(reason)
+                self._reason_codes[reason] = code
+            return code
+
+    def _load_reasons(self):
+        if self.reasons_path is None or not os.path.exists(self.reasons_path):
+            return
+        with self._lock:
+            with open(self.reasons_path, "r") as f:
+                lines = f.readlines()
+            for line in lines[len(self._reasons) - len(self.REASONS):]:
+                try:
+                    reason = json.loads(line)
+                except ValueError:
+                    # Torn last line after a crash
+                    break
+                self._reason_codes[reason] = len(self._reasons)
+                self._reasons.append(reason)
+
+
+def open_formats(path):
+    """
+    :param path: Path of the transactions log file
+    :return: Dictionary {format name: format} sharing the reason sidecar of path
+    """
+    return {"jsonl": JsonLinesFormat(), "binary": BinaryFormat(path + ".reasons")}
+
+
+def detect_format(path):
+    """
+    :param path: Path of a log file
+    :return: Name of the format of the file, None if it is missing or empty
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(len(BinaryFormat.MAGIC))
+    except FileNotFoundError:
+        return None
+    if not head:
+        return None
+    return BinaryFormat.name if head == BinaryFormat.MAGIC else JsonLinesFormat.name
+
+
+def convert(source, target, to_format):
+    """
+    Convert a log file to another format. The reason sidecar of a binary
+    file is <file>.reasons.
+
+    :param source: Path of the log file to read
+    :param target: Path of the converted file (replaced)
+    :param to_format: "jsonl" or "binary"
+    :return: Number of converted entries
+    :raises LogFormatException: If to_format is unknown or source is empty
+    """
+    from_format = detect_format(source)
+    if from_format is None:
+        raise LogFormatException(f"Empty or missing log file: {source}")
+    reader = open_formats(source)[from_format]
+    formats = open_formats(target)
+    if to_format not in formats:
+        raise LogFormatException(f"Unknown log format: {to_format}")
+    writer = formats[to_format]
+
+    count = 0
+    tmp = target + ".tmp"
+    with open(tmp, "wb") as f:
+        for entry in reader.entries(source):
+            f.write(writer.encode(entry))
+            count += 1
+    os.replace(tmp, target)
+    if os.path.exists(target + ".idx"):
+        os.remove(target + ".idx")
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a transactions log between JSON lines and binary.")
+    parser.add_argument("command", choices=("to-binary", "to-jsonl"))
+    parser.add_argument("source", help="Log file to read")
+    parser.add_argument("target", nargs="?", help="Converted log file to write (default: replace source)")
+    args = parser.parse_args(argv)
+    target = args.target or args.source
+    try:
+        count = convert(args.source, target, args.command[3:])
+    except Exception as e:
+        print("Error converting transactions log:", e)
+        return 1
+    print(f"Converted {count} entries to {target}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,431 @@
+import base64
+import bisect
+import gzip
+import json
+import mmap
+import os
+import time
+
+from src.log_format import INDEX_RECORD
+
+MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+class SegmentException(Exception):
+    """
+    General exception for transaction log segment errors.
+    """
+    pass
+
+
+class BloomFilter:
+    """
+    Bloom filter over integer account IDs.
+
+    Positions are derived by double hashing two 64-bit mixes of the ID, so
+    the filter does not depend on Python's hash() and can be stored in the
+    segment manifest (see to_dict/from_dict).
+
+    Attributes:
+    - bits: Number of bits of the filter
+    - hashes: Number of bit positions set per ID
+    """
+
+    def __init__(self, bits=8192, hashes=7, data=None):
+        """
+        Initialize a new BloomFilter instance.
+
+        :param bits: Number of bits of the filter
+        :param hashes: Number of bit positions set per ID
+        :param data: Existing filter bytes (e.g. from the manifest)
+        """
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+
+    @classmethod
+    def for_items(cls, items, bits_per_item=10, hashes=7):
+        """
+        Build a filter sized for a set of IDs (about 1% false positives).
+
+        :param items: Iterable of integer IDs
+        :param bits_per_item: Filter bits per distinct ID
+        :param hashes: Number of bit positions set per ID
+        :return: BloomFilter holding all items
+        """
+        items = set(items)
+        bloom = cls(max(64, len(items) * bits_per_item), hashes)
+        for item in items:
+            bloom.add(item)
+        return bloom
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["bits"], d["hashes"], base64.b64decode(d["data"]))
+
+    def to_dict(self):
+        return {"bits": self.bits, "hashes": self.hashes, "data": base64.b64encode(bytes(self.data)).decode()}
+
+    def _positions(self, item):
+        h1 = (int(item) * 0x9E3779B97F4A7C15) & MASK64
+        h2 = (((h1 ^ (h1 >> 31)) * 0xBF58476D1CE4E5B9) & MASK64) | 1
+        return [((h1 + i * h2) & MASK64) % self.bits for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.data[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.data[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class Segment:
+    """
+    Sealed segment of the transactions log.
+
+    A segment is a former active log file renamed to "<log>.<seq>", with its
+    own sidecar index "<log>.<seq>.idx" (same records as TransactionLog, file
+    offsets relative to the segment). Its manifest entry (`info`) holds:
+    - name: File name of the segment
+    - records: Number of index records
+    - tx_min, tx_max: Range of the tx_ids in the segment
+    - first_offset, last_offset: Offsets of the first and last entry
+    - bytes: Size of the (uncompressed) entries
+    - created, sealed_at: Epoch seconds of the first entry and of the roll
+    - format: Record format of the entries ("jsonl" or "binary")
+    - compacted, compressed: Whether seal() has run
+    - blocks: [offset, compressed offset] of each gzip member of a
+      compressed segment; members hold whole entries, so a read
+      decompresses only the member of its entry
+    - bloom: BloomFilter of the account IDs (senders and receivers)
+
+    Until seal() has run only name, records, created and sealed_at are known;
+    lookups then treat the segment as possibly matching anything.
+
+    Index records of compacted (superseded pending) entries are kept with
+    offset -1, so record numbers never change once written.
+
+    The manifest is the commit point of seal(): the new files are written
+    as temporary files, the manifest is saved with the new entry and only
+    then are the files renamed. recover() finishes or discards a swap
+    interrupted by a crash.
+
+    Attributes:
+    - folder: Folder of the transactions log
+    - info: Manifest entry dictionary
+    - log_format: JsonLinesFormat or BinaryFormat of the entries
+    - first_record: Global index record number of the first record
+    """
+
+    BLOCK_BYTES = 65536
+
+    def __init__(self, folder, info, log_format, first_record=0):
+        """
+        Initialize a new Segment instance.
+
+        :param folder: Folder of the transactions log
+        :param info: Manifest entry dictionary
+        :param log_format: JsonLinesFormat or BinaryFormat of the entries
+        :param first_record: Global index record number of the first record
+        """
+        self.folder = folder
+        self.info = info
+        self.log_format = log_format
+        self.first_record = first_record
+        self._index = None
+        self._data = None
+        self._block = None
+        self._bloom = None
+
+    @property
+    def path(self):
+        return os.path.join(self.folder, self.info["name"])
+
+    @property
+    def index_path(self):
+        return self.path + ".idx"
+
+    @property
+    def data_path(self):
+        return self.path + ".gz" if self.info.get("compressed") else self.path
+
+    @property
+    def records(self):
+        return self.info["records"]
+
+    @property
+    def sealed(self):
+        return "tx_min" in self.info
+
+    def holds_tx(self, tx_id):
+        """
+        :return: False if tx_id is surely not in the segment
+        """
+        if not self.sealed:
+            return True
+        return self.info["tx_min"] <= tx_id <= self.info["tx_max"]
+
+    def holds_account(self, acc_id):
+        """
+        :return: False if the account surely has no entries in the segment
+        """
+        if "bloom" not in self.info:
+            return True
+        if self._bloom is None:
+            self._bloom = BloomFilter.from_dict(self.info["bloom"])
+        return acc_id in self._bloom
+
+    def record(self, i):
+        """
+        :param i: Record number within the segment
+        :return: Index record (tx_id, from, to, offset)
+        """
+        return INDEX_RECORD.unpack_from(self._index_view(), i * INDEX_RECORD.size)
+
+    def iter_records(self, start=0):
+        """
+        :param start: Record number within the segment to start at
+        :return: Iterator of index records (tx_id, from, to, offset)
+        """
+        return INDEX_RECORD.iter_unpack(self._index_view()[start * INDEX_RECORD.size:])
+
+    def max_tx_id(self, start=0):
+        if start == 0 and self.sealed:
+            return self.info["tx_max"]
+        return max((record[0] for record in self.iter_records(start)), default=0)
+
+    def account_offsets(self, acc_id):
+        """
+        :return: Offsets of the entries of an account in the segment, oldest first
+        """
+        return [offset for tx_id, from_acc, to_acc, offset in self.iter_records()
+                if offset >= 0 and (from_acc == acc_id or to_acc == acc_id)]
+
+    def read(self, offset):
+        """
+        Read one entry. Of a compressed segment only the gzip member holding
+        the entry is decompressed and kept until the next member is needed;
+        segments compressed without members are decompressed whole. Call
+        release() to drop the decompressed data.
+
+        :param offset: Offset of the entry within the segment
+        :return: Entry dictionary, or None for compacted or unreadable records
+        """
+        if offset < 0:
+            return None
+        blocks = self.info.get("blocks") if self.info.get("compressed") else None
+        if not blocks:
+            return self.log_format.decode(self.data(), offset)
+        i = bisect.bisect_right(blocks, [offset, float("inf")]) - 1
+        if i < 0:
+            return None
+        if self._block is None or self._block[0] != i:
+            self._block = (i, self._read_block(blocks, i))
+        return self.log_format.decode(self._block[1], offset - blocks[i][0])
+
+    def data(self):
+        if self._data is None:
+            if self.info.get("compressed"):
+                with open(self.data_path, "rb") as f:
+                    self._data = gzip.decompress(f.read())
+            else:
+                self._data = _map_file(self.data_path)
+        return self._data
+
+    def _read_block(self, blocks, i):
+        start = blocks[i][1]
+        with open(self.data_path, "rb") as f:
+            f.seek(start)
+            if i + 1 < len(blocks):
+                return gzip.decompress(f.read(blocks[i + 1][1] - start))
+            return gzip.decompress(f.read())
+
+    def release(self):
+        """
+        Drop the memory map or decompressed copy of the entries and the index map.
+        """
+        for m in (self._data, self._index):
+            if isinstance(m, mmap.mmap):
+                m.close()
+        self._data = None
+        self._block = None
+        self._index = None
+
+    def _index_view(self):
+        if self._index is None:
+            self._index = _map_file(self.index_path)
+        return self._index
+
+    def seal(self, compress=True):
+        """
+        Compute the manifest summary (tx range, offsets, bloom filter), drop
+        pending entries superseded by a final entry of the same transaction
+        in the segment and write the compressed (or compacted) copy.
+
+        Runs on the background sealing thread and only writes temporary
+        files; commit() makes them visible. The compressed copy is a series
+        of gzip members of about BLOCK_BYTES of whole entries each.
+
+        :param compress: Write a gzip copy of the entries
+        :return: (manifest entry with the summary, list of (tmp path, final path))
+        """
+        with open(self.path, "rb") as f:
+            data = f.read()
+        with open(self.index_path, "rb") as f:
+            records = list(INDEX_RECORD.iter_unpack(f.read()))
+
+        is_pending = self.log_format.is_pending
+        lines = []
+        for tx_id, from_acc, to_acc, offset in records:
+            end = self.log_format.record_end(data, offset) if offset >= 0 else -1
+            lines.append(data[offset:end] if end >= 0 else None)
+
+        settled = {record[0] for record, line in zip(records, lines) if line is not None and not is_pending(line)}
+        kept = []
+        offsets = []
+        new_records = []
+        offset = 0
+        for record, line in zip(records, lines):
+            if line is None or (record[0] in settled and is_pending(line)):
+                new_records.append(INDEX_RECORD.pack(record[0], record[1], record[2], -1))
+                continue
+            kept.append(line)
+            offsets.append(offset)
+            new_records.append(INDEX_RECORD.pack(record[0], record[1], record[2], offset))
+            offset += len(line)
+        compacted = new_records != [INDEX_RECORD.pack(*record) for record in records]
+        if compacted:
+            data = b"".join(kept)
+
+        info = dict(self.info)
+        info.update({
+            "tx_min": min((r[0] for r in records), default=0),
+            "tx_max": max((r[0] for r in records), default=0),
+            "first_offset": offsets[0] if offsets else -1,
+            "last_offset": offsets[-1] if offsets else -1,
+            "bytes": len(data),
+            "compacted": True,
+            "compressed": compress,
+            "bloom": BloomFilter.for_items(acc for r in records for acc in r[1:3]).to_dict(),
+        })
+
+        files = []
+        if compacted:
+            files.append(_write_tmp(self.index_path, b"".join(new_records)))
+        if compress:
+            compressed, info["blocks"] = _compress_blocks(kept, self.BLOCK_BYTES)
+            files.append(_write_tmp(self.path + ".gz", compressed))
+        elif compacted:
+            files.append(_write_tmp(self.path, data))
+        return info, files
+
+    def commit(self, info, files, save_manifest):
+        """
+        Adopt the new manifest entry written by seal(), save the manifest
+        and then replace the segment files with the temporary ones. The
+        caller removes the uncompressed file afterwards (see remove_plain()).
+
+        :param info: Manifest entry returned by seal()
+        :param files: List of (tmp path, final path) returned by seal()
+        :param save_manifest: Function saving the manifest of all segments
+        """
+        self.release()
+        previous, self.info = self.info, info
+        try:
+            save_manifest()
+        except Exception:
+            self.info = previous
+            for tmp, path in files:
+                os.remove(tmp)
+            raise
+        self._bloom = None
+        for tmp, path in files:
+            os.replace(tmp, path)
+
+    def recover(self):
+        """
+        Finish a commit() interrupted after the manifest was saved, or drop
+        the temporary files of a seal() that was not committed.
+        """
+        done = {self.index_path: self.info.get("compacted"),
+                self.path: self.info.get("compacted") and not self.info.get("compressed"),
+                self.path + ".gz": self.info.get("compressed")}
+        for path, committed in done.items():
+            tmp = path + ".tmp"
+            if os.path.exists(tmp):
+                if committed:
+                    os.replace(tmp, path)
+                else:
+                    os.remove(tmp)
+
+    def remove_plain(self):
+        if self.info.get("compressed") and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _map_file(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _compress_blocks(lines, block_bytes):
+    """
+    :return: (gzip members of about block_bytes of lines each, [offset, compressed offset] of each member)
+    """
+    members = []
+    blocks = []
+    chunk = []
+    size = offset = compressed = 0
+    for i, line in enumerate(lines):
+        chunk.append(line)
+        size += len(line)
+        if size >= block_bytes or i == len(lines) - 1:
+            member = gzip.compress(b"".join(chunk), 6)
+            blocks.append([offset, compressed])
+            members.append(member)
+            offset += size
+            compressed += len(member)
+            chunk = []
+            size = 0
+    return b"".join(members), blocks
+
+
+def _write_tmp(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp, path
+
+
+def read_manifest(path):
+    """
+    :param path: Path of the manifest file
+    :return: List of manifest entries, oldest segment first ([] if missing)
+    :raises SegmentException: If the manifest cannot be parsed
+    """
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, "r") as f:
+            return json.load(f)["segments"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise SegmentException(f"Invalid segment manifest {path}: {e}")
+
+
+def write_manifest(path, segments):
+    """
+    Atomically replace the manifest with the entries of segments.
+
+    :param path: Path of the manifest file
+    :param segments: List of Segment, oldest first
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"version": 1, "updated": time.time(), "segments": [s.info for s in segments]}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
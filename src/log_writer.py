@@ -0,0 +1,259 @@
+import os
+import threading
+import time
+from queue import Queue, Empty
+
+from src.log_format import JsonLinesFormat
+
+
+class LogWriterException(Exception):
+    """
+    General exception for transaction log writer errors.
+    """
+    pass
+
+
+class LogWriter:
+    """
+    Dedicated writer thread for the transactions log file.
+
+    Entries are queued by write() and the writer thread drains them in
+    batches, encodes each batch (JSON lines or binary records, see
+    log_format) and writes it to a file that stays open. Payment workers
+    only pay for a Queue.put.
+
+    Flush policies:
+    - "batch": flush the file after every batch
+    - "interval": flush at most every flush_interval seconds (and when idle)
+    - "fsync": flush and fsync after every batch
+
+    Attributes:
+    - path: Path of the transactions log file
+    - log_format: JsonLinesFormat or BinaryFormat encoding the entries
+    - on_written: Optional callable(entries, offsets) called after each batch
+      with the file offset of every entry (used for the log index)
+    - should_roll: Optional callable(file size) called after each batch; when it
+      returns True the file is closed and on_roll() is called (log segments)
+    - on_roll: Callable() that moves the closed file away; the next batch
+      starts a new file
+    - batch_size: Maximum number of entries encoded and written at once
+    - flush_policy: One of "batch", "interval", "fsync"
+    - flush_interval: Seconds between flushes for the "interval" policy
+    - write_latency: Optional histogram (observe(seconds)) of batch encode + write times
+    - flush_latency: Optional histogram of flush (and fsync) times
+    """
+
+    POLICIES = ("batch", "interval", "fsync")
+
+    def __init__(self, path, batch_size=1024, flush_policy="interval", flush_interval=0.05, on_written=None,
+                 should_roll=None, on_roll=None, log_format=None):
+        """
+        Initialize a new LogWriter instance.
+
+        :param path: Path of the transactions log file
+        :param batch_size: Maximum number of entries written at once
+        :param flush_policy: One of "batch", "interval", "fsync"
+        :param flush_interval: Seconds between flushes for the "interval" policy
+        :param on_written: Callable(entries, offsets) called after each written batch
+        :param should_roll: Callable(file size) deciding after each batch whether to roll the file
+        :param on_roll: Callable() called after the file was closed for a roll
+        :param log_format: Record format (default: JsonLinesFormat)
+        :raises LogWriterException: If flush_policy is unknown
+        """
+        if flush_policy not in self.POLICIES:
+            raise LogWriterException(f"Unknown flush policy: {flush_policy}")
+
+        self.path = path
+        self.log_format = log_format or JsonLinesFormat()
+        self.batch_size = batch_size
+        self.flush_policy = flush_policy
+        self.flush_interval = flush_interval
+        self.on_written = on_written
+        self.should_roll = should_roll
+        self.on_roll = on_roll
+        self.write_latency = None
+        self.flush_latency = None
+
+        self._queue = Queue()
+        self._writer = None
+        self._start_lock = threading.Lock()
+        self._file = None
+
+    def write(self, entry):
+        """
+        Queue one log entry for writing.
+
+        :param entry: Log entry dictionary
+        """
+        self._start_writer()
+        self._queue.put(entry)
+
+    def flush(self, timeout=None):
+        """
+        Block until every entry queued before this call is written and flushed.
+
+        :param timeout: Maximum seconds to wait (None = wait forever)
+        :return: True if the barrier was reached, False on timeout
+        """
+        if self._writer is None:
+            return True
+
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """
+        Write all queued entries, close the file and stop the writer thread.
+        The writer restarts on the next write().
+        """
+        with self._start_lock:
+            writer = self._writer
+            if writer is None:
+                return
+            self._queue.put(None)
+            writer.join()
+            self._writer = None
+
+    def _start_writer(self):
+        if self._writer is None:
+            with self._start_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="log-writer", daemon=True)
+                    self._writer.start()
+
+    def _open(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.log_format.repair(self.path)
+        self._file = open(self.path, "ab")
+
+    def _write_loop(self):
+        """
+        Writer thread: drain up to batch_size entries, write them and apply
+        the flush policy. Events in the queue are flush barriers, None stops the thread.
+        """
+        dirty = False
+        last_flush = time.monotonic()
+
+        while True:
+            timeout = None
+            if dirty:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except Empty:
+                self._flush()
+                dirty = False
+                last_flush = time.monotonic()
+                continue
+
+            batch = []
+            barriers = []
+            stop = False
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    barriers.append(item)
+                else:
+                    batch.append(item)
+
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except Empty:
+                    break
+
+            if batch:
+                self._write(batch)
+                dirty = True
+
+            if barriers or stop or self.flush_policy != "interval" or \
+                    (dirty and time.monotonic() - last_flush >= self.flush_interval):
+                if dirty:
+                    self._flush()
+                    dirty = False
+                    last_flush = time.monotonic()
+                for barrier in barriers:
+                    barrier.set()
+
+            if stop:
+                if self._file:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        encode = self.log_format.encode
+        try:
+            lines = [encode(entry) for entry in batch]
+        except Exception:
+            batch, lines = self._encode_each(batch)
+            if not batch:
+                return
+        try:
+            if self._file is None:
+                self._open()
+            offset = self._file.tell()
+            self._file.write(b"".join(lines))
+        except Exception as e:
+            print("Error writing to transactions log:", e)
+            return
+        if self.write_latency is not None:
+            self.write_latency.observe(time.perf_counter() - start)
+
+        if self.on_written:
+            offsets = []
+            for line in lines:
+                offsets.append(offset)
+                offset += len(line)
+            try:
+                self.on_written(batch, offsets)
+            except Exception as e:
+                print("Error indexing transactions log:", e)
+
+        if self.on_roll and self.should_roll and self.should_roll(self._file.tell()):
+            self._roll()
+
+    def _encode_each(self, batch):
+        """
+        Encode the entries of a batch one by one, skipping and reporting the
+        ones that cannot be encoded.
+
+        :return: (encodable entries, their encoded records)
+        """
+        kept = []
+        lines = []
+        for entry in batch:
+            try:
+                lines.append(self.log_format.encode(entry))
+            except Exception as e:
+                print("Error encoding transactions log entry:", e, entry)
+                continue
+            kept.append(entry)
+        return kept, lines
+
+    def _roll(self):
+        try:
+            self._flush()
+            self._file.close()
+            self._file = None
+            self.on_roll()
+        except Exception as e:
+            print("Error rolling transactions log:", e)
+
+    def _flush(self):
+        try:
+            if self._file:
+                start = time.perf_counter()
+                self._file.flush()
+                if self.flush_policy == "fsync":
+                    os.fsync(self._file.fileno())
+                if self.flush_latency is not None:
+                    self.flush_latency.observe(time.perf_counter() - start)
+        except Exception as e:
+            print("Error flushing transactions log:", e)
@@ -0,0 +1,264 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+
+class Counter:
+    """
+    Monotonic counter.
+    """
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """
+    Value read from a callable when the metrics are collected, so the hot
+    path pays nothing (e.g. queue depths).
+    """
+
+    def __init__(self, read):
+        self.read = read
+
+    @property
+    def value(self):
+        try:
+            return self.read()
+        except Exception:
+            return None
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram of durations in seconds.
+    """
+
+    DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                       0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or self.DEFAULT_BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    @property
+    def value(self):
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        cumulative = 0
+        buckets = {}
+        for bound, n in zip(self.buckets + ("+Inf",), counts):
+            cumulative += n
+            buckets[str(bound)] = cumulative
+        return {"count": count, "sum": total, "buckets": buckets}
+
+
+class TimedLock:
+    """
+    Lock that records how long threads waited for it.
+
+    The lock is first tried without blocking; only a contended acquisition
+    is timed, so an uncontended lock costs one extra call.
+    """
+
+    def __init__(self, wait_histogram, lock=None):
+        """
+        :param wait_histogram: Histogram receiving the wait time of contended acquisitions
+        :param lock: Lock to wrap (default: a new threading.Lock)
+        """
+        self.lock = lock or threading.Lock()
+        self.wait_histogram = wait_histogram
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self.lock.acquire(False):
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self.lock.acquire(True, timeout)
+        self.wait_histogram.observe(time.perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def locked(self):
+        return self.lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class MetricsRegistry:
+    """
+    Registry of named metrics with labels.
+
+    Metrics are created once (counter/histogram/gauge return the existing
+    metric for the same name and labels) and updated by the workers. The
+    current values are available as a dictionary (snapshot), as JSON or in
+    the Prometheus text format, written to a file or served over HTTP.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help="", **labels):
+        """
+        :param name: Metric name
+        :param help: Description
+        :param labels: Label values
+        :return: Counter
+        """
+        return self._get(name, "counter", help, labels, Counter)
+
+    def histogram(self, name, help="", buckets=None, **labels):
+        """
+        :param name: Metric name
+        :param help: Description
+        :param buckets: Upper bounds of the buckets in seconds
+        :param labels: Label values
+        :return: Histogram
+        """
+        return self._get(name, "histogram", help, labels, lambda: Histogram(buckets))
+
+    def gauge(self, name, read, help="", **labels):
+        """
+        :param name: Metric name
+        :param read: Callable returning the current value
+        :param help: Description
+        :param labels: Label values
+        :return: Gauge
+        """
+        return self._get(name, "gauge", help, labels, lambda: Gauge(read))
+
+    def snapshot(self):
+        """
+        :return: Dictionary {name: {"type", "help", "values": [{"labels", "value"}]}}
+        """
+        with self._lock:
+            items = list(self._metrics.items())
+        result = {}
+        for (name, labels), (kind, metric) in sorted(items, key=lambda item: item[0]):
+            entry = result.setdefault(name, {"type": kind, "help": self._help.get(name, ""), "values": []})
+            entry["values"].append({"labels": dict(labels), "value": metric.value})
+        return result
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """
+        :return: Metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for name, entry in self.snapshot().items():
+            if entry["help"]:
+                lines.append(f"# HELP {name} {entry['help']}")
+            lines.append(f"# TYPE {name} {entry['type']}")
+            for sample in entry["values"]:
+                labels, value = sample["labels"], sample["value"]
+                if entry["type"] == "histogram":
+                    for bound, count in value["buckets"].items():
+                        lines.append(f"{name}_bucket{self._labels(labels, le=bound)} {count}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {value['sum']}")
+                    lines.append(f"{name}_count{self._labels(labels)} {value['count']}")
+                elif value is not None:
+                    lines.append(f"{name}{self._labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, fmt="prometheus"):
+        """
+        Write the metrics to a file (replaced atomically).
+
+        :param path: Path of the file
+        :param fmt: "prometheus" or "json"
+        """
+        text = self.to_json() if fmt == "json" else self.to_prometheus()
+        tmp_file = path + ".tmp"
+        with open(tmp_file, "w") as f:
+            f.write(text)
+        os.replace(tmp_file, path)
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serve the metrics over HTTP in a background thread:
+        /metrics (Prometheus text) and /metrics.json.
+
+        :param port: TCP port (0 = any free port)
+        :param host: Address to bind, local only by default
+        :return: ThreadingHTTPServer; call shutdown() and server_close() to stop it
+        """
+        # Imported here: http.server is slow to import and only needed when serving
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = registry.to_prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = registry.to_json(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+    def _get(self, name, kind, help, labels, create):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = (kind, create())
+                    if help:
+                        self._help[name] = help
+        return metric[1]
+
+    @staticmethod
+    def _labels(labels, **extra):
+        items = list(labels.items()) + list(extra.items())
+        if not items:
+            return ""
+        return "{" + ",".join(f'{k}="{MetricsRegistry._escape(v)}"' for k, v in items) + "}"
+
+    @staticmethod
+    def _escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -1,7 +1,16 @@
-import time
 import threading
-from queue import Queue
+from collections import deque
+from contextlib import nullcontext
 from src.transaction import Transaction
+from src.balance_journal import BalanceJournal
+from src.log_writer import LogWriter
+from src.account_store import AccountStore
+from src.balance_snapshot import BalanceVersions
+from src.transaction_log import TransactionLog
+from src.antifraud_rules import RuleEngine, build_rules, DEFAULT_RULES
+from src.fair_queue import FairQueue
+from src.recovery import AccountSnapshot
+from src.metrics import MetricsRegistry, TimedLock
 import json
 import os
 
@@ -38,92 +47,441 @@ class PaymentsCore:
             :type max: int
 
             Attributes:
-            - queue_payment: PriorityQueue to hold incoming transactions.
+            - queue_payment: FairQueue (priority classes, fair per sender, aging) to hold incoming transactions.
             - stop_event: threading.Event used to signal worker threads to stop.
-            - accounts: Dictionary mapping account IDs to Account instances.
+            - accounts: AccountStore mapping account IDs to Account views (striped locks).
             - accounts_lock: Lock to synchronize access to accounts dictionary.
-            - transactions_log: List to store all transaction records.
+            - transactions_log: TransactionLog keeping the recent entries in memory
+              and older ones on disk in rolled, compressed segments behind sidecar indexes.
             - log_lock: Lock to synchronize access to transactions_log.
+            - journal: BalanceJournal with group commit; users.json is only a periodic checkpoint.
+            - journal_error: First failed journal write; once set no payment is settled any more (see journal_failed()).
+            - snapshot: AccountSnapshot written with every checkpoint and loaded at startup.
+            - recovered: Snapshot state used at startup, or None if accounts come from users.json.
+            - log_writer: LogWriter thread appending entries to the transactions log file.
+            - listeners: Callables notified with every final log entry (see add_listener).
+            - antifraud: RuleEngine with the rules of config "antifraud_rules".
+            - balance_changes: Ring of account IDs whose balance changed, read through account_changes().
+            - balance_versions: BalanceVersions publishing consistent balance snapshots (see balance_snapshot()).
+            - metrics: MetricsRegistry with counters, queue depths, lock waits and write latencies.
             """
         self.config = config
         self.user_credentials = user_credentials
         self.t_payment = t_payment
         self.t_antifraud = t_antifraud
 
-        self.queue_payment = Queue(maxsize=max)
+        self.metrics = MetricsRegistry()
+        self._result_counters = {}
+
+        self.queue_payment = self.new_queue(max)
         self.stop_event = threading.Event()
 
-        self.accounts = {}
-        self.accounts_lock = threading.Lock()
+        self.accounts = AccountStore(config.get("account_lock_stripes", 64))
+        self.accounts.lock_wait = self.lock_wait_histogram("account_stripes")
+        self.accounts_lock = TimedLock(self.lock_wait_histogram("accounts_lock"))
+        self.balance_versions = BalanceVersions(config.get("balance_snapshot_page", 1024))
+        self.accounts.on_change = self.balance_versions.update
+
+        self.antifraud = RuleEngine(self.accounts, build_rules(config.get("antifraud_rules", DEFAULT_RULES)))
+
+        self.transactions_log = TransactionLog(config["transactions_log_file"],
+                                               window=config.get("log_window", 10000),
+                                               history_window=config.get("history_window", 1000),
+                                               segment_bytes=config.get("log_segment_bytes", 64 * 1024 * 1024),
+                                               segment_seconds=config.get("log_segment_seconds", 86400),
+                                               compress=config.get("log_compress", True),
+                                               log_format=config.get("log_format", "jsonl"))
+        self.log_lock = TimedLock(self.lock_wait_histogram("log_lock"))
+        self.listeners = []
+
+        self.balance_changes = deque(maxlen=config.get("change_feed_size", 100000))
+        self.balance_change_seq = 0
+        self.changes_lock = threading.Lock()
 
-        self.transactions_log = []
-        self.log_lock = threading.Lock()
+        self.checkpoint_lock = threading.Lock()
+        self.journal_error = None
+        self.journal = BalanceJournal(
+            config.get("balance_journal_file", config["users_file"] + ".journal"),
+            commit_ms=config.get("journal_commit_ms", 2),
+            commit_max=config.get("journal_commit_max", 512),
+            checkpoint_every=config.get("checkpoint_every", 10000),
+            checkpoint=self.checkpoint,
+        )
+        self.journal.write_latency = self.metrics.histogram(
+            "payments_journal_write_seconds", "Balance journal batch write + fsync time")
+        self.snapshot = AccountSnapshot(config.get("snapshot_file", config["users_file"] + ".snap"))
+        self.recovered = self.load_snapshot()
+        if self.recovered is None:
+            self.journal.replay(self.user_credentials)
+
+        self.log_writer = LogWriter(
+            config["transactions_log_file"],
+            batch_size=config.get("log_batch_size", 1024),
+            flush_policy=config.get("log_flush_policy", "interval"),
+            flush_interval=config.get("log_flush_interval", 0.05),
+            on_written=self.transactions_log.index_batch,
+            should_roll=self.transactions_log.should_roll,
+            on_roll=self.transactions_log.roll,
+            log_format=self.transactions_log.log_format,
+        )
+        self.log_writer.write_latency = self.metrics.histogram(
+            "payments_log_write_seconds", "Transactions log batch encode + write time")
+        self.log_writer.flush_latency = self.metrics.histogram(
+            "payments_log_flush_seconds", "Transactions log flush (and fsync) time")
+        self.metrics.gauge("payments_queue_depth", self.queue_payment.qsize,
+                           "Items waiting in a stage queue", queue="queue_payment")
 
         self.load_transactions()
 
+    def lock_wait_histogram(self, lock):
+        """
+        :param lock: Name of the lock (label value)
+        :return: Histogram of contended wait times of the lock
+        """
+        return self.metrics.histogram("payments_lock_wait_seconds", "Wait time of contended lock acquisitions",
+                                      lock=lock)
+
+    def count_error(self, stage, error):
+        """
+        Count an exception that was turned into an "internal_error" result.
+
+        :param stage: Pipeline stage where it happened
+        :param error: Exception
+        """
+        self.metrics.counter("payments_errors_total", "Exceptions handled by the workers",
+                             stage=stage, error=type(error).__name__).inc()
+
+    def journal_failed(self, error):
+        """
+        Stop settling payments after a journal write failed even after retries.
+        The transfers of the failed batch are not durable: they are undone and
+        reported as rejected ("journal_error"). Later payments are refused or
+        rejected and no checkpoint is written until the engine is restarted
+        from disk.
+
+        :param error: Exception of the failed write
+        """
+        if self.journal_error is None:
+            print("Error writing to balance journal, payments are stopped:", error)
+            self.journal_error = error
+        self.count_error("journal", error)
+
+    def write_metrics(self, path=None, fmt=None):
+        """
+        Write the current metrics to a file.
+
+        :param path: Path of the file (default: config "metrics_file")
+        :param fmt: "prometheus" or "json" (default: config "metrics_format" or "prometheus")
+        """
+        path = path or self.config.get("metrics_file")
+        if path:
+            self.metrics.write(path, fmt or self.config.get("metrics_format", "prometheus"))
+
+    def new_queue(self, maxsize=0):
+        """
+        Create a FairQueue for a pipeline stage from the priority settings in config.
+
+        :param maxsize: Maximum number of items (0 = unbounded)
+        :return: FairQueue
+        """
+        return FairQueue(maxsize=maxsize,
+                         weights=self.config.get("priority_weights"),
+                         max_wait=self.config.get("priority_max_wait", 1.0))
+
     def load_transactions(self):
         """
-        Load all transactions from the transactions log file into internal log.
+        Load the newest transactions from the transactions log file into the
+        in-memory window. Only the part of the file not yet in the sidecar
+        index is parsed; older entries are read lazily when needed.
         """
-        self.transactions_log = []
         try:
-            if os.path.exists(self.config["transactions_log_file"]):
-                with open(self.config["transactions_log_file"], "r") as f:
-                    for line in f:
-                        try:
-                            entry = json.loads(line.strip())
-                            self.transactions_log.append(entry)
-                        except json.JSONDecodeError:
-                            pass
+            self.transactions_log.load()
         except Exception as e:
             print(f"Error loading transactions log: {e}")
 
+    def load_snapshot(self):
+        """
+        Load accounts from the binary snapshot and replay only the journal
+        records written after it.
+
+        :return: Snapshot state, or None if there is no usable snapshot
+        """
+        try:
+            state = self.snapshot.read()
+            if state is not None:
+                self.accounts.load_arrays(*state["columns"])
+                self.journal.replay_into(self.accounts, state["journal_seq"])
+                # Replayed balances are written through account views
+                self.balance_versions.update(dict(zip(self.accounts.keys(), self.accounts.balances)))
+            return state
+        except Exception as e:
+            print(f"Error loading account snapshot: {e}")
+            return None
+
+    def tx_high_water(self):
+        """
+        Highest tx_id used so far: the high-water mark stored in the snapshot,
+        the tx_ids of the log records written after the snapshot and of the
+        replayed journal records. The journal is durable before the log is
+        flushed, so after a crash it can hold tx_ids the log lost.
+
+        :return: Highest used tx_id (0 for an empty system)
+        """
+        high = start = 0
+        if self.recovered is not None:
+            high = self.recovered["tx_high_water"]
+            start = self.recovered["log_records"]
+            if start > self.transactions_log.indexed_count():
+                start = 0
+        return max(high, self.journal.max_tx_id, self.transactions_log.max_tx_id(start))
+
+    def history(self, account_id, since=None, limit=100):
+        """
+        Return the transaction history of one account, oldest first.
+        Uses the per-account index of transactions_log, so the cost depends
+        on the activity of this account, not on the size of the whole log.
+
+        :param account_id: Account ID (sender or receiver)
+        :param since: Only entries with timestamp >= since ("%Y-%m-%d %H:%M:%S")
+        :param limit: Maximum number of newest entries returned (None = all)
+        :return: List of log entry dictionaries
+        """
+        return self.transactions_log.history(account_id, since=since, limit=limit)
+
     def antifraud_check(self, tx: Transaction):
         """
         Perform antifraud check on a transaction.
         Assumes that the sending account exists.
 
-        Unverified accounts cannot send more than 10,000.
+        Runs the rules of the antifraud engine; by default unverified
+        accounts cannot send more than 10,000.
 
        :param tx: Transaction dictionary {"from": id, "to": id, "amount": amount}
        :return: (True/False, reason)
        """
-        from_acc = self.accounts[tx.from_acc]
+        return self.antifraud.evaluate([tx])[0]
 
-        if not from_acc.verified and tx.amount > 10000:
-            return False, "unverified_limit"
+    def antifraud_check_batch(self, txs):
+        """
+        Perform antifraud checks on a micro-batch of transactions at once.
+        Rules see the transactions in order, so velocity counters include
+        the earlier transactions of the same batch.
 
-        return True, "Completed"
+        :param txs: List of transactions
+        :return: List of (True/False, reason) tuples
+        """
+        return self.antifraud.evaluate(txs)
 
-    def log_tx(self, tx: Transaction, status, reason=""):
-        entry = {
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-            "tx_id": tx.tx_id,
-            "from": tx.from_acc,
-            "to": tx.to_acc,
-            "amount": tx.amount,
-            "status": status,
-            "reason": reason,
-        }
+    def checkpoint(self):
+        """
+        Write the account snapshot and current balances to users.json.
 
-        with self.log_lock:
-            self.transactions_log.append(entry)
+        The snapshot is copied while all account locks are held, together with a
+        journal seq cut, the number of logged transactions and the tx_id
+        high-water mark. In users.json each balance is read under its account
+        lock together with the seq of the newest journal record for that account,
+        so journal replay at startup skips records already included here.
+        Both files are replaced atomically. Settlement that does not take the
+        account locks is paused meanwhile (see settlement_paused()).
 
-        if status == "approved":
-            for username, data in self.user_credentials.items():
+        :raises PaymentCoreException: If a journal write failed; the balances in
+            memory may then differ from the durable ones, which are kept
+        """
+        with self.checkpoint_lock, self.settlement_paused():
+            if self.journal_error is not None:
+                raise PaymentCoreException("Balance journal write failed, checkpoint skipped.")
+            log_records = self.transactions_log.indexed_count()
+            with self.accounts.locked_all():
+                cut = self.journal.cut()
+                columns = self.accounts.export()
+            self.snapshot.write(columns, cut, getattr(self, "tx_counter", 0), log_records)
+
+            for username, data in list(self.user_credentials.items()):
                 acc = self.accounts.get(data["id"])
                 if acc:
-                    data["balance"] = acc.balance
+                    with acc.lock:
+                        data["balance"] = acc.balance
+                        data["journal_seq"] = self.journal.seq_of(data["id"])
 
-            with open(self.config["users_file"], "w") as f:
+            tmp_file = self.config["users_file"] + ".tmp"
+            with open(tmp_file, "w") as f:
                 json.dump(self.user_credentials, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.config["users_file"])
 
-        try:
-            os.makedirs(os.path.dirname(self.config["transactions_log_file"]), exist_ok=True)
-            with open(self.config["transactions_log_file"], "a") as f:
-                f.write(json.dumps(entry) + "\n")
-        except Exception as e:
-            print("Error writing to transactions log:", e)
+    def settlement_paused(self):
+        """
+        Context in which no balance update is in progress outside the account
+        locks. Balances are only changed under the account locks here, so
+        nothing has to be paused.
+        """
+        return nullcontext()
+
+    def record_balances(self, tx_id, balances, in_transit=0, refund=False):
+        """
+        Create the journal record for new account balances and publish the
+        change to the account change feed and the balance snapshots.
+        Must be called while the balances cannot change (account locks held
+        or on the owning shard).
+
+        :param tx_id: ID of the transaction that changed the balances
+        :param balances: Dictionary mapping account IDs to their new balance
+        :param in_transit: Amount debited (positive) or credited (negative) on
+            its own by one half of a cross-shard transfer
+        :param refund: The balances give back the debit of a rejected transaction
+        :return: Journal record to be appended
+        """
+        record = self.journal.record(tx_id, balances, refund, in_transit)
+        self.balance_versions.update(balances, in_transit)
+        with self.changes_lock:
+            self.balance_changes.extend(balances)
+            self.balance_change_seq += len(balances)
+        return record
+
+    def undo_transfers(self, txs):
+        """
+        Reverse the balance changes of approved transfers whose journal
+        records could not be made durable. The amounts are moved back instead
+        of restoring the old balances, so transfers applied meanwhile to the
+        same accounts are kept. The reverted balances are published to the
+        balance snapshots and the change feed; they are not journaled.
+
+        :param txs: Transactions whose transfers were applied in memory
+        """
+        if not txs:
+            return
+        balances = {}
+        with self.accounts.locked(*{acc_id for tx in txs for acc_id in (tx.from_acc, tx.to_acc)}):
+            for tx in reversed(txs):
+                from_acc = self.accounts[tx.from_acc]
+                to_acc = self.accounts[tx.to_acc]
+                from_acc.balance += tx.amount
+                to_acc.balance -= tx.amount
+                balances[tx.from_acc] = from_acc.balance
+                balances[tx.to_acc] = to_acc.balance
+            self.balance_versions.update(balances)
+        with self.changes_lock:
+            self.balance_changes.extend(balances)
+            self.balance_change_seq += len(balances)
+
+    def balance_snapshot(self):
+        """
+        Consistent view of all balances without taking any account lock.
+        The snapshot never changes; call again for newer balances. Money of
+        cross-shard transfers between debit and credit is counted in
+        snapshot.in_transit, so snapshot.total() stays exact.
+
+        :return: BalanceSnapshot including every balance update made before the call
+        """
+        return self.balance_versions.snapshot()
+
+    def account_changes(self, cursor=0):
+        """
+        Change feed of account balances.
+
+        :param cursor: Cursor returned by the previous call (0 = start)
+        :return: (set of changed account IDs or None, new cursor); None means
+            the changes since cursor are no longer available and the reader
+            has to refresh all accounts
+        """
+        with self.changes_lock:
+            new = self.balance_change_seq - cursor
+            if new > len(self.balance_changes) or new < 0:
+                return None, self.balance_change_seq
+            changed = set(self.balance_changes[i] for i in range(len(self.balance_changes) - new,
+                                                                 len(self.balance_changes)))
+            return changed, self.balance_change_seq
+
+    def log_changes(self, cursor=0):
+        """
+        Change feed of the transaction log.
+
+        :param cursor: Cursor returned by the previous call (0 = start)
+        :return: (new entries, new cursor, complete); complete is False when
+            entries between cursor and the returned ones already left the
+            in-memory window
+        """
+        with self.log_lock:
+            return self.transactions_log.changes_since(cursor)
+
+    def log_tx(self, tx: Transaction, status, reason="", journal_record=None):
+        """
+        Log the final status of a transaction.
+        Approved transactions are appended to the balance journal; the call
+        returns once the journal batch containing them is durable.
+
+        :param tx: Processed transaction
+        :param status: approved / declined / rejected
+        :param reason: Reason of the status
+        :param journal_record: Record from record_balances() taken under the account locks
+        """
+        if status == "approved":
+            if journal_record is None:
+                journal_record = self.record_balances(tx.tx_id, {
+                    tx.from_acc: self.accounts[tx.from_acc].balance,
+                    tx.to_acc: self.accounts[tx.to_acc].balance,
+                })
+            try:
+                self.journal.append(journal_record)
+            except Exception as e:
+                self.journal_failed(e)
+                self.undo_transfers([tx])
+                status, reason = "rejected", "journal_error"
+
+        self.record_result(tx, status, reason)
+
+    def record_result(self, tx: Transaction, status, reason=""):
+        """
+        Add the final log entry of a transaction to the log, notify listeners
+        and complete the handle of the transaction. The pending entry of the
+        transaction is updated in place and announced again.
+        Does not touch the balance journal; used directly when the journal
+        record was already made durable (see ShardedExecutor).
+
+        :param tx: Processed transaction
+        :param status: approved / declined / rejected
+        :param reason: Reason of the status
+        """
+        entry = tx.settle(status, reason)
+
+        with self.log_lock:
+            self.transactions_log.append(entry)
+
+        self.log_writer.write(entry)
+
+        counter = self._result_counters.get((status, reason))
+        if counter is None:
+            counter = self._result_counters[(status, reason)] = self.metrics.counter(
+                "payments_transactions_total", "Final transaction results", status=status, reason=reason)
+        counter.inc()
+
+        for listener in self.listeners:
+            listener(entry)
+
+        if tx.handle is not None:
+            # A copy, so callers cannot change the entry kept in the log
+            tx.handle.set_result(dict(entry))
+
+    def add_listener(self, listener):
+        """
+        Register a callable that receives every final log entry (approved,
+        declined or rejected). It is called on the payment worker thread,
+        so it must be fast and must not block.
+
+        :param listener: Callable taking the log entry dictionary
+        """
+        with self.log_lock:
+            self.listeners = self.listeners + [listener]
+
+    def remove_listener(self, listener):
+        """
+        Unregister a callable added by add_listener.
+
+        :param listener: Callable to remove
+        """
+        with self.log_lock:
+            self.listeners = [l for l in self.listeners if l is not listener]
 
     def validate_transaction(self, from_acc, to_acc, amount):
         """
@@ -131,9 +489,13 @@ class PaymentsCore:
         :param from_acc: Sender account ID
         :param to_acc: Recipient account ID
         :param amount: Transaction amount
-        :raises PaymentCoreException: If accounts do not exist or amount <= 0
+        :raises PaymentCoreException: If accounts do not exist, are the same or amount is not an integer > 0
         """
         if from_acc not in self.accounts or to_acc not in self.accounts:
             raise PaymentCoreException("One of the accounts does not exist.")
+        if from_acc == to_acc:
+            raise PaymentCoreException("Sender and receiver must be different")
+        if not isinstance(amount, int) or isinstance(amount, bool):
+            raise PaymentCoreException("Amount must be an integer.")
         if amount <= 0:
             raise PaymentCoreException("Amount must be greater than 0.")
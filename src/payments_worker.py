@@ -2,56 +2,143 @@ from queue import Queue, Empty
 from concurrent.futures import ThreadPoolExecutor
 import threading
 import time
+from contextlib import nullcontext
 from src.transaction import Transaction
-from src.payments_core import PaymentsCore
-from src.account import Account
+from src.transaction_handle import TransactionHandle
+from src.payments_core import PaymentsCore, PaymentCoreException
+from src.delay_scheduler import DelayScheduler
+from src.batch_ingest import read_jsonl
+from src.sharded_executor import ShardedExecutor
+from src.idempotency import IdempotencyCache
 
 
 class PaymentsWorkers(PaymentsCore):
     """
     Payment processing system with antifraud checks and concurrency support
     Attributes:
-        queue_antifraud (Queue): Queue for transactions after antifraud check
+        queue_antifraud (FairQueue): Queue for batches of transactions after antifraud check
         processed_count (int): Counter of processed transactions
         count_lock (Lock): Lock for thread-safe updates of processed_count
-        tx_counter (int): Counter for generating unique transaction IDs
+        processed_cond (Condition): Notified when processed_count changes (used by drain)
+        accepted_count (int): Number of transactions accepted by submit / submit_many
+        accepting (bool): False while draining, submissions are refused
+        tx_counter (int): Counter for generating unique transaction IDs, restored from
+            the snapshot high-water mark, the log tail, the journal and the key file at startup
         tx_lock (Lock): Lock for thread-safe incrementing of tx_counter
         pool_a (ThreadPoolExecutor): Thread pool for antifraud workers
         pool_w (ThreadPoolExecutor): Thread pool for payment workers
+        scheduler (DelayScheduler): Holds submitted transactions before antifraud
+        shards (int): Number of account shards for sharded settlement (0 = off)
+        executor (ShardedExecutor): Shard owner threads while running in sharded mode
+        batch_size (int): Maximum number of transactions handed between stages at once
+        batch_linger (float): Seconds a stage waits to fill a micro-batch
+        profiler (WorkerProfiler): Active worker profiler, None while profiling is off
+        idempotency (IdempotencyCache): Idempotency keys of recent submissions, restored at startup
     """
 
-    def __init__(self, config, user_credentials, t_payment=4, t_antifraud=2):
+    STOP = object()
+
+    def __init__(self, config, user_credentials, t_payment=4, t_antifraud=2, hold_time=None, max_delayed=None,
+                 shards=None, batch_size=None, batch_linger_ms=None, queue_size=None):
         """
         Initialize PaymentsWorkers
         Arguments:
             t_payment (int): Number of concurrent payment worker threads
             t_antifraud (int): Number of concurrent antifraud worker threads
+            hold_time (float): Seconds a submitted transaction is held before antifraud
+                (default: config "hold_time" or 2, may be 0)
+            max_delayed (int): Maximum number of held transactions before submit blocks
+                (default: config "max_delayed" or 100000)
+            shards (int): Settle on this many single-owner account shards instead of
+                locking accounts in process_payment (default: config "shards" or 0 = off);
+                shards are threads, they avoid lock contention but add no CPU parallelism
+            batch_size (int): Maximum number of transactions per micro-batch
+                (default: config "batch_size" or 256)
+            batch_linger_ms (float): Milliseconds a stage waits for more transactions
+                before processing a batch that is not full (default: config "batch_linger_ms" or 1)
+            queue_size (int): Maximum number of transactions in queue_payment before the
+                scheduler waits (default: config "queue_size" or 300)
         """
-        super().__init__(config, user_credentials, t_payment, t_antifraud)
-
-        self.queue_antifraud = Queue()
+        if queue_size is None:
+            queue_size = config.get("queue_size", 300)
+        super().__init__(config, user_credentials, t_payment, t_antifraud, queue_size)
+
+        if hold_time is None:
+            hold_time = config.get("hold_time", 2)
+        if max_delayed is None:
+            max_delayed = config.get("max_delayed", 100000)
+        self.scheduler = DelayScheduler(hold_time, self.release_delayed, max_pending=max_delayed,
+                                        on_error=self.reject_delayed)
+
+        self.shards = shards if shards is not None else config.get("shards", 0)
+        self.executor = None
+
+        self.queue_antifraud = self.new_queue()
+        self.batch_size = batch_size if batch_size is not None else config.get("batch_size", 256)
+        if batch_linger_ms is None:
+            batch_linger_ms = config.get("batch_linger_ms", 1)
+        self.batch_linger = batch_linger_ms / 1000
 
         self.processed_count = 0
         self.count_lock = threading.Lock()
-
-        self.tx_counter = 0
+        self.processed_cond = threading.Condition(self.count_lock)
+        self.accepted_count = 0
+        self.accepting = True
+
+        self.idempotency = IdempotencyCache(
+            config.get("idempotency_file", config["transactions_log_file"] + ".keys"),
+            ttl=config.get("idempotency_ttl", 86400),
+            max_keys=config.get("idempotency_max_keys", 100000),
+        )
+        self.idempotency.load()
+
+        # Keys are written before their transaction is logged, so they may hold newer tx_ids
+        self.tx_counter = max(self.tx_high_water(), self.idempotency.max_tx_id)
         self.tx_lock = threading.Lock()
+        self.duplicates = self.metrics.counter(
+            "payments_idempotent_duplicates_total", "Submissions answered from the idempotency cache")
 
         self.pool_a = None
         self.pool_w = None
-
-        with self.accounts_lock:
-            for username, data in self.user_credentials.items():
-                acc_id = data["id"]
-                balance = data.get("balance", 0)
-                verified = data.get("verified", False)
-                self.accounts[acc_id] = Account(owner=username, balance=balance, verified=verified)
+        self.metrics_server = None
+        self.profiler = None
+
+        self.stage_counters = {
+            stage: self.metrics.counter("payments_stage_total", "Transactions that entered a stage", stage=stage)
+            for stage in ("submitted", "antifraud", "payment")
+        }
+        self.stage_seconds = {
+            stage: self.metrics.histogram("payments_stage_seconds", "Time to process one micro-batch", stage=stage)
+            for stage in ("antifraud", "payment")
+        }
+        self.metrics.gauge("payments_queue_depth", self.queue_antifraud.qsize,
+                           "Items waiting in a stage queue", queue="queue_antifraud")
+        self.metrics.gauge("payments_queue_depth", lambda: len(self.scheduler),
+                           "Items waiting in a stage queue", queue="delayed")
+
+        # Accounts come from the snapshot; only accounts created after it are added from users.json
+        if self.recovered is None or len(self.accounts) != len(self.user_credentials):
+            with self.accounts_lock:
+                self.accounts.bulk_load((data["id"], username, data.get("balance", 0), data.get("verified", False))
+                                        for username, data in self.user_credentials.items()
+                                        if data["id"] not in self.accounts)
 
     def start(self):
         """
         Start worker threads for antifraud and payment processing
         """
         self.stop_event.clear()
+        self.accepting = True
+        self.scheduler.start()
+
+        if self.config.get("metrics_port") and self.metrics_server is None:
+            self.metrics_server = self.metrics.serve(self.config["metrics_port"])
+        if self.config.get("profile_mode") and self.profiler is None:
+            self.enable_profiling(self.config["profile_mode"])
+
+        if self.shards:
+            self.executor = ShardedExecutor(self, self.shards)
+            self.executor.start()
 
         self.pool_a = ThreadPoolExecutor(max_workers=self.t_antifraud)
         self.pool_w = ThreadPoolExecutor(max_workers=self.t_payment)
@@ -65,84 +152,568 @@ class PaymentsWorkers(PaymentsCore):
     def stop(self):
         """
         Stop all worker threads and shutdown thread pools.
+        Every worker is woken by a STOP sentinel and finishes the batch it
+        already took. Waits for the transactions log writer, flushes the
+        balance journal and writes a final checkpoint (skipped after a failed
+        journal write) and the profile.
+        Held and queued transactions stay in the scheduler and the queues
+        until the next start(); new submissions are refused until then.
         """
+        with self.tx_lock:
+            self.accepting = False
+        self.scheduler.stop()
         self.stop_event.set()
-        time.sleep(0.2)
 
         if self.pool_a:
+            for i in range(self.t_antifraud):
+                self.queue_payment.put(self.STOP, priority=Transaction.PRIORITY_INTERACTIVE)
             self.pool_a.shutdown(wait=True)
+            self.pool_a = None
         if self.pool_w:
+            for i in range(self.t_payment):
+                self.queue_antifraud.put(self.STOP, priority=Transaction.PRIORITY_INTERACTIVE)
             self.pool_w.shutdown(wait=True)
+            self.pool_w = None
+        if self.executor:
+            self.executor.stop()
+            self.executor = None
+        if self.profiler:
+            self.disable_profiling()
+
+        # After a failed journal write the durable state on disk is kept as it is
+        self.journal.close(checkpoint=self.journal_error is None)
+        self.log_writer.flush()
+        self.log_writer.close()
+        self.transactions_log.close()
+        self.idempotency.close()
+
+        self.write_metrics()
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
+
+    def enable_profiling(self, mode="sample", output=None, interval=None):
+        """
+        Start profiling the worker threads, also while they are running
+        The antifraud, payment and shard threads are profiled per micro-batch
+        and the results of all threads are merged by disable_profiling / stop
+        Arguments:
+            mode (str): "cprofile" (per-thread cProfile, pstats report) or
+                "sample" (stack sampler, collapsed stacks for flamegraphs)
+            output (str): Path prefix of the result files (default: config "profile_output"
+                or "logs/profile")
+            interval (float): Seconds between two samples (default: config
+                "profile_interval_ms" or 5 ms)
+        Returns:
+            WorkerProfiler: The started profiler
+        Raises:
+            ProfilerException: If mode is unknown
+        """
+        if self.profiler:
+            self.disable_profiling()
+        if output is None:
+            output = self.config.get("profile_output", "logs/profile")
+        if interval is None:
+            interval = self.config.get("profile_interval_ms", 5) / 1000
+        # Imported here: cProfile/pstats are only needed while profiling
+        from src.profiler import WorkerProfiler
+        profiler = WorkerProfiler(mode, output, interval)
+        profiler.start()
+        self.profiler = profiler
+        return profiler
+
+    def disable_profiling(self):
+        """
+        Stop profiling and write the merged results of all worker threads
+        Returns:
+            list: Paths of the written files (empty if profiling was off)
+        """
+        profiler, self.profiler = self.profiler, None
+        if profiler is None:
+            return []
+        try:
+            return profiler.finish()
+        except Exception as e:
+            print("Error writing profile:", e)
+            return []
+
+    def profiled(self, name):
+        """
+        Context manager profiling one micro-batch of a worker (no-op while profiling is off)
+        Arguments:
+            name (str): Worker role, e.g. "antifraud"
+        """
+        profiler = self.profiler
+        return profiler.section(name) if profiler else nullcontext()
+
+    def settlement_paused(self):
+        """
+        Context in which no balance update is in progress outside the account
+        locks: in sharded mode the shards finish their cross-shard transfers
+        and hold new ones back until the context ends
+        """
+        executor = self.executor
+        return executor.held() if executor else super().settlement_paused()
 
-    def submit(self, from_acc, to_acc, amount):
+    def drain(self, timeout=None):
+        """
+        Finish all work and stop
+        Refuses new submissions, releases held transactions at once, waits
+        until every accepted transaction reached its final status through
+        both stages and then stops (flushing the log and balances).
+        Arguments:
+            timeout (float): Maximum seconds to wait for in-flight transactions
+                (None = wait forever); on timeout the rest stays queued
+        Returns:
+            bool: True if every accepted transaction was processed
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.tx_lock:
+            self.accepting = False
+
+        self.scheduler.flush(timeout)
+        with self.processed_cond:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            drained = self.processed_cond.wait_for(lambda: self.processed_count >= self.accepted_count, remaining)
+
+        self.stop()
+        return drained
+
+    def submit(self, from_acc, to_acc, amount, priority=Transaction.PRIORITY_DEFAULT, idempotency_key=None):
         """
         Submit a new transaction for processing
+        The transaction is held by the scheduler for hold_time seconds;
+        blocks while max_delayed transactions are already held.
         Arguments:
           from_acc (int): Sender account ID
           to_acc (int): Receiver account ID
           amount (int): Amount to transfer
+          priority (int): Priority class, 1 (interactive) to 5 (bulk)
+          idempotency_key (str): Client key of the request; submitting a key seen
+            in the last idempotency_ttl seconds returns the handle of the original
+            transaction instead of enqueuing a new one
+        Returns:
+          TransactionHandle: Future completed with the final log entry
+        Raises:
+          PaymentCoreException: If the transaction is invalid or the system is draining
         """
         self.validate_transaction(from_acc, to_acc, amount)
+        if priority not in range(1, 6):
+            raise PaymentCoreException("Priority must be between 1 and 5")
 
         with self.tx_lock:
-            self.tx_counter += 1
-            tx_id = self.tx_counter
-
-        tx = Transaction(tx_id, from_acc, to_acc, amount)
+            if idempotency_key is not None:
+                handle = self.find_idempotent(idempotency_key)
+                if handle is not None:
+                    self.duplicates.inc()
+                    return handle
+            if not self.accepting:
+                raise PaymentCoreException("Payments are shutting down.")
+            if self.journal_error is not None:
+                raise PaymentCoreException("Payments are stopped after a balance journal error.")
+            tx_id = self.tx_counter + 1
+            handle = TransactionHandle(tx_id)
+            if idempotency_key is not None:
+                # Raises before the transaction is counted if the key cannot be written
+                self.idempotency.put(idempotency_key, tx_id, handle)
+            self.tx_counter = tx_id
+            self.accepted_count += 1
+        if idempotency_key is not None:
+            self.flush_idempotency()
+        self.stage_counters["submitted"].inc()
+
+        tx = Transaction(tx_id, from_acc, to_acc, amount, priority)
+        tx.handle = handle
 
         with self.log_lock:
-            self.transactions_log.append({
-                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                "tx_id": tx.tx_id,
-                "from": from_acc,
-                "to": to_acc,
-                "amount": amount,
-                "status": "pending",
-                "reason": "processing"
-            })
+            self.transactions_log.append(self.pending_entry(tx))
 
-            def delay():
-                time.sleep(2)
-                self.queue_payment.put((tx.timestamp, tx.tx_id, tx))
+        if not self.scheduler.schedule(tx):
+            # Stopped between the accepting check and here
+            self.reject_delayed([tx], PaymentCoreException("Payments are stopped."), "stopped")
+        return tx.handle
 
-            threading.Thread(target=delay).start()
+    def flush_idempotency(self):
+        """
+        Write buffered idempotency key records
+        A failed write is only reported: the keys stay remembered in memory and
+        the transactions submitted with them are already accepted.
+        """
+        try:
+            self.idempotency.flush()
+        except OSError as e:
+            print("Error writing idempotency keys:", e)
 
+    def find_idempotent(self, key):
+        """
+        Look up the transaction submitted with an idempotency key
+        The caller must hold tx_lock. Keys restored from disk have no handle
+        yet: it is rebuilt from the final log entry of the transaction or, if
+        a crash lost the log entry, from the replayed balance journal (the
+        result then only holds tx_id, status and reason). A key whose
+        transaction is in neither never changed a balance; it is forgotten,
+        so the retry is processed.
+        Arguments:
+            key (str): Idempotency key
+        Returns:
+            TransactionHandle: Handle of the original transaction, None if the key is new
+        """
+        entry = self.idempotency.get(key)
+        if entry is None:
+            return None
+        tx_id, ts, handle = entry
+        if handle is None:
+            final = [e for e in self.transactions_log.get(tx_id) if e["status"] != "pending"]
+            if not final:
+                status = self.journal.settled.get(tx_id)
+                if status is None:
+                    self.idempotency.forget(key)
+                    return None
+                final = [{"tx_id": tx_id, "status": status,
+                          "reason": "completed" if status == "approved" else "internal_error"}]
+            handle = entry[2] = TransactionHandle(tx_id)
+            handle.set_result(final[-1])
+        return handle
+
+    def pending_entry(self, tx: Transaction):
+        """
+        Return the "pending" log entry of a submitted transaction
+        The same dictionary is updated in place with the final status (Transaction.settle)
+        Arguments:
+            tx (Transaction): Submitted transaction
+        """
+        return tx.log_entry()
 
-    def antifraud_worker(self):
+    def submit_many(self, rows, chunk_size=1000, wait_final=False, priority=Transaction.PRIORITY_BULK,
+                    idempotency_key=None):
         """
-        Continuously checks transactions from queue_payment
-        Transactions that fail antifraud check are marked rejected
-        All transactions are pushed to queue_antifraud for payment processing
+        Submit many transactions, streaming back one result per row
+        Rows are validated against a snapshot of the account IDs taken once at
+        the start. Per chunk, one tx_lock acquisition reserves a contiguous block
+        of tx_ids, one log_lock acquisition appends the pending entries and the
+        whole chunk is handed to the scheduler at once.
+        Arguments:
+            rows (iterable): {"from": id, "to": id, "amount": amount} dictionaries
+                (optionally with "idempotency_key") or (from, to, amount[, key]) tuples
+            chunk_size (int): Number of rows handled per chunk
+            wait_final (bool): Also yield the final status of every accepted row;
+                the generator then ends only after all of them are processed
+            priority (int): Priority class of the transactions (default: bulk)
+            idempotency_key (str): Key of the whole batch; row n without its own key
+                gets the key "<idempotency_key>:<n>", so a retried file is not applied twice
+        Yields:
+            dict: {"row": n, "status": "accepted", "tx_id": id},
+                {"row": n, "status": "duplicate", "tx_id": id} for a key seen before,
+                {"row": n, "status": "invalid", "reason": message} and with wait_final
+                {"row": n, "tx_id": id, "status": "approved"/"declined"/"rejected", "reason": reason}
+        """
+        with self.accounts_lock:
+            known = frozenset(self.accounts.keys())
+
+        finals = Queue() if wait_final else None
+        waiting = 0
+        chunk = []
+        for row_no, row in enumerate(rows, 1):
+            chunk.append((row_no, row))
+            if len(chunk) >= chunk_size:
+                results = self._submit_chunk(chunk, known, finals, priority, idempotency_key)
+                waiting += self._awaited(results, finals)
+                yield from results
+                done = self._final_results(finals, waiting, block=False)
+                waiting -= len(done)
+                yield from done
+                chunk = []
+        if chunk:
+            results = self._submit_chunk(chunk, known, finals, priority, idempotency_key)
+            waiting += self._awaited(results, finals)
+            yield from results
+        yield from self._final_results(finals, waiting, block=True)
+
+    def submit_jsonl(self, path, chunk_size=1000, wait_final=False, priority=Transaction.PRIORITY_BULK,
+                     idempotency_key=None):
+        """
+        Stream a JSON-lines payment file into submit_many
+        Arguments:
+            path (str): Path of the file, one {"from", "to", "amount"} object per line
+            chunk_size (int): Number of rows handled per chunk
+            wait_final (bool): Also yield the final status of every accepted row
+            priority (int): Priority class of the transactions (default: bulk)
+            idempotency_key (str): Key of the file, see submit_many
         """
-        while not self.stop_event.is_set():
+        return self.submit_many(read_jsonl(path), chunk_size, wait_final, priority, idempotency_key)
+
+    def _submit_chunk(self, chunk, known, finals=None, priority=Transaction.PRIORITY_BULK, idempotency_key=None):
+        results = []
+        valid = []
+        for row_no, row in chunk:
+            try:
+                from_acc, to_acc, amount, key = self._row_values(row, known)
+                if key is None and idempotency_key is not None:
+                    key = f"{idempotency_key}:{row_no}"
+                valid.append((row_no, from_acc, to_acc, amount, key))
+            except Exception as e:
+                results.append({"row": row_no, "status": "invalid", "reason": str(e)})
+
+        txs = []
+        if valid:
+            with self.tx_lock:
+                for row_no, from_acc, to_acc, amount, key in valid:
+                    handle = self.find_idempotent(key) if key is not None else None
+                    if handle is not None:
+                        self.duplicates.inc()
+                        results.append({"row": row_no, "status": "duplicate", "tx_id": handle.tx_id})
+                        self._notify_final(handle, finals, row_no)
+                        continue
+                    if not self.accepting or self.journal_error is not None:
+                        reason = "Payments are shutting down." if not self.accepting else \
+                            "Payments are stopped after a balance journal error."
+                        results.append({"row": row_no, "status": "invalid", "reason": reason})
+                        continue
+                    tx = Transaction(self.tx_counter + 1, from_acc, to_acc, amount, priority)
+                    if key is not None or finals is not None:
+                        tx.handle = TransactionHandle(tx.tx_id)
+                    if key is not None:
+                        try:
+                            self.idempotency.put(key, tx.tx_id, tx.handle)
+                        except OSError as e:
+                            results.append({"row": row_no, "status": "invalid", "reason": str(e)})
+                            continue
+                    self.tx_counter = tx.tx_id
+                    txs.append((row_no, tx))
+                self.accepted_count += len(txs)
+            self.flush_idempotency()
+            self.stage_counters["submitted"].inc(len(txs))
+
+        if txs:
+            entries = [self.pending_entry(tx) for row_no, tx in txs]
+            with self.log_lock:
+                self.transactions_log.extend(entries)
+
+            for row_no, tx in txs:
+                self._notify_final(tx.handle, finals, row_no)
+                results.append({"row": row_no, "status": "accepted", "tx_id": tx.tx_id})
+            scheduled = [tx for row_no, tx in txs]
+            count = self.scheduler.schedule_many(scheduled)
+            if count < len(scheduled):
+                self.reject_delayed(scheduled[count:], PaymentCoreException("Payments are stopped."), "stopped")
+
+        results.sort(key=lambda r: r["row"])
+        return results
+
+    @staticmethod
+    def _row_values(row, known):
+        if isinstance(row, Exception):
+            raise row
+        if isinstance(row, dict):
+            from_acc, to_acc, amount = row.get("from"), row.get("to"), row.get("amount")
+            key = row.get("idempotency_key")
+        elif len(row) == 4:
+            from_acc, to_acc, amount, key = row
+        else:
+            from_acc, to_acc, amount = row
+            key = None
+
+        if from_acc not in known or to_acc not in known:
+            raise PaymentCoreException("One of the accounts does not exist.")
+        if from_acc == to_acc:
+            raise PaymentCoreException("Sender and receiver must be different")
+        if not isinstance(amount, int) or isinstance(amount, bool):
+            raise PaymentCoreException("Amount must be an integer.")
+        if amount <= 0:
+            raise PaymentCoreException("Amount must be greater than 0.")
+        return from_acc, to_acc, amount, key
+
+    @staticmethod
+    def _notify_final(handle, finals, row_no):
+        if finals is not None:
+            handle.add_done_callback(lambda h: finals.put((row_no, h.result())))
+
+    @staticmethod
+    def _awaited(results, finals):
+        if finals is None:
+            return 0
+        return sum(1 for r in results if r["status"] in ("accepted", "duplicate"))
+
+    @staticmethod
+    def _final_results(finals, waiting, block):
+        results = []
+        while len(results) < waiting:
             try:
-                i, y, tx = self.queue_payment.get(timeout=0.1)
+                row_no, entry = finals.get() if block else finals.get_nowait()
             except Empty:
-                continue
+                break
+            results.append({"row": row_no, "tx_id": entry["tx_id"], "status": entry["status"],
+                            "reason": entry["reason"]})
+        return results
 
-            ok, reason = self.antifraud_check(tx)
-            if not ok:
-                tx.reject(reason)
+    def release_delayed(self, batch):
+        """
+        Move a batch of transactions released by the scheduler to queue_payment
+        Blocks while queue_payment is full, which keeps the scheduler full
+        and makes submit wait
+        Arguments:
+            batch (list): Transactions whose hold time is over
+        """
+        failed = []
+        for tx in batch:
+            try:
+                self.queue_payment.put(tx, priority=tx.priority, flow=tx.from_acc)
+            except Exception as e:
+                failed.append(tx)
+                error = e
+        if failed:
+            self.reject_delayed(failed, error)
+
+    def reject_delayed(self, txs, error, reason="internal_error"):
+        """
+        Reject transactions that could not be handed to queue_payment
+        They reach their final status, so drain() does not wait for them
+        Arguments:
+            txs (list): Transactions to reject
+            error (Exception): Cause, counted in the error metrics
+            reason (str): Rejection reason
+        """
+        self.count_error("scheduler", error)
+        for tx in txs:
+            self.record_result(tx, "rejected", reason)
+        self.mark_processed(len(txs))
 
-            self.queue_antifraud.put((tx.timestamp, tx.tx_id, tx))
+    def antifraud_worker(self):
+        """
+        Continuously checks transactions from queue_payment
+        Takes a micro-batch (up to batch_size transactions or batch_linger seconds)
+        and evaluates all antifraud rules over it at once
+        Transactions that fail antifraud check are marked rejected
+        The batch is pushed to queue_antifraud as one item per priority class and sender for payment processing
+        """
+        while True:
+            batch = self._take_batch(self.queue_payment, self.batch_size, self.batch_linger)
+            stop = batch[-1] is self.STOP
+            if stop:
+                batch.pop()
+
+            txs = batch
+            with self.profiled("antifraud"):
+                start = time.perf_counter()
+                try:
+                    results = self.antifraud_check_batch(txs) if txs else []
+                except Exception as e:
+                    self.count_error("antifraud", e)
+                    results = [(False, "internal_error")] * len(txs)
+                if txs:
+                    self.stage_seconds["antifraud"].observe(time.perf_counter() - start)
+                    self.stage_counters["antifraud"].inc(len(txs))
+
+                groups = {}
+                for tx, (ok, reason) in zip(txs, results):
+                    if not ok:
+                        tx.reject(reason)
+                    groups.setdefault((tx.priority, tx.from_acc), []).append(tx)
+                for (priority, sender), group in groups.items():
+                    self.queue_antifraud.put(group, priority=priority, flow=sender)
+            if stop:
+                return
 
-    def payment_worker(self):
+    @staticmethod
+    def _take_batch(queue, max_items, linger=0, size=None, timeout=None):
         """
-        Worker function that continuously processes transactions from queue_antifraud
-        Calls process_payment for each transaction
+        Wait for one item, then keep taking items until max_items are taken
+        or linger seconds passed since the first one
+        A STOP sentinel ends the batch, it is returned as its last item
+        Arguments:
+            queue (Queue): Queue to read from
+            max_items (int): Maximum number of items taken
+            linger (float): Seconds to wait for more items after the first one
+            size (callable): Number of transactions in an item (default: 1 per item)
+            timeout (float): Seconds to wait for the first item (None = forever)
+        Returns:
+            list: Taken items (empty on timeout)
         """
-        while not self.stop_event.is_set():
+        try:
+            batch = [queue.get(timeout=timeout)]
+        except Empty:
+            return []
+        if batch[0] is PaymentsWorkers.STOP:
+            return batch
+        taken = size(batch[0]) if size else 1
+        deadline = time.monotonic() + linger
+        while taken < max_items:
             try:
-                i, y, tx = self.queue_antifraud.get(timeout=0.1)
+                item = queue.get_nowait()
             except Empty:
-                continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = queue.get(timeout=remaining)
+                except Empty:
+                    break
+            batch.append(item)
+            if item is PaymentsWorkers.STOP:
+                break
+            taken += size(item) if size else 1
+        return batch
+
+    def payment_worker(self):
+        """
+        Worker function that continuously processes batches from queue_antifraud
+        Calls process_batch for each micro-batch, or in sharded mode hands
+        transactions that passed antifraud to the shard of the sender
+        """
+        while True:
+            batches = self._take_batch(self.queue_antifraud, self.batch_size, self.batch_linger, size=len)
+            stop = batches[-1] is self.STOP
+            if stop:
+                batches.pop()
+
+            txs = [tx for batch in batches for tx in batch]
+            if self.journal_error is not None:
+                for tx in txs:
+                    if tx.ok:
+                        tx.reject("journal_error")
+            with self.profiled("payment"):
+                start = time.perf_counter()
+                self.stage_counters["payment"].inc(len(txs))
+                if self.executor:
+                    for tx in txs:
+                        if tx.ok:
+                            self.executor.submit(tx)
+                    txs = [tx for tx in txs if not tx.ok]
+                if txs:
+                    try:
+                        self.process_batch(txs)
+                    except Exception as e:
+                        # Keep the worker running; the batch is reported in the error counters
+                        self.count_error("payment", e)
+                if batches:
+                    self.stage_seconds["payment"].observe(time.perf_counter() - start)
+            if stop:
+                return
+
+    def priority_stats(self):
+        """
+        Statistics per priority class of both stage queues
+        Returns:
+            dict: {"queue_payment": {class: stats}, "queue_antifraud": {class: stats}},
+                see FairQueue.stats()
+        """
+        return {"queue_payment": self.queue_payment.stats(), "queue_antifraud": self.queue_antifraud.stats()}
 
-            self.process_payment(tx)
+    def mark_processed(self, count=1):
+        """
+        Increment processed_count for transactions that reached their final status
+        Arguments:
+            count (int): Number of transactions
+        """
+        with self.processed_cond:
+            self.processed_count += count
+            self.processed_cond.notify_all()
 
     def process_payment(self, tx: Transaction):
         """
         Process a single transaction: update balances or reject/decline
-            - Updates balances with locking
+            - Updates balances holding the striped locks of both accounts
             - Logs transaction result
             - Increment processed_count after processing
         Arguments:
@@ -150,6 +721,8 @@ class PaymentsWorkers(PaymentsCore):
             """
         try:
 
+            if tx.ok and self.journal_error is not None:
+                tx.reject("journal_error")
             if not tx.ok:
                 self.log_tx(tx, "rejected", tx.reason)
                 return
@@ -157,18 +730,85 @@ class PaymentsWorkers(PaymentsCore):
             from_acc = self.accounts[tx.from_acc]
             to_acc = self.accounts[tx.to_acc]
 
-            acc1, acc2 = sorted([from_acc, to_acc], key=id)
-            with acc1.lock:
-                with acc2.lock:
-                    if from_acc.balance < tx.amount:
-                        self.log_tx(tx, "declined", "insufficient_funds")
-                        return
-                    from_acc.balance -= tx.amount
-                    to_acc.balance += tx.amount
-
-            self.log_tx(tx, "approved", "completed")
-        except Exception:
+            with self.accounts.locked(tx.from_acc, tx.to_acc):
+                if from_acc.balance < tx.amount:
+                    self.log_tx(tx, "declined", "insufficient_funds")
+                    return
+                from_acc.balance -= tx.amount
+                to_acc.balance += tx.amount
+                record = self.record_balances(tx.tx_id, {
+                    tx.from_acc: from_acc.balance,
+                    tx.to_acc: to_acc.balance,
+                })
+
+            self.log_tx(tx, "approved", "completed", record)
+        except Exception as e:
+            self.count_error("payment", e)
             self.log_tx(tx, "rejected", "internal_error")
+        finally:
+            self.mark_processed()
 
-        with self.count_lock:
-            self.processed_count += 1
+    def process_batch(self, txs):
+        """
+        Process a micro-batch of transactions
+            - The striped locks of all accounts in the batch are taken once,
+              transfers are applied in queue order while they are held
+            - Journal records of the approved transfers are made durable
+              together, after the locks are released
+            - A transfer that fails is rolled back and rejected with "internal_error"
+            - If the journal write fails, the approved transfers are undone and
+              rejected with "journal_error", and settlement stops (see journal_failed)
+            - Logs all results and increments processed_count
+        Arguments:
+            txs (list): Transactions to process.
+        """
+        results = []
+        transfers = []
+        for tx in txs:
+            if not tx.ok:
+                results.append((tx, "rejected", tx.reason))
+            elif tx.from_acc in self.accounts and tx.to_acc in self.accounts:
+                transfers.append(tx)
+            else:
+                results.append((tx, "rejected", "internal_error"))
+
+        records = []
+        if transfers:
+            ids = {acc_id for tx in transfers for acc_id in (tx.from_acc, tx.to_acc)}
+            with self.accounts.locked(*ids):
+                for tx in transfers:
+                    from_acc = self.accounts[tx.from_acc]
+                    to_acc = self.accounts[tx.to_acc]
+                    balances = from_acc.balance, to_acc.balance
+                    try:
+                        if balances[0] < tx.amount:
+                            results.append((tx, "declined", "insufficient_funds"))
+                            continue
+                        from_acc.balance = balances[0] - tx.amount
+                        to_acc.balance = balances[1] + tx.amount
+                        records.append(self.record_balances(tx.tx_id, {
+                            tx.from_acc: from_acc.balance,
+                            tx.to_acc: to_acc.balance,
+                        }))
+                    except Exception as e:
+                        from_acc.balance, to_acc.balance = balances
+                        self.count_error("payment", e)
+                        results.append((tx, "rejected", "internal_error"))
+                        continue
+                    results.append((tx, "approved", "completed"))
+
+        if records:
+            try:
+                self.journal.append_many(records)
+            except Exception as e:
+                self.journal_failed(e)
+                self.undo_transfers([tx for tx, status, reason in results if status == "approved"])
+                results = [(tx, "rejected", "journal_error") if status == "approved" else (tx, status, reason)
+                           for tx, status, reason in results]
+
+        for tx, status, reason in results:
+            try:
+                self.record_result(tx, status, reason)
+            except Exception as e:
+                self.count_error("payment", e)
+        self.mark_processed(len(results))
@@ -0,0 +1,193 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+
+class ProfilerException(Exception):
+    """
+    General exception for worker profiler errors.
+    """
+    pass
+
+
+class WorkerProfiler:
+    """
+    Profiler for the worker threads of PaymentsWorkers.
+
+    cProfile only sees the thread that enabled it, so the workers call
+    section() around every micro-batch they process:
+
+    - "cprofile": each worker thread gets its own cProfile.Profile, enabled
+      only inside its sections. finish() merges all of them into one pstats
+      report (<output>.txt) and a binary dump (<output>.prof). Since Python
+      3.12 only one cProfile can be active in the process; a section that
+      cannot enable its profiler is sampled instead and finish() also writes
+      the collapsed stacks of those sections.
+    - "sample": a sampler thread records the stack of every thread that is
+      inside a section every `interval` seconds. finish() writes the counts
+      as collapsed stacks (<output>.folded), the input format of flamegraph.pl
+      and speedscope.
+
+    Time spent waiting for work is not profiled, only batch processing
+    (including lock and journal waits inside it).
+
+    Attributes:
+    - mode: "cprofile" or "sample"
+    - output: Path prefix of the result files
+    - interval: Seconds between two samples ("sample" mode)
+    """
+
+    MODES = ("cprofile", "sample")
+
+    def __init__(self, mode="sample", output="profile", interval=0.005):
+        """
+        Initialize a new WorkerProfiler instance.
+
+        :param mode: "cprofile" or "sample"
+        :param output: Path prefix of the result files
+        :param interval: Seconds between two samples ("sample" mode)
+        :raises ProfilerException: If mode is unknown
+        """
+        if mode not in self.MODES:
+            raise ProfilerException(f"Unknown profiler mode: {mode}")
+
+        self.mode = mode
+        self.output = output
+        self.interval = interval
+
+        self._cond = threading.Condition()
+        self._closed = False
+        self._active = 0
+        self._local = threading.local()
+        self._profiles = []
+        self._busy = {}
+        self._stacks = Counter()
+        self._stop_sampling = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        """
+        Start profiling (starts the sampler thread in "sample" mode).
+        """
+        if self.mode == "sample":
+            self._start_sampler()
+
+    def _start_sampler(self):
+        with self._cond:
+            if self._sampler is None and not self._closed:
+                self._sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+                self._sampler.start()
+
+    @contextmanager
+    def section(self, name):
+        """
+        Profile the code inside the with block on the calling thread.
+
+        :param name: Name of the worker role, the root frame of collapsed stacks
+        """
+        with self._cond:
+            if self._closed:
+                enabled = False
+            else:
+                enabled = True
+                self._active += 1
+
+        if not enabled:
+            yield
+            return
+
+        thread_id = threading.get_ident()
+        profile = None
+        if self.mode == "cprofile":
+            profile = getattr(self._local, "profile", None)
+            if profile is None:
+                profile = self._local.profile = cProfile.Profile()
+                with self._cond:
+                    self._profiles.append(profile)
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12+: another profiler is active in the process
+                profile = None
+                self._start_sampler()
+        if profile is None:
+            self._busy[thread_id] = name
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            else:
+                self._busy.pop(thread_id, None)
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def finish(self, timeout=5):
+        """
+        Stop profiling, wait for running sections and write the merged results.
+
+        :param timeout: Maximum seconds to wait for sections still running
+        :return: List of written file paths
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.wait_for(lambda: self._active == 0, timeout)
+            sampler, self._sampler = self._sampler, None
+        if sampler is not None:
+            self._stop_sampling.set()
+            sampler.join()
+
+        folder = os.path.dirname(self.output)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        if self.mode == "cprofile":
+            return self._write_cprofile() + (self._write_collapsed() if self._stacks else [])
+        return self._write_collapsed()
+
+    def _write_cprofile(self):
+        profiles = [p for p in self._profiles if p.getstats()]
+        if not profiles:
+            return []
+        report = io.StringIO()
+        stats = pstats.Stats(profiles[0], stream=report)
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(self.output + ".prof")
+        stats.sort_stats("cumulative").print_stats(50)
+        with open(self.output + ".txt", "w") as f:
+            f.write(report.getvalue())
+        return [self.output + ".txt", self.output + ".prof"]
+
+    def _write_collapsed(self):
+        path = self.output + ".folded"
+        with open(path, "w") as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return [path]
+
+    def _sample_loop(self):
+        while not self._stop_sampling.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, name in list(self._busy.items()):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self._stacks[self._collapse(name, frame)] += 1
+
+    @staticmethod
+    def _collapse(name, frame):
+        """
+        :return: "root;outer;...;inner" stack string of a frame
+        """
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        names.append(name)
+        return ";".join(reversed(names)).replace(" ", "_")
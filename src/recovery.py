@@ -0,0 +1,109 @@
+import json
+import os
+import struct
+from array import array
+
+
+class SnapshotException(Exception):
+    """
+    General exception for account snapshot errors.
+    """
+    pass
+
+
+class AccountSnapshot:
+    """
+    Compact binary snapshot of all accounts used for fast startup.
+
+    File layout (little endian):
+    - header: magic, journal seq cut, tx_id high-water mark, number of
+      transactions log records covered, number of accounts, size of the owners block
+    - account IDs (int64 each), balances (int64 each), verified flags (int8 each)
+    - owners as a JSON list
+
+    At startup the snapshot is loaded straight into the AccountStore arrays,
+    then only journal records newer than the seq cut are replayed, and only
+    log records after the covered ones are scanned for a higher tx_id.
+
+    Attributes:
+    - path: Path of the snapshot file
+    """
+
+    MAGIC = b"PAYSNAP1"
+    HEADER = struct.Struct("<8sqqqqq")
+
+    def __init__(self, path):
+        """
+        Initialize a new AccountSnapshot instance.
+
+        :param path: Path of the snapshot file
+        """
+        self.path = path
+
+    def write(self, columns, journal_seq, tx_high_water, log_records):
+        """
+        Write the snapshot atomically (temporary file, fsync, rename).
+
+        :param columns: (ids, owners, balances, verified) from AccountStore.export()
+        :param journal_seq: Seq cut; the balances include every journal record up to it
+        :param tx_high_water: Highest tx_id issued when the snapshot was taken
+        :param log_records: Number of transactions log records written before the snapshot
+        """
+        ids, owners, balances, verified = columns
+        owners_block = json.dumps(owners).encode()
+
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, journal_seq, tx_high_water, log_records,
+                                     len(ids), len(owners_block)))
+            ids.tofile(f)
+            balances.tofile(f)
+            verified.tofile(f)
+            f.write(owners_block)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.path)
+
+    def read(self):
+        """
+        Read the snapshot.
+
+        :return: Dictionary {"journal_seq", "tx_high_water", "log_records", "columns"},
+            or None if there is no snapshot
+        :raises SnapshotException: If the file is damaged
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path, "rb") as f:
+            header = f.read(self.HEADER.size)
+            if len(header) != self.HEADER.size:
+                raise SnapshotException("Snapshot header is truncated.")
+            magic, journal_seq, tx_high_water, log_records, count, owners_size = self.HEADER.unpack(header)
+            if magic != self.MAGIC:
+                raise SnapshotException("Not an account snapshot.")
+
+            try:
+                ids = array("q")
+                ids.fromfile(f, count)
+                balances = array("q")
+                balances.fromfile(f, count)
+                verified = array("b")
+                verified.fromfile(f, count)
+            except EOFError:
+                raise SnapshotException("Snapshot is truncated.")
+
+            owners_block = f.read(owners_size)
+            if len(owners_block) != owners_size:
+                raise SnapshotException("Snapshot is truncated.")
+            owners = json.loads(owners_block)
+
+        return {
+            "journal_seq": journal_seq,
+            "tx_high_water": tx_high_water,
+            "log_records": log_records,
+            "columns": (ids, owners, balances, verified),
+        }
@@ -0,0 +1,301 @@
+import threading
+from collections import deque
+from contextlib import contextmanager
+from queue import Queue
+from src.balance_journal import JournalException
+from src.transaction import Transaction
+
+
+class ShardedExecutor:
+    """
+    Account-sharded settlement for PaymentsWorkers.
+
+    Accounts are partitioned by ID across N shards. Every shard has one
+    worker thread that owns its accounts: it is the only thread changing
+    their balances, so settlement needs no account locks.
+
+    - Same-shard transfer: the owner debits and credits in one step.
+    - Cross-shard transfer: two phases. The sender's shard checks funds,
+      debits and journals the debit (phase 1), then sends a credit message to
+      the receiver's shard, which credits and journals the credit (phase 2).
+      The debit record carries the amount in transit, so journal replay after
+      a crash between the phases gives the amount back to the sender.
+
+    If the credit of phase 2 fails, it is rolled back and a refund message
+    returns the amount to the sender on the sender's shard; the transaction
+    is then rejected with "internal_error".
+
+    A checkpoint holds the shards (see held()): shards keep crediting and
+    refunding, but defer new debits until no transfer is in flight and the
+    checkpoint is written, so it never sees a debit without its credit.
+
+    Shard workers never wait for the disk: the final log entry is recorded
+    from the journal callback once the batch is durable.
+
+    Shards are threads of one process, so they do not run Python code in
+    parallel: the mode removes lock contention on hot accounts, it does not
+    add CPU capacity. It is off unless enabled with `shards`.
+
+    Attributes:
+    - payments: PaymentsWorkers owning the accounts, journal and log
+    - shards: Number of shards
+    - queues: One inbox Queue per shard
+    """
+
+    DEBIT = "debit"
+    CREDIT = "credit"
+    REFUND = "refund"
+    RESUME = "resume"
+
+    def __init__(self, payments, shards):
+        """
+        Initialize a new ShardedExecutor instance.
+
+        :param payments: PaymentsWorkers instance
+        :param shards: Number of shards (worker threads)
+        """
+        self.payments = payments
+        self.shards = shards
+        self.queues = [Queue() for _ in range(shards)]
+        self.threads = []
+
+        self._cond = threading.Condition()
+        self._held = 0
+        self._busy = 0
+        self._stopping = False
+        self._deferred = [deque() for _ in range(shards)]
+
+    def shard_of(self, acc_id):
+        """
+        :param acc_id: Account ID
+        :return: Index of the shard owning the account
+        """
+        return hash(acc_id) % self.shards
+
+    def start(self):
+        """
+        Start one owner thread per shard.
+        """
+        self.threads = [threading.Thread(target=self._run, args=(i,), name=f"shard-{i}", daemon=True)
+                        for i in range(self.shards)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Process everything already sent to the shards and stop the owner threads.
+        Credit messages of cross-shard transfers are still delivered, because
+        a shard stops only after all shards finished their debits, and so are
+        refunds of failed credits, in a second round after all credits.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: not self._held)
+            self._stopping = True
+        stop_debits = threading.Barrier(self.shards)
+        for q in self.queues:
+            q.put((None, stop_debits))
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        with self._cond:
+            self._stopping = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def held(self):
+        """
+        Wait until no transfer is being applied or in flight between shards
+        and defer new debits until the context ends. Credits and refunds are
+        still processed, so in-flight transfers can finish. Waits for a
+        running stop() first.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: not self._stopping)
+            self._held += 1
+            self._cond.wait_for(lambda: self._busy == 0)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._held -= 1
+                resume = not self._held
+            if resume:
+                for shard, deferred in enumerate(self._deferred):
+                    if deferred:
+                        self.queues[shard].put((self.RESUME, None))
+
+    def submit(self, tx: Transaction):
+        """
+        Send a transaction that passed antifraud to the shard of its sender.
+
+        :param tx: Transaction to settle
+        """
+        self.queues[self.shard_of(tx.from_acc)].put((self.DEBIT, tx))
+
+    def _run(self, shard):
+        inbox = self.queues[shard]
+        while True:
+            kind, tx = inbox.get()
+            if kind is None:
+                # tx is the stop barrier: once every shard reached it no new
+                # credits can be sent, so the remaining inbox is drained. Failed
+                # credits of that drain send refunds, delivered in a second round.
+                for _ in range(2):
+                    tx.wait()
+                    inbox.put((None, None))
+                    while True:
+                        kind, item = inbox.get()
+                        if kind is None:
+                            break
+                        self._receive(shard, kind, item)
+                return
+            self._receive(shard, kind, tx)
+
+    def _receive(self, shard, kind, tx):
+        """
+        Handle one inbox message. Debits go through the deferred queue of the
+        shard, so debits held back by a checkpoint keep their order.
+        """
+        if kind != self.DEBIT and kind != self.RESUME:
+            self._handle(kind, tx)
+            return
+        deferred = self._deferred[shard]
+        if kind == self.DEBIT:
+            deferred.append(tx)
+        while deferred:
+            with self._cond:
+                if self._held:
+                    return
+                self._busy += 1
+            self._handle(self.DEBIT, deferred.popleft())
+
+    def _handle(self, kind, tx):
+        """
+        Apply one phase of a transfer; the transfer stops counting as busy once
+        no further phase is pending.
+        """
+        pending = False
+        with self.payments.profiled("shard"):
+            try:
+                if kind == self.DEBIT:
+                    pending = self._debit(tx)
+                elif kind == self.CREDIT:
+                    self._credit(tx)
+                else:
+                    self._refund(tx)
+            except Exception as e:
+                self.payments.count_error("shard", e)
+                if kind == self.CREDIT:
+                    # The sender is already debited: its shard gives the money back
+                    self.queues[self.shard_of(tx.from_acc)].put((self.REFUND, tx))
+                    pending = True
+                else:
+                    self.payments.record_result(tx, "rejected", "internal_error")
+                    self.payments.mark_processed()
+            finally:
+                if not pending:
+                    with self._cond:
+                        self._busy -= 1
+                        self._cond.notify_all()
+
+    def _debit(self, tx):
+        """
+        :return: True if a credit message was sent (the transfer is in flight)
+        """
+        p = self.payments
+        if p.journal_error is not None:
+            p.record_result(tx, "rejected", "journal_error")
+            p.mark_processed()
+            return
+        from_acc = p.accounts[tx.from_acc]
+        if from_acc.balance < tx.amount:
+            p.record_result(tx, "declined", "insufficient_funds")
+            p.mark_processed()
+            return
+
+        if self.shard_of(tx.to_acc) != self.shard_of(tx.from_acc):
+            balance = from_acc.balance
+            try:
+                from_acc.balance = balance - tx.amount
+                record = p.record_balances(tx.tx_id, {tx.from_acc: from_acc.balance}, tx.amount)
+            except Exception:
+                from_acc.balance = balance
+                raise
+            self._append_debit(record)
+            self.queues[self.shard_of(tx.to_acc)].put((self.CREDIT, tx))
+            return True
+
+        to_acc = p.accounts[tx.to_acc]
+        balances = from_acc.balance, to_acc.balance
+        try:
+            from_acc.balance = balances[0] - tx.amount
+            to_acc.balance = balances[1] + tx.amount
+            record = p.record_balances(tx.tx_id, {tx.from_acc: from_acc.balance, tx.to_acc: to_acc.balance})
+        except Exception:
+            from_acc.balance, to_acc.balance = balances
+            raise
+        self._append(tx, [record], self._settled)
+
+    def _credit(self, tx):
+        p = self.payments
+        if p.journal_error is not None:
+            # The debit may not be durable: refund instead of crediting
+            raise JournalException("Balance journal write failed, credit refused.")
+        to_acc = p.accounts[tx.to_acc]
+        balance = to_acc.balance
+        try:
+            to_acc.balance = balance + tx.amount
+            record = p.record_balances(tx.tx_id, {tx.to_acc: to_acc.balance}, -tx.amount)
+        except Exception:
+            to_acc.balance = balance
+            raise
+        self._append(tx, [record], self._settled)
+
+    def _refund(self, tx):
+        """
+        Give the amount of a cross-shard transfer whose credit failed back to
+        the sender; runs on the sender's shard.
+        """
+        p = self.payments
+        from_acc = p.accounts[tx.from_acc]
+        from_acc.balance += tx.amount
+        record = p.record_balances(tx.tx_id, {tx.from_acc: from_acc.balance}, -tx.amount, refund=True)
+        self._append(tx, [record], self._refunded)
+
+    def _append_debit(self, record):
+        """
+        Write the journal record of a debit without waiting; a failed write
+        stops settlement, so the credit of the transfer is rejected as well.
+        """
+        def written(error):
+            if error is not None:
+                self.payments.journal_failed(error)
+
+        try:
+            self.payments.journal.append_async([record], written)
+        except Exception as e:
+            written(e)
+
+    def _append(self, tx, records, settled):
+        """
+        Write the journal records of an applied transfer; settled(tx, error)
+        runs once they are durable or the write failed.
+        """
+        try:
+            self.payments.journal.append_async(records, lambda error: settled(tx, error))
+        except Exception as e:
+            settled(tx, e)
+
+    def _settled(self, tx, error):
+        if error is not None:
+            self.payments.journal_failed(error)
+            self.payments.record_result(tx, "rejected", "journal_error")
+        else:
+            self.payments.record_result(tx, "approved", "completed")
+        self.payments.mark_processed()
+
+    def _refunded(self, tx, error):
+        if error is not None:
+            self.payments.journal_failed(error)
+        self.payments.record_result(tx, "rejected", "internal_error")
+        self.payments.mark_processed()
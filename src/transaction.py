@@ -1,5 +1,7 @@
 import time
 
+from src.log_format import log_timestamp
+
 
 class TransactionException(Exception):
     pass
@@ -15,10 +17,23 @@ class Transaction:
         amount: Amount to be transferred
         ok: Antifraud status (True if passed, False if rejected)
         reason: Reason for rejection, if any
+        priority: Priority class, 1 (highest, interactive) to 5 (lowest, bulk)
         timestamp: Time of creation, used for FIFO ordering within same priority
+        handle: TransactionHandle completed with the final log entry (None if nobody waits)
+        entry: Log entry of the transaction, "pending" until settle() updates it in place
+
+    Transactions use __slots__: one is allocated per transfer and lives until
+    it is settled, so no per-instance __dict__ is allocated.
     """
 
-    def __init__(self, tx_id: int, from_acc: int, to_acc: int, amount: int):
+    __slots__ = ("tx_id", "from_acc", "to_acc", "amount", "priority", "ok", "reason", "timestamp",
+                 "handle", "entry")
+
+    PRIORITY_INTERACTIVE = 1
+    PRIORITY_DEFAULT = 3
+    PRIORITY_BULK = 5
+
+    def __init__(self, tx_id: int, from_acc: int, to_acc: int, amount: int, priority: int = PRIORITY_DEFAULT):
         """
         Initialize a new Transaction instance.
 
@@ -26,6 +41,7 @@ class Transaction:
         :param from_acc: Sender account ID
         :param to_acc: Receiver account ID
         :param amount: Amount to be transferred (must be > 0)
+        :param priority: Priority class, 1 (highest) to 5 (lowest)
         :raises TransactionException: If amount <= 0, from_acc == to_acc, or priority is not in 1-5
         """
         if amount <= 0:
@@ -34,14 +50,19 @@ class Transaction:
         if from_acc == to_acc:
             raise TransactionException("Sender and receiver must be different")
 
+        if priority not in range(1, 6):
+            raise TransactionException("Priority must be between 1 and 5")
+
         self.tx_id = tx_id
         self.from_acc = from_acc
         self.to_acc = to_acc
         self.amount = amount
+        self.priority = priority
         self.ok = True
         self.reason = "Completed"
         self.timestamp = time.time()
-
+        self.handle = None
+        self.entry = None
 
     def reject(self, reason: str):
         """
@@ -53,6 +74,39 @@ class Transaction:
         self.ok = False
         self.reason = reason
 
+    def log_entry(self):
+        """
+        Return the log entry of the transaction, created on first use with
+        status "pending". The same dictionary becomes the final entry.
+
+        :return: Log entry dictionary
+        """
+        if self.entry is None:
+            self.entry = {
+                "timestamp": log_timestamp(self.timestamp),
+                "tx_id": self.tx_id,
+                "from": self.from_acc,
+                "to": self.to_acc,
+                "amount": self.amount,
+                "status": "pending",
+                "reason": "processing",
+            }
+        return self.entry
+
+    def settle(self, status, reason):
+        """
+        Update the log entry in place with the final status.
+
+        :param status: approved / declined / rejected
+        :param reason: Reason of the status
+        :return: The final log entry dictionary
+        """
+        entry = self.log_entry()
+        entry["timestamp"] = log_timestamp()
+        entry["status"] = status
+        entry["reason"] = reason
+        return entry
+
     def __str__(self):
         """
         Return a string representation of the transaction.
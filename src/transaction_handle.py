@@ -0,0 +1,65 @@
+from concurrent.futures import Future, TimeoutError, wait
+
+
+class TransactionHandle(Future):
+    """
+    Handle of a submitted transaction, returned by PaymentsWorkers.submit.
+
+    A concurrent.futures.Future that the payment worker completes with the
+    final log entry ({"tx_id", "status", "reason", ...}) when the transaction
+    is approved, declined or rejected:
+
+        handle = payments.submit(1, 2, 100)
+        handle.add_done_callback(lambda h: print(h.result()["status"]))
+        entry = handle.result(timeout=5)
+
+    A submitted transaction cannot be cancelled, cancel() always returns False.
+
+    Attributes:
+    - tx_id: ID of the transaction
+    """
+
+    def __init__(self, tx_id):
+        """
+        Initialize a new TransactionHandle instance.
+
+        :param tx_id: ID of the transaction
+        """
+        super().__init__()
+        self.tx_id = tx_id
+
+    @property
+    def status(self):
+        """
+        :return: Final status, or "pending" while the transaction is in flight
+        """
+        return self.result()["status"] if self.done() else "pending"
+
+    @property
+    def reason(self):
+        """
+        :return: Reason of the final status, or None while the transaction is in flight
+        """
+        return self.result()["reason"] if self.done() else None
+
+    def cancel(self):
+        return False
+
+    def __repr__(self):
+        return f"TransactionHandle(tx_id={self.tx_id}, status={self.status})"
+
+
+def wait_all(handles, timeout=None):
+    """
+    Wait until every transaction is settled.
+
+    :param handles: Iterable of TransactionHandle
+    :param timeout: Maximum seconds to wait (None = wait forever)
+    :return: List of the final log entries in the order of handles
+    :raises TimeoutError: If a transaction is still in flight after timeout
+    """
+    handles = list(handles)
+    done, pending = wait(handles, timeout)
+    if pending:
+        raise TimeoutError(f"{len(pending)} of {len(handles)} transactions are still in flight.")
+    return [handle.result() for handle in handles]
@@ -0,0 +1,737 @@
+import bisect
+import mmap
+import os
+import threading
+import time
+from array import array
+from collections import deque
+from itertools import islice
+
+from src.log_format import INDEX_RECORD, LogFormatException, detect_format, open_formats
+from src.log_segments import Segment, read_manifest, write_manifest
+
+
+class TransactionLog:
+    """
+    Memory-bounded transaction log.
+
+    Only the most recent `window` entries are kept in memory (a ring).
+    Older entries stay in the log file (JSON lines or binary records, see
+    log_format) and are read lazily through a memory map. A sidecar index file stores one fixed-size
+    record per logged entry: (tx_id, from, to, file offset).
+
+    Iterating over the log yields the entries of the in-memory window,
+    so existing code scanning transactions_log keeps working. A transaction's
+    entry is appended when it is submitted (pending) and again when it is
+    settled: it is the same dictionary, updated in place, so readers of the
+    window see it once, at its newest position. The newest position of each
+    dictionary in the window is kept up to date on append, so len() takes
+    constant time. Iteration works on a copy of the window taken under a
+    lock, so concurrent appends cannot change it.
+
+    A secondary index keyed by account ID answers history() queries in time
+    proportional to the account's own activity: the newest entries of each
+    account are kept in a per-account deque, older ones are found through
+    per-account lists of file offsets.
+
+    The log file is segmented: once the active file reaches segment_bytes or
+    segment_seconds, the LogWriter closes it and roll() renames it (and its
+    index) to "<path>.<seq>" and records it in "<path>.manifest". A background
+    thread then seals the segment: it stores the tx_id range, first and last
+    offsets and a bloom filter of the account IDs in the manifest, drops
+    pending entries superseded by the final entry of the same transaction,
+    and gzips the segment. Index record numbers are global over all segments
+    and never change, so lookups by tx_id and history queries open only the
+    segments whose manifest entry can match.
+
+    Each file keeps the format it was written in: when log_format differs
+    from the format of the existing active file, load() seals that file as
+    a segment first.
+
+    Attributes:
+    - path: Path of the active transactions log file
+    - index_path: Path of the sidecar index file of the active file
+    - manifest_path: Path of the segment manifest
+    - window: Maximum number of entries kept in memory
+    - history_window: Maximum number of entries kept in memory per account
+    - segment_bytes: Size of the active file that starts a new segment (0 = never)
+    - segment_seconds: Age of the active file that starts a new segment (0 = never)
+    - compress: Gzip sealed segments
+    - log_format: JsonLinesFormat or BinaryFormat of new entries
+    - segments: Sealed Segment list, oldest first
+    - seq: Number of entries appended so far, the cursor of changes_since()
+    """
+
+    INDEX_RECORD = INDEX_RECORD
+    BLOCK = 4096
+    LOADED_SEGMENTS = 2
+
+    def __init__(self, path, window=10000, index_path=None, history_window=1000,
+                 segment_bytes=0, segment_seconds=0, compress=True, log_format="jsonl"):
+        """
+        Initialize a new TransactionLog instance.
+
+        :param path: Path of the transactions log file
+        :param window: Maximum number of entries kept in memory
+        :param index_path: Path of the sidecar index (default: path + ".idx")
+        :param history_window: Maximum number of entries kept in memory per account
+        :param segment_bytes: Size of the active file that starts a new segment (0 = never)
+        :param segment_seconds: Age of the active file that starts a new segment (0 = never)
+        :param compress: Gzip sealed segments
+        :param log_format: Format of new entries, "jsonl" or "binary"
+        :raises SegmentException: If the segment manifest cannot be read
+        :raises LogFormatException: If log_format is unknown
+        """
+        self.formats = open_formats(path)
+        if log_format not in self.formats:
+            raise LogFormatException(f"Unknown log format: {log_format}")
+        self.log_format = self.formats[log_format]
+        self.path = path
+        self.index_path = index_path or path + ".idx"
+        self.manifest_path = path + ".manifest"
+        self.window = window
+        self.history_window = history_window
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.compress = compress
+
+        self.seq = 0
+
+        self._recent = deque(maxlen=window)
+        self._last = {}
+        self._window_lock = threading.Lock()
+        self._by_account = {}
+        self._account_offsets = None
+        self._lock = threading.Lock()
+        self._index_file = None
+        self._count = None
+        self._log_map = None
+        self._index_map = None
+        self._blocks = None
+
+        self.segments = []
+        self._segment_starts = []
+        self._sealed_records = 0
+        self._loaded = deque()
+        self._active_since = None
+        self._seal_queue = deque()
+        self._seal_lock = threading.Lock()
+        self._sealer = None
+        self._active_format = self.formats.get(detect_format(path), self.log_format)
+        self._load_segments()
+
+    def __iter__(self):
+        with self._window_lock:
+            return iter(list(self._newest(self.seq - len(self._recent))))
+
+    def __len__(self):
+        return len(self._last)
+
+    def append(self, entry):
+        """
+        Add an entry to the in-memory window.
+
+        :param entry: Log entry dictionary
+        """
+        with self._window_lock:
+            recent = self._recent
+            if len(recent) == recent.maxlen:
+                oldest = recent[0]
+                if self._last.get(id(oldest)) == self.seq - len(recent):
+                    del self._last[id(oldest)]
+            recent.append(entry)
+            self._last[id(entry)] = self.seq
+            self.seq += 1
+            self._add_to_account(entry)
+
+    def extend(self, entries):
+        """
+        Add several entries to the in-memory window.
+
+        :param entries: Iterable of log entry dictionaries
+        """
+        for entry in entries:
+            self.append(entry)
+
+    def changes_since(self, cursor):
+        """
+        Return the entries appended after cursor.
+
+        :param cursor: Value of seq returned by a previous call (0 = start)
+        :return: (entries, new cursor, complete); complete is False when some
+            entries after cursor already left the in-memory window
+        """
+        with self._window_lock:
+            new = self.seq - cursor
+            if new < 0 or new > len(self._recent):
+                return list(self._newest(self.seq - len(self._recent))), self.seq, False
+            return list(self._newest(cursor)), self.seq, True
+
+    def indexed_count(self):
+        """
+        :return: Number of entries in the log files (sidecar index records of all segments)
+        """
+        with self._lock:
+            return self._index_count()
+
+    def max_tx_id(self, start=0):
+        """
+        Highest tx_id in the log files after the first `start` entries.
+        Reads only the fixed-size sidecar index records, no JSON; sealed
+        segments entirely after start use their manifest tx_id range.
+
+        :param start: Number of index records to skip (e.g. covered by a snapshot)
+        :return: Highest tx_id, 0 if there are no records after start
+        """
+        with self._lock:
+            high = 0
+            for segment in self.segments:
+                if start < segment.first_record + segment.records:
+                    high = max(high, segment.max_tx_id(max(0, start - segment.first_record)))
+
+            start = max(0, start - self._sealed_records)
+            count = self._active_count()
+            if start >= count:
+                return high
+            self._index_map = self._map(self.index_path, self._index_map, count * self.INDEX_RECORD.size)
+            size = self.INDEX_RECORD.size
+            data = self._index_map[start * size:count * size]
+            return max(high, max(record[0] for record in self.INDEX_RECORD.iter_unpack(data)))
+
+    def page(self, end, count):
+        """
+        Read a page of entries from the log file.
+
+        :param end: Index record number after the last entry of the page
+        :param count: Number of entries in the page
+        :return: (entries, start) where start is the record number of the first entry
+        """
+        with self._lock:
+            end = min(end, self._index_count())
+            start = max(0, end - count)
+            entries = [self._read_record(i) for i in range(start, end)]
+        return [e for e in entries if e is not None], start
+
+    def history(self, acc_id, since=None, limit=100):
+        """
+        Return the log entries of one account (as sender or receiver), oldest first.
+
+        The per-account deque is used first; only when it holds fewer than
+        `limit` matching entries are older entries read from disk.
+
+        :param acc_id: Account ID
+        :param since: Only entries with timestamp >= since ("%Y-%m-%d %H:%M:%S")
+        :param limit: Maximum number of (newest) entries returned (None = all)
+        :return: List of entry dictionaries
+        """
+        recent = _unique(self._by_account.get(acc_id, ()))
+        entries = [e for e in recent if since is None or e["timestamp"] >= since]
+
+        if limit is None or len(entries) < limit:
+            need = None if limit is None else limit - len(entries)
+            entries = self._older_history(acc_id, recent, since, need) + entries
+
+        return entries if limit is None else entries[-limit:]
+
+    def load(self):
+        """
+        Bring the sidecar index up to date with the log file and fill the
+        in-memory window with the newest entries. Only the part of the active
+        file not covered by the index is parsed; sealed segments are opened
+        only if the window reaches back into them. Segments left unsealed
+        by an earlier run are sealed in the background.
+        """
+        with self._lock:
+            self._close_maps()
+            self._count = None
+            self._load_segments()
+            self._active_format = self.formats.get(detect_format(self.path), self.log_format)
+            self._sync_index()
+            if self._active_format is not self.log_format:
+                self._roll_active()
+                self._active_format = self.log_format
+            count = self._index_count()
+            recent = []
+            for i in range(max(0, count - self.window), count):
+                entry = self._read_record(i)
+                if entry is not None:
+                    recent.append(entry)
+            self._account_offsets = None
+            self._active_since = self._first_timestamp()
+            unsealed = [s for s in self.segments
+                        if not s.sealed or (self.compress and not s.info.get("compressed"))]
+
+        for segment in unsealed:
+            self._schedule_seal(segment)
+
+        with self._window_lock:
+            self._recent = deque(maxlen=self.window)
+            self._last = {}
+            self._by_account = {}
+        self.extend(recent)
+
+    def index_batch(self, entries, offsets):
+        """
+        Record the file offsets of entries just written to the log file.
+        Called by the LogWriter thread after each batch.
+
+        :param entries: Log entry dictionaries
+        :param offsets: File offset of each entry
+        """
+        data = b"".join(self.INDEX_RECORD.pack(e["tx_id"], e["from"], e["to"], offset)
+                        for e, offset in zip(entries, offsets))
+        with self._lock:
+            first = self._active_count()
+            if not first:
+                self._active_since = time.time()
+            self._append_index(data)
+            if self._blocks is not None:
+                for i, e in enumerate(entries, first):
+                    self._add_to_block(i, e["tx_id"])
+            if self._account_offsets is not None:
+                for e, offset in zip(entries, offsets):
+                    self._add_account_offset(e["from"], e["to"], offset)
+
+    def should_roll(self, size):
+        """
+        Called by the LogWriter thread after each batch.
+
+        :param size: Size of the active log file
+        :return: True if the active file should be sealed as a segment
+        """
+        if self.segment_bytes and size >= self.segment_bytes:
+            return True
+        return bool(self.segment_seconds) and self._active_since is not None and \
+            time.time() - self._active_since >= self.segment_seconds
+
+    def roll(self):
+        """
+        Turn the active log file into a sealed segment and start a new one.
+        Called by the LogWriter thread after it closed the file; the manifest
+        is written before the files are renamed, so load() can finish an
+        interrupted roll.
+
+        :return: The new Segment, or None if the active file is empty
+        """
+        with self._lock:
+            segment = self._roll_active()
+        if segment is not None:
+            self._schedule_seal(segment)
+        return segment
+
+    def read(self, offset):
+        """
+        Read one entry from the active log file.
+
+        :param offset: File offset of the entry
+        :return: Entry dictionary, or None if there is no complete entry at offset
+        """
+        with self._lock:
+            return self._read_at(offset)
+
+    def get(self, tx_id):
+        """
+        Find all logged entries of a transaction (e.g. pending and final).
+        Only sealed segments and index blocks of the active file whose
+        tx_id range contains tx_id are scanned.
+
+        :param tx_id: Transaction ID
+        :return: List of entry dictionaries in log order
+        """
+        with self._lock:
+            found = []
+            for segment in self.segments:
+                if segment.holds_tx(tx_id):
+                    for record in segment.iter_records():
+                        if record[0] == tx_id:
+                            entry = self._read_in(segment, record[3])
+                            if entry is not None:
+                                found.append(entry)
+
+            if self._blocks is None:
+                self._build_blocks()
+            for block, (low, high) in enumerate(self._blocks):
+                if low <= tx_id <= high:
+                    start = block * self.BLOCK
+                    for i in range(start, min(start + self.BLOCK, self._active_count())):
+                        record = self._index_record(i)
+                        if record[0] == tx_id:
+                            entry = self._read_at(record[3])
+                            if entry is not None:
+                                found.append(entry)
+            return found
+
+    def scan(self, start=0):
+        """
+        Iterate over all logged entries, oldest first, reading them lazily.
+
+        :param start: Number of index records to skip
+        :return: Generator of entry dictionaries
+        """
+        i = start
+        while True:
+            with self._lock:
+                if i >= self._index_count():
+                    return
+                entry = self._read_record(i)
+            if entry is not None:
+                yield entry
+            i += 1
+
+    def close(self):
+        """
+        Wait for the background sealing, close the index file and the memory maps.
+        """
+        with self._seal_lock:
+            sealer = self._sealer
+        if sealer is not None:
+            sealer.join()
+        with self._lock:
+            self._close_maps()
+            for segment in self.segments:
+                segment.release()
+            self._loaded.clear()
+            if self._index_file:
+                self._index_file.close()
+                self._index_file = None
+
+    def _newest(self, start):
+        """
+        Entries of the window appended at seq >= start, each dictionary only
+        at its newest position. The caller holds the window lock.
+        """
+        last = self._last
+        skip = start - (self.seq - len(self._recent))
+        for seq, entry in enumerate(islice(self._recent, skip, None), start):
+            if last.get(id(entry)) == seq:
+                yield entry
+
+    def _add_to_account(self, entry):
+        for acc_id in (entry["from"], entry["to"]):
+            recent = self._by_account.get(acc_id)
+            if recent is None:
+                recent = self._by_account[acc_id] = deque(maxlen=self.history_window)
+            recent.append(entry)
+
+    def _older_history(self, acc_id, recent, since, need):
+        """
+        Read entries of an account from disk that are no longer in its deque,
+        newest first, until `need` entries are found or `since` is passed.
+        """
+        in_memory = {(e["tx_id"], e["status"]) for e in recent}
+        older = []
+        with self._lock:
+            for entry in self._account_entries(acc_id):
+                if (entry["tx_id"], entry["status"]) in in_memory:
+                    continue
+                if since is not None and entry["timestamp"] < since:
+                    break
+                older.append(entry)
+                if need is not None and len(older) >= need:
+                    break
+        older.reverse()
+        return older
+
+    def _account_entries(self, acc_id):
+        """
+        Entries of an account on disk, newest first: the active file through
+        the per-account offsets, then the sealed segments whose bloom filter
+        may contain the account.
+        """
+        if self._account_offsets is None:
+            self._build_account_offsets()
+        for offset in reversed(self._account_offsets.get(acc_id, ())):
+            entry = self._read_at(offset)
+            if entry is not None:
+                yield entry
+
+        for segment in reversed(self.segments):
+            if segment.holds_account(acc_id):
+                for offset in reversed(segment.account_offsets(acc_id)):
+                    entry = self._read_in(segment, offset)
+                    if entry is not None:
+                        yield entry
+
+    def _build_account_offsets(self):
+        """
+        Build the per-account lists of file offsets from the sidecar index
+        of the active file. Done on the first history query that needs the disk.
+        """
+        self._account_offsets = {}
+        for i in range(self._active_count()):
+            tx_id, from_acc, to_acc, offset = self._index_record(i)
+            self._add_account_offset(from_acc, to_acc, offset)
+
+    def _add_account_offset(self, from_acc, to_acc, offset):
+        for acc_id in (from_acc, to_acc):
+            offsets = self._account_offsets.get(acc_id)
+            if offsets is None:
+                offsets = self._account_offsets[acc_id] = array("q")
+            offsets.append(offset)
+
+    def _close_maps(self):
+        for m in (self._log_map, self._index_map):
+            if m is not None:
+                m.close()
+        self._log_map = None
+        self._index_map = None
+
+    def _map(self, path, current, needed):
+        """
+        Return a read-only memory map of path covering at least `needed` bytes,
+        remapping when the file has grown. None if the file is too small.
+        """
+        if current is not None and len(current) >= needed:
+            return current
+        if not os.path.exists(path) or os.path.getsize(path) < max(needed, 1):
+            return current
+        if current is not None:
+            current.close()
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _read_at(self, offset):
+        m = self._log_map = self._map(self.path, self._log_map, offset + 1)
+        if m is None or offset >= len(m):
+            return None
+        if self._active_format.record_end(m, offset) < 0:
+            m = self._log_map = self._map(self.path, m, len(m) + 1)
+        return self._active_format.decode(m, offset)
+
+    def _read_in(self, segment, offset):
+        """
+        Read an entry of a sealed segment (None = active file). Only the
+        LOADED_SEGMENTS most recently read segments keep their data loaded.
+        """
+        if segment is None:
+            return self._read_at(offset)
+        entry = segment.read(offset)
+        if not self._loaded or self._loaded[-1] is not segment:
+            if segment in self._loaded:
+                self._loaded.remove(segment)
+            self._loaded.append(segment)
+            while len(self._loaded) > self.LOADED_SEGMENTS:
+                self._loaded.popleft().release()
+        return entry
+
+    def _read_record(self, i):
+        """
+        Read the entry of a global index record number.
+        """
+        if i >= self._sealed_records:
+            return self._read_at(self._index_record(i - self._sealed_records)[3])
+        segment = self.segments[bisect.bisect_right(self._segment_starts, i) - 1]
+        return self._read_in(segment, segment.record(i - segment.first_record)[3])
+
+    def _index_count(self):
+        return self._sealed_records + self._active_count()
+
+    def _active_count(self):
+        if self._count is None:
+            exists = os.path.exists(self.index_path)
+            self._count = os.path.getsize(self.index_path) // self.INDEX_RECORD.size if exists else 0
+        return self._count
+
+    def _index_record(self, i):
+        end = (i + 1) * self.INDEX_RECORD.size
+        self._index_map = self._map(self.index_path, self._index_map, end)
+        return self.INDEX_RECORD.unpack_from(self._index_map, i * self.INDEX_RECORD.size)
+
+    def _append_index(self, data):
+        if self._index_file is None:
+            folder = os.path.dirname(self.index_path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self._index_file = open(self.index_path, "ab")
+        self._index_file.write(data)
+        self._index_file.flush()
+        self._count = self._active_count() + len(data) // self.INDEX_RECORD.size
+
+    def _sync_index(self):
+        """
+        Index the part of the log file written after the last index record.
+        A missing or inconsistent index is rebuilt from the whole log.
+        """
+        if not os.path.exists(self.path):
+            if os.path.exists(self.index_path):
+                self._reset_index()
+            return
+
+        if os.path.exists(self.index_path):
+            torn = os.path.getsize(self.index_path) % self.INDEX_RECORD.size
+            if torn:
+                with open(self.index_path, "r+b") as f:
+                    f.truncate(os.path.getsize(self.index_path) - torn)
+
+        log_size = os.path.getsize(self.path)
+        count = self._active_count()
+        indexed_end = 0
+        if count:
+            last_offset = self._index_record(count - 1)[3]
+            self._log_map = self._map(self.path, self._log_map, last_offset + 1)
+            end = -1 if last_offset >= log_size else self._active_format.record_end(self._log_map, last_offset)
+            if end < 0:
+                self._reset_index()
+            else:
+                indexed_end = end
+
+        self._blocks = None
+        data = self._active_format.index(self.path, indexed_end)
+        if data:
+            self._append_index(data)
+
+    def _reset_index(self):
+        if self._index_file:
+            self._index_file.close()
+            self._index_file = None
+        self._close_maps()
+        os.remove(self.index_path)
+        self._count = 0
+
+    def _build_blocks(self):
+        """
+        Build the (min tx_id, max tx_id) summary of every index block.
+        """
+        self._blocks = []
+        for i in range(self._active_count()):
+            self._add_to_block(i, self._index_record(i)[0])
+
+    def _add_to_block(self, i, tx_id):
+        block = i // self.BLOCK
+        if block == len(self._blocks):
+            self._blocks.append((tx_id, tx_id))
+        else:
+            low, high = self._blocks[block]
+            self._blocks[block] = (min(low, tx_id), max(high, tx_id))
+
+    def _load_segments(self):
+        """
+        Read the segment manifest and finish a roll or seal interrupted by a crash.
+        """
+        for segment in self.segments:
+            segment.release()
+        self._loaded.clear()
+        folder = os.path.dirname(self.path)
+        self.segments = [Segment(folder, info, self.formats[info.get("format", "jsonl")])
+                         for info in read_manifest(self.manifest_path)]
+
+        for segment in self.segments:
+            segment.recover()
+            if segment.info.get("compressed"):
+                segment.remove_plain()
+                continue
+            if not os.path.exists(segment.path) and segment is self.segments[-1] and os.path.exists(self.path):
+                if not os.path.exists(segment.index_path) and os.path.exists(self.index_path):
+                    os.replace(self.index_path, segment.index_path)
+                os.replace(self.path, segment.path)
+                self._count = None
+            if not os.path.exists(segment.index_path):
+                with open(segment.index_path, "wb") as f:
+                    f.write(segment.log_format.index(segment.path))
+        self._number_segments()
+
+    def _roll_active(self):
+        """
+        Rename the active file and its index to the next segment. The caller
+        holds the lock and schedules the sealing.
+        """
+        count = self._active_count()
+        if not count or not os.path.exists(self.path):
+            return None
+        seq = int(self.segments[-1].info["name"].rsplit(".", 1)[1]) + 1 if self.segments else 1
+        segment = Segment(os.path.dirname(self.path), {
+            "name": f"{os.path.basename(self.path)}.{seq:06d}",
+            "records": count,
+            "created": self._active_since or time.time(),
+            "sealed_at": time.time(),
+            "format": self._active_format.name,
+        }, self._active_format)
+        if self._index_file:
+            self._index_file.close()
+            self._index_file = None
+        self._close_maps()
+
+        self.segments.append(segment)
+        self._number_segments()
+        write_manifest(self.manifest_path, self.segments)
+        os.replace(self.index_path, segment.index_path)
+        os.replace(self.path, segment.path)
+
+        self._count = 0
+        self._blocks = None
+        self._account_offsets = None
+        self._active_since = None
+        return segment
+
+    def _number_segments(self):
+        total = 0
+        for segment in self.segments:
+            segment.first_record = total
+            total += segment.records
+        self._segment_starts = [segment.first_record for segment in self.segments]
+        self._sealed_records = total
+
+    def _first_timestamp(self):
+        """
+        Creation time of the active file, from the timestamp of its first entry.
+        """
+        if not self._active_count():
+            return None
+        entry = self._read_at(self._index_record(0)[3])
+        try:
+            return time.mktime(time.strptime(entry["timestamp"], "%Y-%m-%d %H:%M:%S"))
+        except (TypeError, KeyError, ValueError):
+            return time.time()
+
+    def _segment_named(self, name):
+        return next((s for s in self.segments if s.info["name"] == name), None)
+
+    def _schedule_seal(self, segment):
+        with self._seal_lock:
+            self._seal_queue.append(segment)
+            if self._sealer is None:
+                self._sealer = threading.Thread(target=self._seal_loop, name="log-sealer", daemon=True)
+                self._sealer.start()
+
+    def _seal_loop(self):
+        """
+        Sealing thread: summarize, compact and compress the queued segments.
+        The result is applied to the segment of the same name in the current
+        manifest, which load() may have re-read meanwhile.
+        """
+        while True:
+            with self._seal_lock:
+                if not self._seal_queue:
+                    self._sealer = None
+                    return
+                name = self._seal_queue.popleft().info["name"]
+            try:
+                with self._lock:
+                    segment = self._segment_named(name)
+                if segment is None or (segment.sealed and (segment.info.get("compressed") or not self.compress)):
+                    continue
+                info, files = segment.seal(self.compress)
+                with self._lock:
+                    current = self._segment_named(name)
+                    if current is None:
+                        continue
+                    if current in self._loaded:
+                        self._loaded.remove(current)
+                    current.commit(info, files, lambda: write_manifest(self.manifest_path, self.segments))
+                current.remove_plain()
+            except Exception as e:
+                print("Error sealing transactions log segment:", e)
+
+
+def _unique(entries):
+    """
+    Entries without repeats of the same dictionary, each at its last position.
+    """
+    seen = set()
+    unique = []
+    for entry in reversed(list(entries)):
+        if id(entry) not in seen:
+            seen.add(id(entry))
+            unique.append(entry)
+    unique.reverse()
+    return unique
@@ -0,0 +1,64 @@
+import unittest
+import threading
+from src.account_store import AccountStore, AccountView
+from src.account import Account, AccountException
+
+
+class TestAccountStore(unittest.TestCase):
+    def setUp(self):
+        self.store = AccountStore(stripes=4)
+        self.store.bulk_load([(1, "Alice", 100, True), (2, "Bob", 50, False)])
+
+    def test_views_read_and_write_the_store(self):
+        """Check that views behave like Account and write through to the arrays."""
+        acc = self.store[1]
+        self.assertIsInstance(acc, AccountView)
+        self.assertIsInstance(acc, Account)
+        self.assertEqual((acc.owner, acc.balance, acc.verified), ("Alice", 100, True))
+
+        acc.balance -= 30
+        self.store[2].verified = True
+        self.assertEqual(self.store[1].balance, 70)
+        self.assertTrue(self.store[2].verified)
+        self.assertIn("Account(owner=Alice", str(acc))
+        self.assertFalse(hasattr(acc, "__dict__"))
+
+    def test_dictionary_interface(self):
+        """Check the dictionary-like interface used by PaymentsCore."""
+        self.store[7] = Account("Carol", 10, verified=True)
+        self.store[1] = Account("Alice", 999)
+
+        self.assertIn(7, self.store)
+        self.assertNotIn(3, self.store)
+        self.assertIsNone(self.store.get(3))
+        self.assertEqual(self.store.keys(), [1, 2, 7])
+        self.assertEqual(self.store[1].balance, 999)
+        self.assertEqual(self.store[7].owner, "Carol")
+        self.assertEqual(list(self.store.dump())[-1], (7, "Carol", 10, True))
+        with self.assertRaises(KeyError):
+            self.store[3]
+
+    def test_bulk_load_rejects_invalid_rows(self):
+        """Check that negative balances and duplicate IDs are refused."""
+        with self.assertRaises(AccountException):
+            self.store.bulk_load([(3, "Dave", -1, False)])
+        with self.assertRaises(AccountException):
+            self.store.bulk_load([(1, "Alice", 1, False)])
+
+    def test_locked_same_stripe_does_not_deadlock(self):
+        """Check that locking two accounts on the same stripe takes the lock once."""
+        self.store.bulk_load((i, f"User{i}", 0, False) for i in range(3, 10))
+        self.assertIs(self.store[1].lock, self.store[5].lock)
+
+        done = threading.Event()
+
+        def transfer():
+            with self.store.locked(1, 5):
+                done.set()
+
+        threading.Thread(target=transfer, daemon=True).start()
+        self.assertTrue(done.wait(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
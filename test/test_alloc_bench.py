@@ -0,0 +1,23 @@
+import unittest
+from bench.alloc_bench import measure_model, measure_pipeline, legacy_transfer, current_transfer
+from bench.pipeline_bench import Workload
+
+
+class TestAllocBench(unittest.TestCase):
+    def test_current_model_allocates_less(self):
+        """Check that a transfer allocates fewer objects and bytes than in the legacy representation."""
+        transfers = Workload(accounts=20, transactions=2000).transfers
+        legacy = measure_model(legacy_transfer, transfers)
+        current = measure_model(current_transfer, transfers)
+        self.assertLess(current["allocations"], legacy["allocations"])
+        self.assertLess(current["bytes"], legacy["bytes"])
+
+    def test_measure_pipeline(self):
+        """Check that a small pipeline run reports the memory per settled transaction."""
+        result = measure_pipeline(Workload(accounts=20, transactions=200, reject_ratio=0, decline_ratio=0))
+        self.assertEqual(set(result), {"retained_bytes", "peak_bytes", "seconds"})
+        self.assertGreater(result["peak_bytes"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
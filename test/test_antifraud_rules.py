@@ -0,0 +1,92 @@
+import unittest
+from src.account import Account
+from src.account_store import AccountStore
+from src.antifraud_rules import (RuleEngine, RollingCounters, VelocityRule, NewPayeeRule, FanOutRule,
+                                 UnverifiedLimitRule, build_rules, AntifraudException)
+from src.transaction import Transaction
+
+
+class TestAntifraudRules(unittest.TestCase):
+
+    def setUp(self):
+        self.accounts = AccountStore()
+        for acc_id in range(1, 6):
+            self.accounts[acc_id] = Account(f"User{acc_id}", 100000, acc_id != 1)
+
+    def tx(self, tx_id, from_acc, to_acc, amount, timestamp=1000.0):
+        tx = Transaction(tx_id, from_acc, to_acc, amount)
+        tx.timestamp = timestamp
+        return tx
+
+    def test_unverified_limit(self):
+        """Check that the default rules reject large transfers of unverified senders only."""
+        engine = RuleEngine(self.accounts)
+        results = engine.evaluate([self.tx(1, 1, 2, 15000), self.tx(2, 2, 1, 15000), self.tx(3, 1, 2, 100)])
+        self.assertEqual(results, [(False, "unverified_limit"), (True, "Completed"), (True, "Completed")])
+
+    def test_rolling_counters_expire(self):
+        """Check that rolling counters forget transactions older than the window."""
+        counters = RollingCounters(window=60, buckets=6)
+        counters.add(1, 0, 100)
+        counters.add(1, 30, 50)
+        self.assertEqual(counters.totals(1, 55), (2, 150))
+        self.assertEqual(counters.totals(1, 75), (1, 50))
+        self.assertEqual(counters.totals(1, 200), (0, 0))
+        self.assertEqual(counters.totals(2, 0), (0, 0))
+
+    def test_velocity_within_batch(self):
+        """Check that velocity limits count earlier transactions of the same batch."""
+        engine = RuleEngine(self.accounts, [VelocityRule(window=60, max_count=2, max_amount=500)])
+        results = engine.evaluate([self.tx(1, 2, 3, 100), self.tx(2, 2, 4, 100), self.tx(3, 2, 5, 100),
+                                   self.tx(4, 3, 2, 600)])
+        self.assertEqual([ok for ok, reason in results], [True, True, False, False])
+        self.assertEqual(results[2][1], "velocity_limit")
+
+        later = engine.evaluate([self.tx(5, 2, 3, 100, timestamp=1100.0)])
+        self.assertEqual(later, [(True, "Completed")])
+
+    def test_new_payee_and_fan_out(self):
+        """Check new payee limits and the number of distinct receivers per window."""
+        engine = RuleEngine(self.accounts, [NewPayeeRule(max_amount=1000), FanOutRule(window=60, max_payees=2)])
+        results = engine.evaluate([self.tx(1, 2, 3, 2000), self.tx(2, 2, 3, 2000), self.tx(3, 2, 3, 10),
+                                   self.tx(4, 2, 4, 10), self.tx(5, 2, 5, 10)])
+        self.assertEqual(results, [(False, "new_payee_limit"), (False, "new_payee_limit"), (True, "Completed"),
+                                   (True, "Completed"), (False, "fan_out")])
+
+        # Receiver 3 is known after the accepted transfer, receiver 5 was only attempted
+        later = engine.evaluate([self.tx(6, 2, 3, 2000, timestamp=1100.0), self.tx(7, 2, 5, 2000, timestamp=1100.0)])
+        self.assertEqual(later, [(True, "Completed"), (False, "new_payee_limit")])
+
+    def test_rule_state_is_bounded(self):
+        """Check that prune drops idle senders and the least recently used payees."""
+        velocity = VelocityRule(window=60, max_count=10)
+        new_payee = NewPayeeRule(max_amount=1000, max_payees=2, max_senders=2)
+        fan_out = FanOutRule(window=60)
+        engine = RuleEngine(self.accounts, [velocity, new_payee, fan_out], prune_every=2)
+
+        engine.evaluate([self.tx(1, 2, 3, 10), self.tx(2, 2, 4, 10), self.tx(3, 2, 5, 10), self.tx(4, 3, 2, 10)])
+        self.assertEqual(list(new_payee.payees[2]), [4, 5])
+        engine.evaluate([self.tx(5, 4, 2, 10, timestamp=1030.0)])
+        self.assertEqual(list(new_payee.payees), [3, 4])
+
+        engine.prune(now=1080.0)
+        self.assertEqual((len(velocity.counters), list(fan_out._recent)), (1, [4]))
+
+    def test_first_failing_rule_wins(self):
+        """Check that the reason of the first failing rule is reported."""
+        engine = RuleEngine(self.accounts, [UnverifiedLimitRule(limit=10), NewPayeeRule(max_amount=10)])
+        self.assertEqual(engine.evaluate([self.tx(1, 1, 2, 50)]), [(False, "unverified_limit")])
+
+    def test_build_rules(self):
+        """Check that rules are created from config and unknown rules are refused."""
+        rules = build_rules([{"rule": "velocity", "window": 10, "max_count": 3}, {"rule": "fan_out"}])
+        self.assertIsInstance(rules[0], VelocityRule)
+        self.assertIsInstance(rules[1], FanOutRule)
+        with self.assertRaises(AntifraudException):
+            build_rules([{"rule": "unknown"}])
+        with self.assertRaises(AntifraudException):
+            build_rules([{"rule": "velocity", "bad": 1}])
+
+
+if __name__ == "__main__":
+    unittest.main()
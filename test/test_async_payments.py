@@ -0,0 +1,89 @@
+import unittest
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from src.async_payments import AsyncPayments
+from src.payments_core import PaymentCoreException
+from src.payments_worker import PaymentsWorkers
+
+
+class TestAsyncPayments(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.config = {
+            "transactions_log_file": os.path.join(self.folder, "transactions.log"),
+            "users_file": os.path.join(self.folder, "users.json"),
+            "data_folder": self.folder,
+            "hold_time": 0,
+        }
+        self.user_credentials = {
+            "alice": {"id": 1, "balance": 1000, "verified": True, "password": "pass"},
+            "bob": {"id": 2, "balance": 1000, "verified": True, "password": "pass"},
+            "carol": {"id": 3, "balance": 50000, "verified": False, "password": "pass"},
+        }
+        self.p = PaymentsWorkers(self.config, self.user_credentials, t_payment=2, t_antifraud=1)
+        self.p.start()
+
+    def tearDown(self):
+        self.p.stop()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    async def test_submit_resolves_final_status(self):
+        """Check that submit futures resolve to approved, declined and rejected entries."""
+        facade = AsyncPayments(self.p)
+        approved = await facade.submit(1, 2, 100)
+        declined = await facade.submit(2, 1, 10 ** 6)
+        rejected = await facade.submit(3, 1, 20000)
+
+        results = await asyncio.wait_for(asyncio.gather(approved, declined, rejected), 5)
+        self.assertEqual([r["status"] for r in results], ["approved", "declined", "rejected"])
+        self.assertEqual(results[0]["tx_id"], approved.tx_id)
+        self.assertEqual(results[2]["reason"], "unverified_limit")
+
+        with self.assertRaises(PaymentCoreException):
+            await facade.submit(1, 1, 10)
+        facade.close()
+
+    async def test_many_concurrent_submits_and_events(self):
+        """Check that the event iterator sees every transaction settled while it is open."""
+        facade = AsyncPayments(self.p)
+        seen = []
+
+        async def consume():
+            async for entry in facade.events():
+                seen.append(entry["tx_id"])
+
+        consumer = asyncio.ensure_future(consume())
+        await asyncio.sleep(0)
+        futures = await asyncio.gather(*(facade.submit(1, 2, 1) for _ in range(200)))
+        results = await asyncio.wait_for(asyncio.gather(*futures), 5)
+        self.assertTrue(all(r["status"] == "approved" for r in results))
+
+        facade.close()
+        await asyncio.wait_for(consumer, 5)
+        self.assertEqual(sorted(seen), sorted(f.tx_id for f in futures))
+
+    async def test_json_lines_server(self):
+        """Check submit and error responses of the TCP server."""
+        facade = AsyncPayments(self.p)
+        server = await facade.serve(port=0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+        writer.write(b'{"op": "submit", "from": 1, "to": 2, "amount": 5, "id": "a"}\n')
+        writer.write(b'{"op": "submit", "from": 1, "to": 9, "amount": 5, "id": "b"}\n')
+        writer.write(b'not json\n')
+        messages = [json.loads(await asyncio.wait_for(reader.readline(), 5)) for _ in range(4)]
+
+        by_status = {(m.get("id"), m["status"]): m for m in messages}
+        self.assertIn(("a", "accepted"), by_status)
+        self.assertEqual(by_status[("a", "approved")]["tx_id"], by_status[("a", "accepted")]["tx_id"])
+        self.assertEqual(by_status[("b", "error")]["reason"], "One of the accounts does not exist.")
+        self.assertIn((None, "error"), by_status)
+
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        facade.close()
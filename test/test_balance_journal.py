@@ -0,0 +1,148 @@
+import unittest
+import threading
+import json
+import os
+from src.balance_journal import BalanceJournal, JournalException
+
+
+class TestBalanceJournal(unittest.TestCase):
+    def setUp(self):
+        self.path = "test_users.journal"
+        self.user_credentials = {
+            "User1": {"id": 1, "balance": 1000},
+            "User2": {"id": 2, "balance": 1000}
+        }
+
+    def tearDown(self):
+        for path in (self.path, self.path + ".prev"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_concurrent_appends_are_durable(self):
+        """Check that records appended from many threads all end up in the file."""
+        journal = BalanceJournal(self.path, commit_ms=5)
+
+        def append(i):
+            journal.append(journal.record(i, {1: 1000 - i, 2: 1000 + i}))
+
+        threads = [threading.Thread(target=append, args=(i,)) for i in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        journal.close()
+
+        with open(self.path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 20)
+        self.assertEqual(sorted(r["seq"] for r in records), list(range(1, 21)))
+
+    def test_replay_applies_newest_balances(self):
+        """Check that replay restores the balances of the newest record per account."""
+        journal = BalanceJournal(self.path)
+        journal.append(journal.record(1, {1: 900, 2: 1100}))
+        journal.append(journal.record(2, {1: 800, 2: 1200}))
+        journal.append(journal.record(3, {1: 700}))
+        journal.append(journal.record(3, {1: 800}, refund=True))
+        journal.close()
+
+        replayed = BalanceJournal(self.path)
+        self.assertEqual(replayed.replay(self.user_credentials), 4)
+        self.assertEqual(self.user_credentials["User1"]["balance"], 800)
+        self.assertEqual(self.user_credentials["User2"]["balance"], 1200)
+        self.assertEqual(replayed.settled, {1: "approved", 2: "approved", 3: "rejected"})
+        self.assertEqual(replayed.record(4, {1: 0})["seq"], 5)
+
+    def test_replay_refunds_debits_without_credit(self):
+        """Check that a cross-shard debit whose credit was lost is given back once."""
+        journal = BalanceJournal(self.path)
+        journal.append(journal.record(1, {1: 900}, transit=100))
+        journal.append(journal.record(1, {2: 1100}, transit=-100))
+        journal.append(journal.record(2, {1: 850}, transit=50))
+        journal.close()
+
+        replayed = BalanceJournal(self.path)
+        replayed.replay(self.user_credentials)
+        replayed.close()
+        self.assertEqual(self.user_credentials["User1"]["balance"], 900)
+        self.assertEqual(self.user_credentials["User2"]["balance"], 1100)
+        self.assertEqual(replayed.settled, {1: "approved", 2: "rejected"})
+
+        credentials = {"User1": {"id": 1, "balance": 1000}, "User2": {"id": 2, "balance": 1000}}
+        BalanceJournal(self.path).replay(credentials)
+        self.assertEqual(credentials, self.user_credentials)
+
+    def test_replay_skips_checkpointed_records(self):
+        """Check that records already included in the checkpoint are not applied again."""
+        journal = BalanceJournal(self.path)
+        journal.append(journal.record(1, {1: 900, 2: 1100}))
+        journal.close()
+
+        self.user_credentials["User1"].update(balance=500, journal_seq=5)
+        BalanceJournal(self.path).replay(self.user_credentials)
+        self.assertEqual(self.user_credentials["User1"]["balance"], 500)
+        self.assertEqual(self.user_credentials["User2"]["balance"], 1100)
+
+    def test_checkpoint_truncates_journal(self):
+        """Check that the journal is emptied after a checkpoint."""
+        checkpoints = []
+        journal = BalanceJournal(self.path, checkpoint_every=2, checkpoint=lambda: checkpoints.append(1))
+        journal.append(journal.record(1, {1: 900, 2: 1100}))
+        journal.append(journal.record(2, {1: 800, 2: 1200}))
+        journal.close()
+
+        self.assertEqual(len(checkpoints), 1)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(journal.prev_path))
+
+    def test_failed_write_is_retried_and_reported(self):
+        """Check that a failed write is retried, that only its batch fails and the writer keeps running."""
+        journal = BalanceJournal(self.path)
+        journal.RETRY_DELAY = 0
+        failures = [OSError("disk full")] * 2
+        write = journal._write
+
+        def flaky_write(batch):
+            if failures:
+                with open(self.path, "a") as f:
+                    f.write('{"seq": ')
+                journal._close_file()
+                raise failures.pop()
+            write(batch)
+
+        journal._write = flaky_write
+        journal.append(journal.record(1, {1: 900, 2: 1100}))
+
+        failures.extend([OSError("disk gone")] * (journal.WRITE_RETRIES + 1))
+        errors = []
+        with self.assertRaises(JournalException):
+            journal.append(journal.record(2, {1: 800, 2: 1200}))
+        journal.append_async([journal.record(3, {1: 700, 2: 1300})], errors.append)
+        journal.close()
+
+        with open(self.path) as f:
+            self.assertEqual([json.loads(line)["seq"] for line in f], [1, 3])
+        self.assertEqual(errors, [None])
+
+    def test_checkpoint_keeps_records_written_meanwhile(self):
+        """Check that records appended while a checkpoint runs stay in the journal."""
+        started, release = threading.Event(), threading.Event()
+
+        def checkpoint():
+            started.set()
+            release.wait(5)
+
+        journal = BalanceJournal(self.path, checkpoint_every=1, checkpoint=checkpoint)
+        journal.append(journal.record(1, {1: 900, 2: 1100}))
+        self.assertTrue(started.wait(5))
+        journal.append(journal.record(2, {1: 800, 2: 1200}))
+        self.assertEqual([r["seq"] for r in journal._records()], [1, 2])
+        release.set()
+        journal.close()
+
+        with open(self.path) as f:
+            self.assertEqual([json.loads(line)["seq"] for line in f], [2])
+
+
+if __name__ == "__main__":
+    unittest.main()
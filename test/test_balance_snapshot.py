@@ -0,0 +1,55 @@
+import unittest
+from src.account import Account
+from src.account_store import AccountStore
+from src.balance_snapshot import BalanceVersions
+
+
+class TestBalanceVersions(unittest.TestCase):
+    def setUp(self):
+        self.versions = BalanceVersions(page_size=4)
+        self.versions.update({acc_id: 100 for acc_id in range(1, 11)})
+
+    def test_snapshots_are_immutable(self):
+        """Check that a snapshot keeps its balances while newer versions are published."""
+        first = self.versions.snapshot()
+        self.assertIs(self.versions.snapshot(), first)
+
+        self.versions.update({1: 70, 2: 130})
+        self.versions.update({11: 5})
+        second = self.versions.snapshot()
+
+        self.assertEqual((first.seq, second.seq), (1, 3))
+        self.assertEqual((first[1], first[2], len(first), 11 in first), (100, 100, 10, False))
+        self.assertEqual((second[1], second[2], second.get(11)), (70, 130, 5))
+        self.assertEqual(second.keys(), list(range(1, 12)))
+        self.assertEqual((first.total(), second.total()), (1000, 1005))
+        # Only the page holding accounts 1 and 2 and the last page were copied
+        self.assertIs(first._pages[1], second._pages[1])
+        self.assertIsNot(first._pages[0], second._pages[0])
+
+    def test_in_transit_keeps_total(self):
+        """Check that a debit without its credit is counted as in transit."""
+        self.versions.update({3: 60}, in_transit=40)
+        debited = self.versions.snapshot()
+        self.versions.update({9: 140}, in_transit=-40)
+        credited = self.versions.snapshot()
+
+        self.assertEqual((debited.in_transit, debited.total()), (40, 1000))
+        self.assertEqual((credited.in_transit, credited.total()), (0, 1000))
+        self.assertEqual(dict(credited.items())[9], 140)
+
+    def test_account_store_reports_added_accounts(self):
+        """Check that accounts added or overwritten through the store reach the snapshots."""
+        store = AccountStore()
+        versions = BalanceVersions()
+        store.on_change = versions.update
+        store.bulk_load([(1, "a", 10, True), (2, "b", 20, False)])
+        store[3] = Account("c", 30, True)
+        store[1] = Account("a", 15, True)
+
+        snapshot = versions.snapshot()
+        self.assertEqual(dict(snapshot.items()), {1: 15, 2: 20, 3: 30})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+import os
+from src.batch_ingest import read_jsonl, BatchRowException
+
+
+class TestBatchIngest(unittest.TestCase):
+    def setUp(self):
+        self.path = "test_batch.jsonl"
+        with open(self.path, "w") as f:
+            f.write('{"from": 1, "to": 2, "amount": 100}\n')
+            f.write('\n')
+            f.write('{"from": 1, "to": \n')
+            f.write('{"from": 2, "to": 1, "amount": 5}\n')
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_read_jsonl_streams_rows(self):
+        """Check that rows are parsed, empty lines skipped and bad lines reported."""
+        rows = list(read_jsonl(self.path))
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0], {"from": 1, "to": 2, "amount": 100})
+        self.assertIsInstance(rows[1], BatchRowException)
+        self.assertIn("Line 3", str(rows[1]))
+        self.assertEqual(rows[2]["amount"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
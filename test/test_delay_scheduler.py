@@ -0,0 +1,82 @@
+import unittest
+import threading
+import time
+from src.delay_scheduler import DelayScheduler
+
+
+class TestDelayScheduler(unittest.TestCase):
+    def test_items_released_after_hold_time(self):
+        """Check that items are released in order once their hold time is over."""
+        released = []
+        done = threading.Event()
+
+        def release(batch):
+            released.extend(batch)
+            if len(released) == 5:
+                done.set()
+
+        scheduler = DelayScheduler(0.2, release)
+        start = time.monotonic()
+        for i in range(5):
+            scheduler.schedule(i)
+
+        self.assertTrue(done.wait(2))
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual(released, [0, 1, 2, 3, 4])
+        scheduler.stop()
+
+    def test_zero_hold_time(self):
+        """Check that hold_time 0 releases items immediately."""
+        done = threading.Event()
+        scheduler = DelayScheduler(0, lambda batch: done.set())
+        scheduler.schedule("tx")
+        self.assertTrue(done.wait(1))
+        scheduler.stop()
+
+    def test_backpressure_when_full(self):
+        """Check that schedule() times out while max_pending items are held."""
+        scheduler = DelayScheduler(10, lambda batch: None, max_pending=2)
+        self.assertTrue(scheduler.schedule(1))
+        self.assertTrue(scheduler.schedule(2))
+        self.assertFalse(scheduler.schedule(3, timeout=0.1))
+        self.assertEqual(len(scheduler), 2)
+        scheduler.stop()
+
+    def test_stopped_scheduler_refuses_items(self):
+        """Check that items are refused after stop() without restarting the thread, until start()."""
+        scheduler = DelayScheduler(10, lambda batch: None)
+        scheduler.schedule(1)
+        scheduler.stop()
+
+        self.assertFalse(scheduler.schedule(2))
+        self.assertEqual(scheduler.schedule_many([3, 4]), 0)
+        self.assertFalse(scheduler.flush(timeout=1))
+        self.assertIsNone(scheduler._thread)
+        self.assertEqual(len(scheduler), 1)
+
+        scheduler.start()
+        self.assertTrue(scheduler.schedule(2))
+        scheduler.stop()
+
+    def test_failed_release_goes_to_on_error(self):
+        """Check that items of a release() that raised are passed to on_error."""
+        failed = []
+        done = threading.Event()
+
+        def release(batch):
+            raise RuntimeError("queue closed")
+
+        def on_error(batch, error):
+            failed.extend(batch)
+            done.set()
+
+        scheduler = DelayScheduler(0, release, on_error=on_error)
+        scheduler.schedule_many([1, 2])
+        self.assertTrue(done.wait(1))
+        self.assertTrue(scheduler.flush(timeout=1))
+        self.assertEqual(sorted(failed), [1, 2])
+        scheduler.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import threading
+import time
+from queue import Empty, Full
+from src.fair_queue import FairQueue
+
+
+class TestFairQueue(unittest.TestCase):
+
+    def test_higher_class_served_first(self):
+        """Check that higher priority classes get a larger share of the service."""
+        q = FairQueue(max_wait=None)
+        for i in range(8):
+            q.put(("bulk", i), priority=5)
+        for i in range(4):
+            q.put(("interactive", i), priority=1)
+
+        first = [q.get_nowait()[0] for _ in range(5)]
+        self.assertEqual(first.count("interactive"), 4)
+        self.assertEqual(q.qsize(), 7)
+
+    def test_flows_share_a_class_fairly(self):
+        """Check that one bulk sender cannot starve another sender of the same class."""
+        q = FairQueue(max_wait=None)
+        for i in range(100):
+            q.put(("bulk", i), flow=1)
+        q.put(("other", 0), flow=2)
+
+        served = [q.get_nowait()[0] for _ in range(3)]
+        self.assertIn("other", served)
+
+    def test_aging_serves_old_items(self):
+        """Check that an item waiting longer than max_wait is served before newer high-priority items."""
+        q = FairQueue(max_wait=0.05)
+        q.put("old", priority=5)
+        time.sleep(0.06)
+        q.put("urgent", priority=1)
+
+        self.assertEqual(q.get_nowait(), "old")
+        self.assertEqual(q.get_nowait(), "urgent")
+        self.assertEqual(q.stats()[5]["aged"], 1)
+        with self.assertRaises(Empty):
+            q.get_nowait()
+
+    def test_maxsize_blocks_put(self):
+        """Check queue.Queue-like backpressure and timeouts."""
+        q = FairQueue(maxsize=1)
+        q.put(1)
+        with self.assertRaises(Full):
+            q.put(2, timeout=0.01)
+
+        threading.Timer(0.05, q.get).start()
+        q.put(3, timeout=1)
+        self.assertEqual(q.get(timeout=1), 3)
+        with self.assertRaises(Empty):
+            q.get(timeout=0.01)
+
+    def test_stats_per_class(self):
+        """Check the per-class statistics."""
+        q = FairQueue(weights={"1": 4, "2": 1})
+        q.put("a", priority=1)
+        q.put("b", priority=2)
+        q.get()
+        stats = q.stats()
+        self.assertEqual(stats[1]["dequeued"], 1)
+        self.assertEqual(stats[2]["waiting"], 1)
+        with self.assertRaises(ValueError):
+            q.put("c", priority=3)
+
+
+if __name__ == "__main__":
+    unittest.main()
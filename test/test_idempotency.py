@@ -0,0 +1,162 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import time
+from src.idempotency import IdempotencyCache
+from src.payments_worker import PaymentsWorkers
+from src.transaction_handle import wait_all
+
+
+class TestIdempotencyCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "transactions.log.keys")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_bounded_and_time_evicting(self):
+        """Check that the oldest keys are evicted by count and by age."""
+        cache = IdempotencyCache(self.path, ttl=0.05, max_keys=2)
+        for i in range(3):
+            cache.put(f"k{i}", i)
+        self.assertIsNone(cache.get("k0"))
+        self.assertEqual(cache.get("k2")[0], 2)
+
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("k1"))
+        cache.put("k3", 3)
+        self.assertEqual(len(cache), 1)
+        cache.close()
+
+    def test_load_rebuilds_and_compacts(self):
+        """Check that load skips expired and torn records and rewrites the file."""
+        with open(self.path, "w") as f:
+            f.write(json.dumps({"key": "old", "tx_id": 1, "ts": time.time() - 1000}) + "\n")
+            f.write(json.dumps({"key": "a", "tx_id": 2, "ts": time.time()}) + "\n")
+            f.write('{"key": "torn", "tx_')
+
+        cache = IdempotencyCache(self.path, ttl=100)
+        self.assertEqual(cache.load(), 1)
+        self.assertEqual(cache.get("a")[:1], [2])
+        self.assertIsNone(cache.get("a")[2])
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+        cache.put("b", 3)
+        cache.flush()
+        restored = IdempotencyCache(self.path, ttl=100)
+        restored.load()
+        self.assertEqual(restored.get("b")[0], 3)
+        cache.close()
+
+    def test_put_creates_folder_and_skips_failed_writes(self):
+        """Check that the key file folder is created and a key whose record cannot be written is not kept."""
+        cache = IdempotencyCache(os.path.join(self.folder, "logs", "transactions.log.keys"))
+        cache.put("a", 1)
+        cache.close()
+        self.assertTrue(os.path.exists(cache.path))
+
+        broken = IdempotencyCache(self.folder)
+        with self.assertRaises(OSError):
+            broken.put("b", 2)
+        self.assertIsNone(broken.get("b"))
+
+
+class TestIdempotentSubmission(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.config = {
+            "transactions_log_file": os.path.join(self.folder, "transactions.log"),
+            "users_file": os.path.join(self.folder, "users.json"),
+            "data_folder": self.folder,
+            "hold_time": 0,
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def start(self):
+        credentials = {
+            "alice": {"id": 1, "balance": 1000, "verified": True, "password": "pass"},
+            "bob": {"id": 2, "balance": 1000, "verified": True, "password": "pass"},
+        }
+        p = PaymentsWorkers(self.config, credentials, t_payment=2, t_antifraud=1)
+        p.start()
+        return p
+
+    def test_repeated_key_returns_original(self):
+        """Check that a retried submit is applied once and gets the original handle."""
+        p = self.start()
+        first = p.submit(1, 2, 100, idempotency_key="order-1")
+        again = p.submit(1, 2, 100, idempotency_key="order-1")
+        other = p.submit(1, 2, 100, idempotency_key="order-2")
+
+        self.assertIs(first, again)
+        wait_all([first, other], timeout=5)
+        self.assertTrue(p.drain(timeout=5))
+        self.assertEqual(p.accounts[1].balance, 800)
+        self.assertEqual(p.duplicates.value, 1)
+
+    def test_submit_many_batch_key(self):
+        """Check that resubmitting a batch with the same key reports duplicates only."""
+        p = self.start()
+        rows = [(1, 2, 10), (2, 1, 5), {"from": 1, "to": 2, "amount": 1, "idempotency_key": "own"}, (1, 2, 10)]
+        first = list(p.submit_many(rows, chunk_size=2, wait_final=True, idempotency_key="file-1"))
+        retry = list(p.submit_many(rows, chunk_size=2, wait_final=True, idempotency_key="file-1"))
+
+        self.assertEqual([r["row"] for r in first if r["status"] == "accepted"], [1, 2, 3, 4])
+        self.assertEqual([r["row"] for r in retry if r["status"] == "duplicate"], [1, 2, 3, 4])
+        self.assertEqual([r["status"] for r in retry if r["status"] != "duplicate"], ["approved"] * 4)
+        self.assertTrue(p.drain(timeout=5))
+        self.assertEqual(p.accounts[1].balance, 1000 - 10 + 5 - 1 - 10)
+
+    def test_failed_key_write_is_not_accepted(self):
+        """Check that a submit whose key cannot be written is neither counted nor remembered."""
+        p = self.start()
+        p.idempotency.close()
+        path, p.idempotency.path = p.idempotency.path, self.folder
+        with self.assertRaises(OSError):
+            p.submit(1, 2, 100, idempotency_key="order-1")
+        self.assertEqual((p.tx_counter, p.accepted_count), (0, 0))
+
+        p.idempotency.path = path
+        self.assertEqual(p.submit(1, 2, 100, idempotency_key="order-1").result(timeout=5)["tx_id"], 1)
+        self.assertTrue(p.drain(timeout=5))
+
+    def test_keys_survive_restart(self):
+        """Check that keys are restored from disk with the logged final result."""
+        p = self.start()
+        p.submit(1, 2, 100, idempotency_key="order-1").result(timeout=5)
+        self.assertTrue(p.drain(timeout=5))
+
+        with open(self.config["transactions_log_file"] + ".keys", "a") as f:
+            f.write(json.dumps({"key": "lost", "tx_id": 999, "ts": time.time()}) + "\n")
+
+        p = self.start()
+        handle = p.submit(1, 2, 100, idempotency_key="order-1")
+        self.assertTrue(handle.done())
+        self.assertEqual((handle.tx_id, handle.status), (1, "approved"))
+
+        retried = p.submit(1, 2, 100, idempotency_key="lost")
+        self.assertEqual(retried.result(timeout=5)["status"], "approved")
+        self.assertTrue(p.drain(timeout=5))
+        self.assertEqual(p.accounts[1].balance, 800)
+
+    def test_retry_after_crash_uses_the_journal(self):
+        """Check that keys of transfers journaled but lost from the log are not applied again."""
+        p = self.start()
+        p.log_writer.write = lambda entry: None
+        wait_all([p.submit(1, 2, 100, idempotency_key=f"k{i}") for i in range(3)], timeout=5)
+        p.flush_idempotency()
+
+        restarted = self.start()
+        self.assertEqual(restarted.accounts[1].balance, 700)
+        handles = [restarted.submit(1, 2, 100, idempotency_key=f"k{i}") for i in range(3)]
+        self.assertEqual([(h.tx_id, h.status) for h in handles], [(1, "approved"), (2, "approved"), (3, "approved")])
+        self.assertEqual(restarted.duplicates.value, 3)
+        self.assertTrue(restarted.drain(timeout=5))
+        self.assertEqual(restarted.accounts[1].balance, 700)
+        p.stop()
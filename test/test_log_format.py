@@ -0,0 +1,89 @@
+import unittest
+import os
+import shutil
+import tempfile
+from src.log_format import BinaryFormat, JsonLinesFormat, convert, detect_format
+from src.log_writer import LogWriter
+from src.transaction_log import TransactionLog
+
+
+def entry(tx_id, status="approved", reason="completed"):
+    return {"timestamp": "2025-01-01 00:00:%02d" % tx_id, "tx_id": tx_id, "from": 1, "to": 2 + tx_id % 2,
+            "amount": 10 * tx_id, "status": status, "reason": reason}
+
+
+class TestLogFormat(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "transactions.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_binary_round_trip(self):
+        """Check that binary records decode to the same entries and new reasons are interned on disk."""
+        fmt = BinaryFormat(self.path + ".reasons")
+        entries = [entry(1), entry(2, "pending", None), entry(3, "rejected", "blocked_country")]
+        data = b"".join(fmt.encode(e) for e in entries)
+        self.assertEqual(len(data), 3 * BinaryFormat.RECORD.size)
+        self.assertEqual([fmt.decode(data, i * fmt.RECORD.size) for i in range(3)], entries)
+        self.assertTrue(fmt.is_pending(data[fmt.RECORD.size:]))
+
+        restored = BinaryFormat(self.path + ".reasons")
+        self.assertEqual(restored.decode(data, 2 * fmt.RECORD.size)["reason"], "blocked_country")
+        self.assertEqual([r[3] for r in restored.records(memoryview(data), fmt.RECORD.size)], [2, 3])
+
+    def test_convert_both_ways(self):
+        """Check that a JSON-lines log survives a conversion to binary and back."""
+        fmt = JsonLinesFormat()
+        entries = [entry(i) for i in range(1, 6)] + [entry(6, "declined", "insufficient_funds")]
+        with open(self.path, "wb") as f:
+            f.write(b"".join(fmt.encode(e) for e in entries))
+
+        binary = os.path.join(self.folder, "transactions.bin")
+        self.assertEqual(convert(self.path, binary, "binary"), 6)
+        self.assertEqual(detect_format(binary), "binary")
+        self.assertEqual(os.path.getsize(binary), 6 * BinaryFormat.RECORD.size)
+
+        exported = os.path.join(self.folder, "export.jsonl")
+        convert(binary, exported, "jsonl")
+        self.assertEqual(list(fmt.entries(exported)), entries)
+
+    def test_binary_transaction_log(self):
+        """Check that the log reads binary files and seals a file of the previous format."""
+        log = TransactionLog(self.path, window=2, history_window=1)
+        writer = LogWriter(self.path, on_written=log.index_batch)
+        for i in range(1, 4):
+            writer.write(entry(i))
+        writer.close()
+        log.close()
+
+        log = TransactionLog(self.path, window=2, history_window=1, log_format="binary", compress=False)
+        log.load()
+        writer = LogWriter(self.path, on_written=log.index_batch, log_format=log.log_format)
+        for i in range(4, 7):
+            writer.write(entry(i))
+        writer.close()
+        with open(self.path, "ab") as f:
+            f.write(b"TX torn")
+        log.close()
+
+        self.assertEqual([s.info["format"] for s in log.segments], ["jsonl"])
+        self.assertEqual(detect_format(self.path), "binary")
+
+        log = TransactionLog(self.path, window=2, history_window=1, log_format="binary")
+        log.load()
+        self.assertEqual([e["tx_id"] for e in log], [5, 6])
+        self.assertEqual([e["tx_id"] for e in log.scan()], list(range(1, 7)))
+        self.assertEqual(log.get(5), [entry(5)])
+        self.assertEqual([e["tx_id"] for e in log.history(3, limit=None)], [1, 3, 5])
+        log.close()
+
+        writer = LogWriter(self.path, log_format=BinaryFormat())
+        writer.write(entry(7))
+        writer.close()
+        self.assertEqual(os.path.getsize(self.path), 4 * BinaryFormat.RECORD.size)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import json
+import os
+from src.log_format import BinaryFormat
+from src.log_writer import LogWriter, LogWriterException
+
+
+class TestLogWriter(unittest.TestCase):
+    def setUp(self):
+        self.path = "test_log_writer.log"
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def read_entries(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_flush_barrier_writes_all_entries(self):
+        """Check that flush() returns only after all queued entries are in the file."""
+        writer = LogWriter(self.path, batch_size=7, flush_interval=10)
+        for i in range(100):
+            writer.write({"tx_id": i})
+
+        self.assertTrue(writer.flush(timeout=5))
+        self.assertEqual([e["tx_id"] for e in self.read_entries()], list(range(100)))
+        writer.close()
+
+    def test_close_and_reopen(self):
+        """Check that the writer appends to the same file after being closed."""
+        writer = LogWriter(self.path, flush_policy="fsync")
+        writer.write({"tx_id": 1})
+        writer.close()
+        writer.write({"tx_id": 2})
+        writer.close()
+
+        self.assertEqual([e["tx_id"] for e in self.read_entries()], [1, 2])
+
+    def test_unencodable_entry_is_skipped_alone(self):
+        """Check that one entry the format cannot encode does not drop the rest of its batch."""
+        written = []
+        writer = LogWriter(self.path, batch_size=10, flush_interval=10, log_format=BinaryFormat(),
+                           on_written=lambda batch, offsets: written.extend(e["tx_id"] for e in batch))
+        for i in range(1, 6):
+            writer.write({"timestamp": 0, "tx_id": i, "from": 1, "to": 2, "amount": 10.5 if i == 3 else 10,
+                          "status": "approved", "reason": "completed"})
+        writer.close()
+
+        self.assertEqual(written, [1, 2, 4, 5])
+        self.assertEqual([e["tx_id"] for e in BinaryFormat().entries(self.path)], [1, 2, 4, 5])
+
+    def test_unknown_policy_raises(self):
+        """Check that an unknown flush policy is refused."""
+        with self.assertRaises(LogWriterException):
+            LogWriter(self.path, flush_policy="never")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import threading
+from urllib.request import urlopen
+from src.metrics import MetricsRegistry, TimedLock
+from src.payments_worker import PaymentsWorkers
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counters_histograms_and_gauges(self):
+        """Check that metrics are shared per name and labels and show up in the snapshot."""
+        registry = MetricsRegistry()
+        registry.counter("tx_total", "Transactions", status="approved").inc()
+        registry.counter("tx_total", status="approved").inc(2)
+        registry.counter("tx_total", status="declined").inc()
+        registry.histogram("write_seconds", buckets=(0.01, 0.1)).observe(0.05)
+        registry.gauge("depth", lambda: 7, queue="q")
+
+        snapshot = registry.snapshot()
+        values = {tuple(v["labels"].items()): v["value"] for v in snapshot["tx_total"]["values"]}
+        self.assertEqual(values, {(("status", "approved"),): 3, (("status", "declined"),): 1})
+        self.assertEqual(snapshot["write_seconds"]["values"][0]["value"]["buckets"],
+                         {"0.01": 0, "0.1": 1, "+Inf": 1})
+        self.assertEqual(snapshot["depth"]["values"][0]["value"], 7)
+
+        text = registry.to_prometheus()
+        self.assertIn("# TYPE tx_total counter", text)
+        self.assertIn('tx_total{status="approved"} 3', text)
+        self.assertIn('write_seconds_bucket{le="+Inf"} 1', text)
+        self.assertIn("write_seconds_count 1", text)
+
+    def test_timed_lock_records_contended_waits(self):
+        """Check that only contended acquisitions are timed."""
+        registry = MetricsRegistry()
+        histogram = registry.histogram("wait")
+        lock = TimedLock(histogram)
+        with lock:
+            pass
+        self.assertEqual(histogram.count, 0)
+
+        lock.acquire()
+        threading.Timer(0.05, lock.release).start()
+        with lock:
+            pass
+        self.assertEqual(histogram.count, 1)
+        self.assertGreater(histogram.sum, 0.02)
+
+    def test_write_and_serve(self):
+        """Check the file dump and the HTTP endpoint."""
+        registry = MetricsRegistry()
+        registry.counter("hits").inc()
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, "metrics.json")
+            registry.write(path, fmt="json")
+            with open(path) as f:
+                self.assertEqual(json.load(f)["hits"]["values"][0]["value"], 1)
+        finally:
+            shutil.rmtree(folder)
+
+        server = registry.serve(0)
+        try:
+            with urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=5) as response:
+                self.assertIn("hits 1", response.read().decode())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_workers_update_metrics(self):
+        """Check that the pipeline counts stages and final results."""
+        folder = tempfile.mkdtemp()
+        config = {
+            "transactions_log_file": os.path.join(folder, "transactions.log"),
+            "users_file": os.path.join(folder, "users.json"),
+            "data_folder": folder,
+            "error_log_file": os.path.join(folder, "error.log"),
+            "hold_time": 0,
+            "metrics_file": os.path.join(folder, "metrics.prom"),
+        }
+        credentials = {"a": {"id": 1, "balance": 100, "verified": False}, "b": {"id": 2, "balance": 0, "verified": True}}
+        try:
+            p = PaymentsWorkers(config, credentials, t_payment=1, t_antifraud=1)
+            p.start()
+            p.submit(1, 2, 50)
+            p.submit(1, 2, 80)
+            p.submit(1, 2, 20000)
+            self.assertTrue(p.drain(timeout=5))
+
+            snapshot = p.metrics.snapshot()
+            stages = {v["labels"]["stage"]: v["value"] for v in snapshot["payments_stage_total"]["values"]}
+            self.assertEqual(stages, {"submitted": 3, "antifraud": 3, "payment": 3})
+            results = {(v["labels"]["status"], v["labels"]["reason"]): v["value"]
+                       for v in snapshot["payments_transactions_total"]["values"]}
+            self.assertEqual(results, {("approved", "completed"): 1, ("declined", "insufficient_funds"): 1,
+                                       ("rejected", "unverified_limit"): 1})
+            self.assertGreaterEqual(snapshot["payments_journal_write_seconds"]["values"][0]["value"]["count"], 1)
+            with open(config["metrics_file"]) as f:
+                self.assertIn('payments_queue_depth{queue="delayed"} 0', f.read())
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    unittest.main()
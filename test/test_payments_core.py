@@ -41,6 +41,12 @@ class TestPaymentsCore(unittest.TestCase):
             os.remove(self.config["transactions_log_file"])
         if os.path.exists(self.config["users_file"]):
             os.remove(self.config["users_file"])
+        if os.path.exists(self.config["users_file"] + ".journal"):
+            os.remove(self.config["users_file"] + ".journal")
+        if os.path.exists(self.config["transactions_log_file"] + ".idx"):
+            os.remove(self.config["transactions_log_file"] + ".idx")
+        if os.path.exists(self.config["users_file"] + ".snap"):
+            os.remove(self.config["users_file"] + ".snap")
 
     def test_accounts_seeded_correctly(self):
         """Check that accounts have correct verified flags."""
@@ -64,6 +70,32 @@ class TestPaymentsCore(unittest.TestCase):
         self.assertTrue(ok2)
         self.assertEqual(reason2, "Completed")
 
+    def test_account_change_feed(self):
+        """Check that the account change feed returns only accounts changed since the cursor."""
+        changed, cursor = self.core.account_changes()
+        self.assertEqual(changed, set())
+
+        self.core.record_balances(1, {1: 900, 2: 1100})
+        changed, cursor = self.core.account_changes(cursor)
+        self.assertEqual(changed, {1, 2})
+
+        self.core.record_balances(2, {3: 500, 2: 1600})
+        changed, cursor = self.core.account_changes(cursor)
+        self.assertEqual(changed, {2, 3})
+        self.assertEqual(self.core.account_changes(cursor)[0], set())
+
+    def test_log_change_feed(self):
+        """Check that the log change feed returns only entries added since the cursor."""
+        entries, cursor, complete = self.core.log_changes()
+        self.assertEqual(entries, [])
+
+        tx = Transaction(tx_id=1, from_acc=1, to_acc=2, amount=5)
+        self.core.record_result(tx, "declined", "insufficient_funds")
+        entries, cursor, complete = self.core.log_changes(cursor)
+        self.assertTrue(complete)
+        self.assertEqual([e["status"] for e in entries], ["declined"])
+        self.assertEqual(self.core.log_changes(cursor)[0], [])
+        self.core.log_writer.close()
 
 if __name__ == "__main__":
     unittest.main()
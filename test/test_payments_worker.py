@@ -1,15 +1,14 @@
 import unittest
+import json
 import time
+import os
 from src.payments_worker import PaymentsWorkers
+from src.payments_core import PaymentCoreException
 from src.account import Account
+from src.transaction import Transaction
+from src.transaction_handle import wait_all
+from queue import Queue
 
-def wait_for_condition(predicate, timeout=5.0, interval=0.05):
-    start = time.time()
-    while time.time() - start < timeout:
-        if predicate():
-            return True
-        time.sleep(interval)
-    return False
 
 class TestPaymentsWorkersIntegration(unittest.TestCase):
     def setUp(self):
@@ -34,42 +33,176 @@ class TestPaymentsWorkersIntegration(unittest.TestCase):
             self.p.stop()
         except:
             pass
+        for path in (self.config["transactions_log_file"], self.config["users_file"],
+                     self.config["users_file"] + ".journal", self.config["transactions_log_file"] + ".idx",
+                     self.config["users_file"] + ".snap"):
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_successful_payment(self):
-        self.p.submit(1, 2, 500)
-        ok = wait_for_condition(lambda: any(tx["status"] == "approved" for tx in self.p.transactions_log))
-        self.assertTrue(ok)
+        handle = self.p.submit(1, 2, 500)
+        self.assertEqual(handle.result(timeout=5)["status"], "approved")
         self.assertEqual(self.p.accounts[1].balance, 9500)
         self.assertEqual(self.p.accounts[2].balance, 10500)
 
+        handle.result()["status"] = "changed"
+        self.assertEqual([e["status"] for e in self.p.transactions_log if e["tx_id"] == handle.tx_id], ["approved"])
+
     def test_insufficient_funds_from_verified(self):
-        self.p.submit(2, 1, 20000)
-        ok = wait_for_condition(lambda: any(tx["status"] == "declined" for tx in self.p.transactions_log))
-        self.assertTrue(ok)
+        handle = self.p.submit(2, 1, 20000)
+        self.assertEqual(handle.result(timeout=5)["status"], "declined")
         self.assertEqual(self.p.accounts[1].balance, 10000)
         self.assertEqual(self.p.accounts[2].balance, 10000)
 
     def test_rejected_unverified_limit(self):
         self.p.accounts[1].verified = False
-        self.p.submit(1, 2, 20000)
-        ok = wait_for_condition(lambda: any(tx["status"] == "rejected" and tx.get("reason") == "unverified_limit"
-                                            for tx in self.p.transactions_log))
-        self.assertTrue(ok)
+        handle = self.p.submit(1, 2, 20000)
+        handle.result(timeout=5)
+        self.assertEqual((handle.status, handle.reason), ("rejected", "unverified_limit"))
         self.assertEqual(self.p.accounts[1].balance, 10000)
         self.assertEqual(self.p.accounts[2].balance, 10000)
 
     def test_multiple_concurrent_payments(self):
         payments = 10
         amount = 500
-        for _ in range(payments):
-            self.p.submit(1, 2, amount)
+        handles = [self.p.submit(1, 2, amount) for _ in range(payments)]
 
-        ok = wait_for_condition(lambda: self.p.processed_count >= payments, timeout=10.0)
-        self.assertTrue(ok)
+        results = wait_all(handles, timeout=10.0)
+        self.assertEqual([r["tx_id"] for r in results], [h.tx_id for h in handles])
         self.assertEqual(self.p.accounts[1].balance, 10000 - payments*amount)
         self.assertEqual(self.p.accounts[2].balance, 10000 + payments*amount)
         approved_count = sum(1 for tx in self.p.transactions_log if tx["status"] == "approved")
         self.assertGreaterEqual(approved_count, payments)
 
+    def test_submit_many_streams_results(self):
+        rows = [
+            {"from": 1, "to": 2, "amount": 100},
+            {"from": 1, "to": 3, "amount": 100},
+            (2, 1, 50),
+            {"from": 1, "to": 2, "amount": -5},
+        ]
+        results = list(self.p.submit_many(rows, chunk_size=2, wait_final=True))
+
+        accepted = [r for r in results if r["status"] == "accepted"]
+        invalid = [r for r in results if r["status"] == "invalid"]
+        final = [r for r in results if r["status"] == "approved"]
+        self.assertEqual([r["row"] for r in accepted], [1, 3])
+        self.assertEqual([r["row"] for r in invalid], [2, 4])
+        self.assertEqual(sorted(r["row"] for r in final), [1, 3])
+        self.assertEqual(accepted[1]["tx_id"], accepted[0]["tx_id"] + 1)
+        self.assertEqual(self.p.accounts[1].balance, 9950)
+        self.assertEqual(self.p.accounts[2].balance, 10050)
+
+    def test_process_batch_applies_transfers_in_order(self):
+        txs = [Transaction(101, 1, 2, 6000), Transaction(102, 1, 2, 6000), Transaction(103, 2, 1, 100)]
+        txs[2].reject("unverified_limit")
+        self.p.process_batch(txs)
+
+        statuses = {e["tx_id"]: e["status"] for e in self.p.transactions_log}
+        self.assertEqual(statuses, {101: "approved", 102: "declined", 103: "rejected"})
+        self.assertEqual(self.p.accounts[1].balance, 4000)
+        self.assertEqual(self.p.accounts[2].balance, 16000)
+        self.assertEqual(self.p.processed_count, 3)
+
+    def test_failed_transfer_does_not_stop_the_worker(self):
+        """Check that a transfer failing under the locks is rejected and later payments still settle."""
+        with self.assertRaises(PaymentCoreException):
+            self.p.submit(1, 2, 10.5)
+
+        txs = [Transaction(201, 1, 2, 10.5), Transaction(202, 1, 2, 300)]
+        self.p.process_batch(txs)
+        statuses = {e["tx_id"]: (e["status"], e["reason"]) for e in self.p.transactions_log}
+        self.assertEqual(statuses, {201: ("rejected", "internal_error"), 202: ("approved", "completed")})
+        self.assertEqual((self.p.accounts[1].balance, self.p.accounts[2].balance), (9700, 10300))
+
+        self.assertEqual(self.p.submit(2, 1, 100).result(timeout=5)["status"], "approved")
+
+    def test_failed_journal_write_undoes_the_batch(self):
+        """Check that transfers of a batch whose journal write failed leave no balance change."""
+        def failing_append(records):
+            raise OSError("disk full")
+
+        self.p.journal.append_many = failing_append
+        txs = [Transaction(301, 1, 2, 700), Transaction(302, 2, 1, 200), Transaction(303, 1, 2, 50000)]
+        self.p.process_batch(txs)
+
+        statuses = {e["tx_id"]: (e["status"], e["reason"]) for e in self.p.transactions_log}
+        self.assertEqual(statuses, {301: ("rejected", "journal_error"), 302: ("rejected", "journal_error"),
+                                    303: ("declined", "insufficient_funds")})
+        self.assertEqual((self.p.accounts[1].balance, self.p.accounts[2].balance), (10000, 10000))
+        self.assertEqual(dict(self.p.balance_snapshot().items()), {1: 10000, 2: 10000})
+
+    def test_journal_failure_stops_settlement(self):
+        """Check that a payment whose journal write failed changes no balance, in memory or after a restart."""
+        def failing_write(batch):
+            raise OSError("disk full")
+
+        self.assertEqual(self.p.submit(1, 2, 500).result(timeout=5)["status"], "approved")
+        self.p.journal.RETRY_DELAY = 0
+        self.p.journal._write = failing_write
+        handle = self.p.submit(1, 2, 300)
+        self.assertEqual((handle.result(timeout=5)["status"], handle.reason), ("rejected", "journal_error"))
+        self.assertEqual((self.p.accounts[1].balance, self.p.accounts[2].balance), (9500, 10500))
+        with self.assertRaises(PaymentCoreException):
+            self.p.submit(1, 2, 100)
+        with self.assertRaises(PaymentCoreException):
+            self.p.checkpoint()
+        self.assertTrue(self.p.drain(timeout=5))
+
+        credentials = {uid: dict(data, balance=10000) for uid, data in self.user_credentials.items()}
+        if os.path.exists(self.config["users_file"]):
+            with open(self.config["users_file"]) as f:
+                credentials = json.load(f)
+        restarted = PaymentsWorkers(self.config, credentials)
+        self.assertEqual((restarted.accounts[1].balance, restarted.accounts[2].balance), (9500, 10500))
+        restarted.stop()
+
+    def test_take_batch_respects_size_and_linger(self):
+        q = Queue()
+        for i in range(5):
+            q.put([i, i])
+        self.assertEqual(len(PaymentsWorkers._take_batch(q, 4, size=len)), 2)
+
+        start = time.monotonic()
+        self.assertEqual(len(PaymentsWorkers._take_batch(q, 100, linger=0.05)), 3)
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+        self.assertEqual(PaymentsWorkers._take_batch(q, 100, timeout=0.01), [])
+
+        q.put(PaymentsWorkers.STOP)
+        q.put([1])
+        self.assertEqual(PaymentsWorkers._take_batch(q, 100), [PaymentsWorkers.STOP])
+
+    def test_drain_finishes_held_transactions(self):
+        self.p.scheduler.hold_time = 10
+        for _ in range(5):
+            self.p.submit(1, 2, 100)
+
+        start = time.monotonic()
+        self.assertTrue(self.p.drain(timeout=5))
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(self.p.processed_count, 5)
+        self.assertEqual(self.p.accounts[2].balance, 10500)
+        with self.assertRaises(PaymentCoreException):
+            self.p.submit(1, 2, 100)
+
+    def test_stop_keeps_queued_transactions_for_restart(self):
+        self.p.scheduler.hold_time = 10
+        self.p.submit(1, 2, 100)
+
+        start = time.monotonic()
+        self.p.stop()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(len(self.p.scheduler), 1)
+
+        with self.assertRaises(PaymentCoreException):
+            self.p.submit(1, 2, 100)
+        self.assertIsNone(self.p.scheduler._thread)
+
+        self.p.scheduler.hold_time = 0
+        self.p.start()
+        self.assertTrue(self.p.drain(timeout=15))
+        self.assertEqual(self.p.accounts[2].balance, 10100)
+
+
 if __name__ == "__main__":
     unittest.main()
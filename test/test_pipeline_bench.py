@@ -0,0 +1,34 @@
+import unittest
+from bench.pipeline_bench import Workload, run_once, percentile
+
+
+class TestPipelineBench(unittest.TestCase):
+    def test_workload_is_reproducible(self):
+        """Check that the same parameters generate the same transfers."""
+        a = Workload(accounts=50, transactions=200, distribution="zipf", seed=3)
+        b = Workload(accounts=50, transactions=200, distribution="zipf", seed=3)
+        self.assertEqual(a.transfers, b.transfers)
+        self.assertTrue(all(f != t for f, t, amount in a.transfers))
+
+    def test_run_once_reports_metrics(self):
+        """Check that a small run settles every transfer and reports the metrics."""
+        workload = Workload(accounts=20, transactions=100, reject_ratio=0.2, decline_ratio=0.2)
+        result = run_once(workload, t_payment=2, timeout=30)
+
+        self.assertTrue(result["completed"])
+        self.assertEqual(result["settled"], 100)
+        self.assertEqual(sum(result["statuses"].values()), 100)
+        self.assertIn("rejected", result["statuses"])
+        self.assertIn("declined", result["statuses"])
+        self.assertLessEqual(result["latency_ms"]["p50"], result["latency_ms"]["p999"])
+        self.assertIn("queue_antifraud", result["queue_depth"])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 51)
+        self.assertEqual(percentile(values, 1.0), 100)
+        self.assertIsNone(percentile([], 0.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import unittest
+import cProfile
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+from src.profiler import WorkerProfiler, ProfilerException
+from src.payments_worker import PaymentsWorkers
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestWorkerProfiler(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def run_workers(self, profiler, count=3):
+        def worker():
+            for i in range(5):
+                with profiler.section("worker"):
+                    busy(0.01)
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_cprofile_merges_threads(self):
+        """Check that the per-thread profiles end up in one report and dump."""
+        profiler = WorkerProfiler("cprofile", os.path.join(self.folder, "out", "profile"))
+        profiler.start()
+        self.run_workers(profiler)
+        paths = profiler.finish()
+
+        self.assertEqual([os.path.basename(p) for p in paths], ["profile.txt", "profile.prof"])
+        self.assertEqual(len(profiler._profiles), 3)
+        with open(paths[0]) as f:
+            self.assertIn("busy", f.read())
+        stats = pstats.Stats(paths[1]).stats
+        calls = [value[1] for (file, line, name), value in stats.items() if name == "busy"]
+        self.assertEqual(calls, [15])
+
+    def test_cprofile_falls_back_to_sampling(self):
+        """Check that sections whose profiler cannot be enabled are sampled."""
+        class ActiveProfile(cProfile.Profile):
+            def enable(self, *args, **kwargs):
+                raise ValueError("Another profiling tool is already active")
+
+        profiler = WorkerProfiler("cprofile", os.path.join(self.folder, "profile"), interval=0.001)
+        profiler.start()
+        with mock.patch("src.profiler.cProfile.Profile", ActiveProfile):
+            self.run_workers(profiler)
+        paths = profiler.finish()
+
+        self.assertEqual([os.path.basename(p) for p in paths], ["profile.folded"])
+        with open(paths[0]) as f:
+            self.assertIn("busy_(test_profiler.py:", f.read())
+
+    def test_sampler_writes_collapsed_stacks(self):
+        """Check that samples of all threads are written as 'stack count' lines."""
+        profiler = WorkerProfiler("sample", os.path.join(self.folder, "profile"), interval=0.001)
+        profiler.start()
+        self.run_workers(profiler)
+        path, = profiler.finish()
+
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertTrue(stack.startswith("worker;"))
+        self.assertIn("busy_(test_profiler.py:", stack)
+        self.assertGreater(int(count), 0)
+
+    def test_finished_profiler_ignores_sections(self):
+        """Check that sections after finish() are not recorded and the mode is validated."""
+        profiler = WorkerProfiler("cprofile", os.path.join(self.folder, "profile"))
+        self.assertEqual(profiler.finish(), [])
+        with profiler.section("worker"):
+            busy(0.001)
+        self.assertEqual(profiler._profiles, [])
+
+        with self.assertRaises(ProfilerException):
+            WorkerProfiler("trace")
+
+
+class TestPaymentsWorkersProfiling(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.config = {
+            "transactions_log_file": os.path.join(self.folder, "transactions.log"),
+            "users_file": os.path.join(self.folder, "users.json"),
+            "data_folder": self.folder,
+            "hold_time": 0,
+            "profile_output": os.path.join(self.folder, "profile"),
+        }
+        self.user_credentials = {
+            "alice": {"id": 1, "balance": 100000, "verified": True, "password": "pass"},
+            "bob": {"id": 2, "balance": 100000, "verified": True, "password": "pass"},
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_runtime_toggle(self):
+        """Check that profiling can be switched on while workers run and is written on stop."""
+        p = PaymentsWorkers(self.config, self.user_credentials, t_payment=2, t_antifraud=1)
+        p.start()
+        p.submit(1, 2, 10)
+        p.enable_profiling("cprofile")
+        for i in range(20):
+            p.submit(1, 2, 10)
+        self.assertTrue(p.drain(timeout=5))
+
+        self.assertIsNone(p.profiler)
+        with open(os.path.join(self.folder, "profile.txt")) as f:
+            self.assertIn("process_batch", f.read())
+
+    def test_profile_mode_from_config(self):
+        """Check that config "profile_mode" turns the sampler on at start."""
+        self.config["profile_mode"] = "sample"
+        p = PaymentsWorkers(self.config, self.user_credentials, t_payment=1, t_antifraud=1)
+        p.start()
+        self.assertEqual(p.profiler.mode, "sample")
+        paths = p.disable_profiling()
+        self.assertEqual(paths, [os.path.join(self.folder, "profile.folded")])
+        self.assertIsNone(p.profiler)
+        p.stop()
@@ -0,0 +1,92 @@
+import unittest
+import os
+import shutil
+import tempfile
+from array import array
+from src.recovery import AccountSnapshot, SnapshotException
+from src.payments_worker import PaymentsWorkers
+from src.transaction_handle import wait_all
+
+
+class TestRecovery(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.config = {
+            "transactions_log_file": os.path.join(self.folder, "transactions.log"),
+            "users_file": os.path.join(self.folder, "users.json"),
+            "data_folder": self.folder,
+            "error_log_file": os.path.join(self.folder, "error.log"),
+            "hold_time": 0,
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def credentials(self):
+        return {
+            "alice": {"id": 1, "balance": 1000, "verified": True},
+            "bob": {"id": 2, "balance": 1000, "verified": True},
+        }
+
+    def test_snapshot_round_trip(self):
+        """Check that a snapshot returns the columns and marks it was written with."""
+        snapshot = AccountSnapshot(os.path.join(self.folder, "accounts.snap"))
+        self.assertIsNone(snapshot.read())
+
+        columns = (array("q", [5, 9]), ["alice", "bob"], array("q", [10, 20]), array("b", [1, 0]))
+        snapshot.write(columns, journal_seq=7, tx_high_water=42, log_records=3)
+        state = snapshot.read()
+        self.assertEqual(state["columns"], columns)
+        self.assertEqual((state["journal_seq"], state["tx_high_water"], state["log_records"]), (7, 42, 3))
+
+        with open(snapshot.path, "r+b") as f:
+            f.truncate(os.path.getsize(snapshot.path) - 4)
+        with self.assertRaises(SnapshotException):
+            snapshot.read()
+
+    def test_restart_uses_snapshot_journal_and_log_tail(self):
+        """Check that a restart restores balances and continues tx_ids without duplicates."""
+        p = PaymentsWorkers(self.config, self.credentials(), t_payment=1, t_antifraud=1)
+        p.start()
+        for _ in range(3):
+            p.submit(1, 2, 100)
+        self.assertTrue(p.drain(timeout=5))
+        self.assertEqual(p.tx_counter, 3)
+
+        p = PaymentsWorkers(self.config, self.credentials(), t_payment=1, t_antifraud=1)
+        self.assertIsNotNone(p.recovered)
+        self.assertEqual((p.accounts[1].balance, p.accounts[2].balance), (700, 1300))
+        self.assertEqual(p.tx_counter, 3)
+
+        # Transactions after the snapshot, then a crash (no stop, no checkpoint)
+        p.start()
+        wait_all([p.submit(2, 1, 50), p.submit(2, 1, 50)], timeout=5)
+        p.log_writer.flush()
+
+        restarted = PaymentsWorkers(self.config, self.credentials(), t_payment=1, t_antifraud=1)
+        self.assertEqual((restarted.accounts[1].balance, restarted.accounts[2].balance), (800, 1200))
+        self.assertEqual(restarted.tx_counter, 5)
+        p.stop()
+        restarted.log_writer.close()
+        restarted.transactions_log.close()
+
+    def test_restart_continues_after_journaled_tx_ids(self):
+        """Check that tx_ids settled in the journal but lost from the log are not issued again."""
+        p = PaymentsWorkers(self.config, self.credentials(), t_payment=1, t_antifraud=1)
+        p.log_writer.write = lambda entry: None
+        p.start()
+        wait_all([p.submit(1, 2, 100) for _ in range(3)], timeout=5)
+        p.idempotency.put("lost", 7)
+        p.idempotency.flush()
+
+        restarted = PaymentsWorkers(self.config, self.credentials(), t_payment=1, t_antifraud=1)
+        self.assertEqual(restarted.transactions_log.max_tx_id(), 0)
+        self.assertEqual(restarted.journal.max_tx_id, 3)
+        self.assertEqual(restarted.tx_counter, 7)
+        p.stop()
+        restarted.log_writer.close()
+        restarted.transactions_log.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
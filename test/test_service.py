@@ -0,0 +1,73 @@
+import unittest
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import service
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestService(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.config = {
+            "users_file": os.path.join(self.folder, "data", "users.json"),
+            "transactions_log_file": os.path.join(self.folder, "logs", "transactions.log"),
+            "error_log_file": os.path.join(self.folder, "logs", "error.log"),
+            "data_folder": os.path.join(self.folder, "data"),
+            "hold_time": 0,
+        }
+        self.config_file = os.path.join(self.folder, "config.json")
+        with open(self.config_file, "w") as f:
+            json.dump(self.config, f)
+        os.makedirs(self.config["data_folder"])
+        with open(self.config["users_file"], "w") as f:
+            json.dump({
+                "alice": {"id": 1, "balance": 1000, "verified": True, "password": "x"},
+                "bob": {"id": 2, "balance": 1000, "verified": True, "password": "x"},
+            }, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_build_engine_from_command_line(self):
+        """Check that thread counts and queue sizes come from the command line."""
+        args = service.parse_args(["--config", self.config_file, "--t-payment", "3", "--t-antifraud", "1",
+                                   "--queue-size", "50", "--max-delayed", "70", "--batch-size", "8"])
+        p = service.build_engine(service.load_config(args.config), args)
+        self.assertEqual((p.t_payment, p.t_antifraud, p.batch_size), (3, 1, 8))
+        self.assertEqual((p.queue_payment.maxsize, p.scheduler.max_pending), (50, 70))
+        self.assertEqual(len(p.accounts), 2)
+        self.assertTrue(os.path.isdir(os.path.join(self.folder, "logs")))
+        p.stop()
+
+    def test_headless_server_process(self):
+        """Check that the service runs without tkinter, serves JSON lines and drains on SIGTERM."""
+        code = ("import sys, service; service.main(sys.argv[1:]); "
+                "print('tkinter loaded' if 'tkinter' in sys.modules else 'no tkinter')")
+        proc = subprocess.Popen([sys.executable, "-c", code, "--config", self.config_file, "--port", "0"],
+                                cwd=ROOT, stdout=subprocess.PIPE, text=True)
+        try:
+            self.assertIn("Payments engine ready", proc.stdout.readline())
+            address = proc.stdout.readline().strip().rsplit(" ", 1)[1]
+            host, port = address.rsplit(":", 1)
+
+            with socket.create_connection((host, int(port)), timeout=5) as conn:
+                conn.sendall(b'{"op": "submit", "from": 1, "to": 2, "amount": 300, "id": 1}\n')
+                reader = conn.makefile()
+                lines = reader.readline(), reader.readline()
+            self.assertEqual([json.loads(line)["status"] for line in lines], ["accepted", "approved"])
+
+            proc.send_signal(signal.SIGTERM)
+            out, _ = proc.communicate(timeout=10)
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+        self.assertEqual(proc.returncode, 0)
+        self.assertIn("Payments engine stopped", out)
+        self.assertIn("no tkinter", out)
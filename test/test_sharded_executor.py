@@ -0,0 +1,89 @@
+import unittest
+import json
+import os
+import time
+from src.payments_worker import PaymentsWorkers
+from src.transaction_handle import wait_all
+
+
+class TestShardedExecutor(unittest.TestCase):
+    def setUp(self):
+        self.config = {
+            "transactions_log_file": "test_sharded_transactions.log",
+            "users_file": "test_sharded_users.json",
+        }
+        self.user_credentials = {
+            f"User{i}": {"id": i, "balance": 1000, "verified": True} for i in range(1, 5)
+        }
+        self.p = PaymentsWorkers(self.config, self.user_credentials, hold_time=0, shards=2)
+        self.p.start()
+
+    def tearDown(self):
+        self.p.stop()
+        for path in (self.config["transactions_log_file"], self.config["users_file"],
+                     self.config["users_file"] + ".journal", self.config["transactions_log_file"] + ".idx",
+                     self.config["users_file"] + ".snap"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_same_and_cross_shard_transfers(self):
+        """Check that same-shard and cross-shard transfers settle and keep the total."""
+        self.assertEqual(self.p.executor.shard_of(1), self.p.executor.shard_of(3))
+        self.assertNotEqual(self.p.executor.shard_of(1), self.p.executor.shard_of(2))
+
+        handles = [self.p.submit(1, 3, 100), self.p.submit(1, 2, 200), self.p.submit(4, 1, 5000)]
+
+        self.assertEqual([r["status"] for r in wait_all(handles, timeout=5)], ["approved", "approved", "declined"])
+        self.assertEqual(self.p.accounts[1].balance, 700)
+        self.assertEqual(self.p.accounts[2].balance, 1200)
+        self.assertEqual(self.p.accounts[3].balance, 1100)
+        self.assertEqual(self.p.accounts[4].balance, 1000)
+        statuses = sorted(e["status"] for e in self.p.transactions_log if e["status"] != "pending")
+        self.assertEqual(statuses, ["approved", "approved", "declined"])
+
+    def test_many_cross_shard_transfers(self):
+        """Check that concurrent transfers between all shards conserve the total balance."""
+        handles = [self.p.submit(i % 4 + 1, (i + 1) % 4 + 1, 7) for i in range(200)]
+
+        totals = set()
+        while not all(h.done() for h in handles):
+            totals.add(self.p.balance_snapshot().total())
+        wait_all(handles, timeout=5)
+        self.assertEqual(sum(acc.balance for acc in self.p.accounts.values()), 4000)
+        self.assertEqual(totals | {self.p.balance_snapshot().total()}, {4000})
+        self.assertEqual(self.p.balance_snapshot().in_transit, 0)
+
+    def test_failed_credit_is_refunded(self):
+        """Check that a cross-shard transfer whose credit fails gives the money back to the sender."""
+        credit = self.p.executor._credit
+
+        def failing_credit(tx):
+            if tx.to_acc == 2:
+                raise RuntimeError("credit failed")
+            credit(tx)
+
+        self.p.executor._credit = failing_credit
+        handle = self.p.submit(1, 2, 300)
+        self.assertEqual((handle.result(timeout=5)["status"], handle.reason), ("rejected", "internal_error"))
+        self.assertEqual((self.p.accounts[1].balance, self.p.accounts[2].balance), (1000, 1000))
+        snapshot = self.p.balance_snapshot()
+        self.assertEqual((snapshot.total(), snapshot.in_transit), (4000, 0))
+
+
+    def test_checkpoint_holds_cross_shard_transfers(self):
+        """Check that debits wait while the shards are held and settle in order afterwards."""
+        wait_all([self.p.submit(1, 2, 100)], timeout=5)
+        with self.p.executor.held():
+            handles = [self.p.submit(1, 2, 100), self.p.submit(1, 3, 100)]
+            time.sleep(0.1)
+            self.assertFalse(any(h.done() for h in handles))
+            self.assertEqual(self.p.accounts[1].balance, 900)
+        self.assertEqual([r["status"] for r in wait_all(handles, timeout=5)], ["approved", "approved"])
+        self.assertEqual(self.p.accounts[1].balance, 700)
+
+        self.p.checkpoint()
+        with open(self.config["users_file"]) as f:
+            self.assertEqual(sum(data["balance"] for data in json.load(f).values()), 4000)
+
+if __name__ == "__main__":
+    unittest.main()
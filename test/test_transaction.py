@@ -26,6 +26,13 @@ class TestTransaction(unittest.TestCase):
         with self.assertRaises(TransactionException):
             Transaction(tx_id=1, from_acc=5, to_acc=5, amount=50)
 
+    def test_priority(self):
+        """Check the default priority and that priorities outside 1-5 are refused."""
+        self.assertEqual(Transaction(tx_id=1, from_acc=1, to_acc=2, amount=5).priority, Transaction.PRIORITY_DEFAULT)
+        self.assertEqual(Transaction(tx_id=1, from_acc=1, to_acc=2, amount=5, priority=1).priority, 1)
+        with self.assertRaises(TransactionException):
+            Transaction(tx_id=1, from_acc=1, to_acc=2, amount=5, priority=0)
+
     def test_string_representation(self):
         """Check that __str__ method returns a descriptive string of the transaction."""
         tx = Transaction(tx_id=99, from_acc=1, to_acc=2, amount=150)
@@ -43,6 +50,18 @@ class TestTransaction(unittest.TestCase):
         self.assertFalse(tx.ok)
         self.assertEqual(tx.reason, "fraud_detected")
 
+    def test_settle_updates_log_entry_in_place(self):
+        """Check that the pending log entry is built once and settle() turns it into the final entry."""
+        tx = Transaction(tx_id=7, from_acc=1, to_acc=2, amount=100)
+        pending = tx.log_entry()
+        self.assertEqual((pending["status"], pending["reason"]), ("pending", "processing"))
+        self.assertIs(tx.log_entry(), pending)
+
+        entry = tx.settle("declined", "insufficient_funds")
+        self.assertIs(entry, pending)
+        self.assertEqual((entry["tx_id"], entry["status"], entry["reason"]), (7, "declined", "insufficient_funds"))
+        self.assertFalse(hasattr(tx, "__dict__"))
+
 
 if __name__ == "__main__":
     unittest.main()
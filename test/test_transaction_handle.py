@@ -0,0 +1,36 @@
+import unittest
+import threading
+from concurrent.futures import TimeoutError
+from src.transaction_handle import TransactionHandle, wait_all
+
+
+class TestTransactionHandle(unittest.TestCase):
+
+    def test_callbacks_and_status(self):
+        """Check that callbacks get the completed handle and status/reason follow the result."""
+        handle = TransactionHandle(7)
+        seen = []
+        handle.add_done_callback(lambda h: seen.append(h.status))
+        self.assertEqual((handle.status, handle.reason), ("pending", None))
+        self.assertFalse(handle.cancel())
+
+        handle.set_result({"tx_id": 7, "status": "declined", "reason": "insufficient_funds"})
+        self.assertEqual(seen, ["declined"])
+        self.assertEqual(handle.reason, "insufficient_funds")
+
+        handle.add_done_callback(lambda h: seen.append(h.tx_id))
+        self.assertEqual(seen, ["declined", 7])
+
+    def test_wait_all(self):
+        """Check that wait_all returns results in order and raises on timeout."""
+        handles = [TransactionHandle(i) for i in range(3)]
+        for handle in handles[:2]:
+            handle.set_result({"tx_id": handle.tx_id, "status": "approved", "reason": "completed"})
+        with self.assertRaises(TimeoutError):
+            wait_all(handles, timeout=0.01)
+
+        timer = threading.Timer(0.01, handles[2].set_result, [{"tx_id": 2, "status": "rejected", "reason": "x"}])
+        timer.start()
+        results = wait_all(handles, timeout=5)
+        self.assertEqual([r["tx_id"] for r in results], [0, 1, 2])
+        self.assertEqual(results[2]["status"], "rejected")
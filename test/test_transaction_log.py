@@ -0,0 +1,236 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import threading
+from src.transaction_log import TransactionLog
+from src.log_writer import LogWriter
+from src.log_segments import Segment, write_manifest
+
+
+class TestTransactionLog(unittest.TestCase):
+    def setUp(self):
+        self.path = "test_tx_log.log"
+        self.log = TransactionLog(self.path, window=3)
+        self.writer = LogWriter(self.path, on_written=self.log.index_batch)
+
+    def tearDown(self):
+        self.writer.close()
+        self.log.close()
+        for path in (self.path, self.path + ".idx"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def write(self, count):
+        for i in range(1, count + 1):
+            entry = {"timestamp": f"2025-01-01 00:00:{i:02d}", "tx_id": i, "from": 1, "to": 2 + i % 2,
+                     "amount": i, "status": "approved", "reason": "completed"}
+            self.log.append(entry)
+            self.writer.write(entry)
+        self.writer.flush()
+
+    def test_window_is_bounded(self):
+        """Check that only the newest entries are kept in memory."""
+        self.write(10)
+        self.assertEqual([e["tx_id"] for e in self.log], [8, 9, 10])
+        self.assertEqual(len(self.log), 3)
+
+    def test_window_counts_each_entry_once(self):
+        """Check that an entry appended again is counted and iterated once, at its newest position."""
+        a, b, c = ({"tx_id": i, "from": 1, "to": 2} for i in range(3))
+        self.log.extend([a, b, a])
+        self.assertEqual((len(self.log), [e["tx_id"] for e in self.log]), (2, [1, 0]))
+        self.assertEqual(self.log.changes_since(2), ([a], 3, True))
+
+        self.log.extend([c, b])
+        self.assertEqual((len(self.log), [e["tx_id"] for e in self.log]), (3, [0, 2, 1]))
+        self.log.extend([c, c, c])
+        self.assertEqual((len(self.log), [e["tx_id"] for e in self.log]), (1, [2]))
+
+    def test_iteration_during_appends(self):
+        """Check that iterating the window while another thread appends sees whole snapshots."""
+        log = TransactionLog(self.path, window=100)
+        done = threading.Event()
+
+        def append():
+            for i in range(20000):
+                log.append({"tx_id": i, "from": 1, "to": 2})
+            done.set()
+
+        thread = threading.Thread(target=append)
+        thread.start()
+        while not done.is_set():
+            ids = [e["tx_id"] for e in log]
+            self.assertEqual(ids, list(range(ids[0], ids[0] + len(ids))) if ids else [])
+        thread.join()
+        self.assertEqual(len(log), 100)
+        log.close()
+
+    def test_old_entries_read_from_disk(self):
+        """Check that entries outside the window can be found through the index."""
+        self.write(10)
+        self.assertEqual(self.log.get(2)[0]["amount"], 2)
+        self.assertEqual(self.log.get(99), [])
+        self.assertEqual([e["tx_id"] for e in self.log.scan()], list(range(1, 11)))
+
+    def test_load_indexes_only_the_tail(self):
+        """Check that load() indexes lines appended without the index and fills the window."""
+        self.write(5)
+        self.writer.close()
+        with open(self.path, "a") as f:
+            f.write('{"tx_id": 6, "from": 2, "to": 1, "amount": 6, "status": "approved", "reason": "completed"}\n')
+
+        log = TransactionLog(self.path, window=3)
+        log.load()
+        self.assertEqual([e["tx_id"] for e in log], [4, 5, 6])
+        self.assertEqual(os.path.getsize(self.path + ".idx"), 6 * TransactionLog.INDEX_RECORD.size)
+        self.assertEqual(log.get(6)[0]["from"], 2)
+        log.close()
+
+    def test_load_rebuilds_stale_index(self):
+        """Check that an index pointing past the end of the log is rebuilt."""
+        self.write(5)
+        self.writer.close()
+        with open(self.path, "w") as f:
+            f.write('{"tx_id": 1, "from": 1, "to": 2, "amount": 1, "status": "approved", "reason": "completed"}\n')
+
+        log = TransactionLog(self.path, window=3)
+        log.load()
+        self.assertEqual([e["tx_id"] for e in log], [1])
+        log.close()
+
+    def test_history_per_account(self):
+        """Check that history returns only the account's entries, newest limit, oldest first."""
+        self.write(10)
+        self.assertEqual([e["tx_id"] for e in self.log.history(2, limit=3)], [6, 8, 10])
+        self.assertEqual([e["tx_id"] for e in self.log.history(3, limit=None)], [1, 3, 5, 7, 9])
+        self.assertEqual([e["tx_id"] for e in self.log.history(1, since="2025-01-01 00:00:08")], [8, 9, 10])
+        self.assertEqual(self.log.history(42), [])
+
+    def test_history_reads_older_entries_from_disk(self):
+        """Check that entries evicted from the per-account deque are read from disk."""
+        log = TransactionLog(self.path, window=3, history_window=2)
+        writer = LogWriter(self.path, on_written=log.index_batch)
+        for i in range(1, 6):
+            entry = {"timestamp": f"2025-01-01 00:00:{i:02d}", "tx_id": i, "from": 1, "to": 2,
+                     "amount": i, "status": "approved", "reason": "completed"}
+            log.append(entry)
+            writer.write(entry)
+        writer.close()
+
+        self.assertEqual([e["tx_id"] for e in log.history(1, limit=4)], [2, 3, 4, 5])
+        log.close()
+
+
+class TestSegmentedLog(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "transactions.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def open(self, **kwargs):
+        log = TransactionLog(self.path, window=3, history_window=1, segment_bytes=400, **kwargs)
+        writer = LogWriter(self.path, on_written=log.index_batch, should_roll=log.should_roll, on_roll=log.roll)
+        return log, writer
+
+    def write(self, log, writer, entries):
+        for entry in entries:
+            entry = dict({"timestamp": "2025-01-01 00:00:00", "from": 1, "to": 2, "amount": 1,
+                          "status": "approved", "reason": "completed"}, **entry)
+            log.append(entry)
+            writer.write(entry)
+            writer.flush()
+
+    def test_rolls_and_compresses_segments(self):
+        """Check that full files become gzipped segments that reads still reach."""
+        log, writer = self.open()
+        self.write(log, writer, [{"tx_id": i, "to": 2 + i % 2} for i in range(1, 13)])
+        writer.close()
+        log.close()
+
+        with open(self.path + ".manifest") as f:
+            segments = json.load(f)["segments"]
+        self.assertGreaterEqual(len(segments), 2)
+        for info in segments:
+            self.assertTrue(info["compressed"])
+            self.assertTrue(os.path.exists(os.path.join(self.folder, info["name"] + ".gz")))
+            self.assertFalse(os.path.exists(os.path.join(self.folder, info["name"])))
+        self.assertEqual((segments[0]["tx_min"], segments[0]["first_offset"]), (1, 0))
+
+        log = TransactionLog(self.path, window=3, history_window=1)
+        log.load()
+        self.assertEqual([e["tx_id"] for e in log], [10, 11, 12])
+        self.assertEqual(log.indexed_count(), 12)
+        self.assertEqual([e["tx_id"] for e in log.scan()], list(range(1, 13)))
+        self.assertEqual(log.get(2)[0]["to"], 2)
+        self.assertEqual([e["tx_id"] for e in log.history(3, limit=None)], [1, 3, 5, 7, 9, 11])
+        self.assertEqual(log.max_tx_id(), 12)
+        self.assertEqual(log.max_tx_id(11), 12)
+        self.assertEqual([e["tx_id"] for e in log.page(6, 2)[0]], [5, 6])
+        log.close()
+
+    def test_compacts_pending_and_skips_segments(self):
+        """Check that superseded pending entries are dropped and bloom filters skip segments."""
+        log, writer = self.open(compress=False)
+        self.write(log, writer, [{"tx_id": 1, "status": "pending", "reason": None},
+                                 {"tx_id": 2, "status": "pending", "reason": None},
+                                 {"tx_id": 1}, {"tx_id": 3, "from": 7, "to": 8}])
+        self.write(log, writer, [{"tx_id": i, "from": 4, "to": 5} for i in range(4, 10)])
+        writer.close()
+        log.close()
+
+        first = log.segments[0]
+        self.assertTrue(first.info["compacted"])
+        self.assertFalse(first.info["compressed"])
+        self.assertEqual([e["status"] for e in log.get(1)], ["approved"])
+        self.assertEqual([e["status"] for e in log.get(2)], ["pending"])
+        self.assertEqual(log.indexed_count(), 10)
+        self.assertEqual([e["tx_id"] for e in log.history(7, limit=None)], [3])
+        self.assertFalse(first.holds_account(4))
+        self.assertFalse(any(s.holds_account(42) for s in log.segments))
+        log.close()
+
+    def test_compressed_segment_is_read_per_member(self):
+        """Check that a read decompresses only the gzip member holding the entry."""
+        block_bytes = Segment.BLOCK_BYTES
+        Segment.BLOCK_BYTES = 100
+        try:
+            log, writer = self.open()
+            self.write(log, writer, [{"tx_id": i} for i in range(1, 9)])
+            writer.close()
+            log.close()
+        finally:
+            Segment.BLOCK_BYTES = block_bytes
+
+        first = log.segments[0]
+        self.assertGreater(len(first.info["blocks"]), 1)
+        self.assertEqual([e["tx_id"] for e in log.scan()], list(range(1, 9)))
+        self.assertLess(len(first._block[1]), first.info["bytes"])
+        log.close()
+
+    def test_load_finishes_or_drops_interrupted_seal(self):
+        """Check that load() renames the files of a seal saved in the manifest and drops the others."""
+        log, writer = self.open(compress=False)
+        self.write(log, writer, [{"tx_id": i} for i in range(1, 13)])
+        writer.close()
+        log.close()
+        first, second = log.segments[:2]
+
+        first.info, files = first.seal(True)
+        write_manifest(self.path + ".manifest", log.segments)
+        second.seal(True)
+
+        log = TransactionLog(self.path, window=3, compress=False)
+        log.load()
+        self.assertTrue(os.path.exists(first.path + ".gz"))
+        self.assertFalse(os.path.exists(first.path))
+        self.assertFalse(os.path.exists(second.path + ".gz.tmp"))
+        self.assertEqual([e["tx_id"] for e in log.scan()], list(range(1, 13)))
+        log.close()
+
+
+if __name__ == "__main__":
+    unittest.main()